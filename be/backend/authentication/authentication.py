@@ -0,0 +1,58 @@
+from django.contrib.auth import get_user_model
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication, get_authorization_header
+from rest_framework.authtoken.models import Token
+from files import metrics
+from .token_cache import token_cache
+
+User = get_user_model()
+
+USER_FIELDS = [field.attname for field in User._meta.concrete_fields]
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication that remembers which user a token belongs to, so a
+    cache hit authenticates a request without the Token/User query.
+    Misses fall through to the database.
+
+    Accepts both "Token <key>" (DRF's keyword) and "Bearer <key>", which
+    is what the web client sends.
+    """
+    keywords = ('Token', 'Bearer')
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if not auth:
+            return None
+        for keyword in self.keywords:
+            if auth[0].lower() == keyword.lower().encode():
+                # Authenticators are created per request, so this is not shared
+                self.keyword = keyword
+                return super().authenticate(request)
+        return None
+
+    def authenticate_credentials(self, key):
+        cached = token_cache.get(key)
+        if cached is not None:
+            metrics.incr('auth.token_cache.hit')
+            metrics.incr('auth.queries_saved')
+            user_values, token_created = cached
+            user = User.from_db(User.objects.db, USER_FIELDS, user_values)
+            if not user.is_active:
+                raise exceptions.AuthenticationFailed('User inactive or deleted.')
+            token = Token.from_db(Token.objects.db, ['key', 'user_id', 'created'],
+                                  [key, user.pk, token_created])
+            token.user = user
+            return user, token
+
+        metrics.incr('auth.token_cache.miss')
+        generation = token_cache.generation
+        user, token = super().authenticate_credentials(key)
+        token_cache.set(
+            key,
+            user.pk,
+            ([getattr(user, name) for name in USER_FIELDS], token.created),
+            generation
+        )
+        return user, token
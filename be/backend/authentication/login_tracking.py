@@ -0,0 +1,64 @@
+import atexit
+import threading
+import time
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+from files import metrics
+from .models import User, UserProfile
+
+
+class LoginTracker:
+    """
+    Collects last_login / last_login_ip per user and writes them in bulk
+    every LOGIN_TRACKING_FLUSH_SECONDS, off the login request path.
+
+    Repeated logins of one user between flushes cost a single write. Pending
+    values live only in memory, so a crash loses at most one interval of
+    them.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._thread = None
+
+    def record(self, user, ip_address):
+        with self._lock:
+            self._pending[user.pk] = (timezone.now(), ip_address)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='login-tracker', daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        try:
+            close_old_connections()
+            with metrics.timed('auth.login_tracking.flush'):
+                # Plain bulk writes: no User post_save, so cached tokens stay valid
+                User.objects.bulk_update(
+                    [User(pk=user_id, last_login=logged_in_at) for user_id, (logged_in_at, _) in pending.items()],
+                    ['last_login']
+                )
+                UserProfile.objects.bulk_create(
+                    [UserProfile(user_id=user_id, last_login_ip=ip) for user_id, (_, ip) in pending.items()],
+                    update_conflicts=True,
+                    unique_fields=['user'],
+                    update_fields=['last_login_ip']
+                )
+            metrics.incr('auth.login_tracking.written', len(pending))
+        except Exception as e:
+            metrics.incr('auth.login_tracking.errors')
+            print(f"Failed to record {len(pending)} logins: {e}")
+
+    def _run(self):
+        while True:
+            time.sleep(settings.LOGIN_TRACKING_FLUSH_SECONDS)
+            self.flush()
+
+
+login_tracker = LoginTracker()
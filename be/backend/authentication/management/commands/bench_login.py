@@ -0,0 +1,84 @@
+import json
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.test import Client, override_settings
+from rest_framework.authtoken.models import Token
+from authentication.login_tracking import login_tracker
+from authentication.models import User
+
+BENCH_PASSWORD = 'bench-password-123'
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure POST /api/login/ latency under concurrent load for one or more '
+        'PBKDF2 iteration counts. Benchmark users are created and removed again.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=400, help='Logins per configuration')
+        parser.add_argument('--concurrency', type=int, default=8, help='Client threads')
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument(
+            '--iterations', type=int, nargs='+', default=[600000, 100000],
+            help='PASSWORD_PBKDF2_ITERATIONS values to compare'
+        )
+        parser.add_argument(
+            '--rate-limit', action='store_true',
+            help='Keep the login rate limiter on (it rejects most of a benchmark burst)'
+        )
+
+    def login(self, index):
+        client = Client(REMOTE_ADDR=f"10.0.{index // 250 % 250}.{index % 250 + 1}")
+        body = json.dumps({'username': f"bench-login-{index % self.user_count:04d}",
+                           'password': BENCH_PASSWORD})
+        start = time.perf_counter()
+        response = client.post('/api/login/', body, content_type='application/json')
+        elapsed = time.perf_counter() - start
+        close_old_connections()
+        return elapsed, response.status_code
+
+    def handle(self, *args, **options):
+        self.user_count = max(options['users'], 1)
+        usernames = [f"bench-login-{i:04d}" for i in range(self.user_count)]
+        self.stdout.write(f"{options['requests']} logins per run, {options['concurrency']} threads, "
+                          f"{self.user_count} users")
+        self.stdout.write(f"{'iterations':>10} {'req/s':>8} {'p50':>9} {'p95':>9} {'p99':>9} {'errors':>7}")
+
+        try:
+            for iterations in options['iterations']:
+                with override_settings(PASSWORD_PBKDF2_ITERATIONS=iterations,
+                                       LOGIN_RATE_LIMIT_ENABLED=options['rate_limit']):
+                    # One hash shared by all bench users, made with this work factor
+                    User.objects.filter(username__in=usernames).delete()
+                    password = make_password(BENCH_PASSWORD)
+                    User.objects.bulk_create([
+                        User(username=name, password=password, role='Employee') for name in usernames
+                    ])
+
+                    started = time.perf_counter()
+                    with ThreadPoolExecutor(max_workers=max(options['concurrency'], 1)) as pool:
+                        results = list(pool.map(self.login, range(options['requests'])))
+                    wall = time.perf_counter() - started
+                    login_tracker.flush()
+
+                latencies = [elapsed for elapsed, _ in results]
+                errors = sum(1 for _, code in results if code != 200)
+                self.stdout.write(
+                    f"{iterations:>10} {len(results) / wall:>8.1f} "
+                    f"{statistics.median(latencies) * 1000:>7.1f}ms "
+                    f"{percentile(latencies, 95) * 1000:>7.1f}ms "
+                    f"{percentile(latencies, 99) * 1000:>7.1f}ms {errors:>7}"
+                )
+        finally:
+            Token.objects.filter(user__username__in=usernames).delete()
+            User.objects.filter(username__in=usernames).delete()
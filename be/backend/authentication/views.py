@@ -1,49 +1,84 @@
+import math
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
-from django.contrib.auth import login, logout
+from rest_framework.authtoken.models import Token
+from django.conf import settings
+from django.contrib.auth import logout
 from django.views.decorators.csrf import csrf_exempt
-from django.utils.decorators import method_decorator
+from files import metrics
+from .login_tracking import login_tracker
+from .ratelimit import login_limiter
 from .serializers import LoginSerializer, UserSerializer, UserProfileSerializer
 from .models import UserProfile
 
+def login_retry_after(request):
+    """
+    Seconds the client has to wait before another login attempt, or 0
+    """
+    if not settings.LOGIN_RATE_LIMIT_ENABLED:
+        return 0
+    username = str(request.data.get('username') or '').lower()
+    wait = login_limiter.acquire(f"ip:{request.META.get('REMOTE_ADDR')}",
+                                 settings.LOGIN_RATE_LIMIT_PER_IP, settings.LOGIN_RATE_LIMIT_PER_IP / 60)
+    if username:
+        wait = max(wait, login_limiter.acquire(f"user:{username}",
+                                               settings.LOGIN_RATE_LIMIT_PER_USER,
+                                               settings.LOGIN_RATE_LIMIT_PER_USER / 60))
+    return wait
+
 @api_view(['POST'])
 @permission_classes([AllowAny])
 @csrf_exempt
 def login_view(request):
     """
-    Authenticate user and create session
+    Authenticate user and return an API token
     """
-    serializer = LoginSerializer(data=request.data)
-    if serializer.is_valid():
-        user = serializer.validated_data['user']
-        login(request, user)
-        
-        # Update last login IP
-        profile, created = UserProfile.objects.get_or_create(user=user)
-        profile.last_login_ip = request.META.get('REMOTE_ADDR')
-        profile.save()
-        
-        user_data = UserSerializer(user).data
+    with metrics.timed('auth.login'):
+        retry_after = login_retry_after(request)
+        if retry_after:
+            metrics.incr('auth.login.rate_limited')
+            response = Response({
+                'success': False,
+                'message': 'Too many login attempts, try again later'
+            }, status=status.HTTP_429_TOO_MANY_REQUESTS)
+            response['Retry-After'] = str(math.ceil(retry_after))
+            return response
+
+        serializer = LoginSerializer(data=request.data)
+        if serializer.is_valid():
+            user = serializer.validated_data['user']
+            token, created = Token.objects.get_or_create(user=user)
+
+            # last_login and last_login_ip are written in the background
+            login_tracker.record(user, request.META.get('REMOTE_ADDR'))
+
+            user_data = UserSerializer(user).data
+            return Response({
+                'success': True,
+                'message': 'Login successful',
+                'token': token.key,
+                'user_id': user.id,
+                'username': user.username,
+                'role': user.role,
+                'user': user_data
+            }, status=status.HTTP_200_OK)
+
+        metrics.incr('auth.login.failed')
         return Response({
-            'success': True,
-            'message': 'Login successful',
-            'user': user_data
-        }, status=status.HTTP_200_OK)
-    
-    return Response({
-        'success': False,
-        'message': 'Invalid credentials',
-        'errors': serializer.errors
-    }, status=status.HTTP_401_UNAUTHORIZED)
+            'success': False,
+            'message': 'Invalid credentials',
+            'errors': serializer.errors
+        }, status=status.HTTP_401_UNAUTHORIZED)
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def logout_view(request):
     """
-    Logout user and destroy session
+    Delete the user's API token and end any session
     """
+    Token.objects.filter(user=request.user).delete()
     logout(request)
     return Response({
         'success': True,
@@ -57,8 +92,8 @@ def user_profile_view(request):
     Get current user profile and role
     """
     user = request.user
-    profile, created = UserProfile.objects.get_or_create(user=user)
-    
+    profile = UserProfile.objects.filter(user=user).first() or UserProfile(user=user)
+
     serializer = UserProfileSerializer(profile)
     return Response({
         'success': True,
@@ -73,5 +108,8 @@ def check_auth_view(request):
     """
     return Response({
         'authenticated': True,
+        'user_id': request.user.id,
+        'username': request.user.username,
+        'role': request.user.role,
         'user': UserSerializer(request.user).data
-    }, status=status.HTTP_200_OK)
\ No newline at end of file
+    }, status=status.HTTP_200_OK)
@@ -0,0 +1,108 @@
+import datetime
+import gzip
+import json
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+from .models import FileAccess, FileAccessDailyRollup
+
+ROLLUP_FIELDS = ['count', 'failure_count']
+
+
+def day_start(day):
+    """
+    Aware datetime for the first instant of a calendar day
+    """
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+
+def retention_cutoff(days):
+    """
+    Start of the oldest day that is kept; always on a day boundary so a day
+    is never half rolled up and half pruned
+    """
+    return day_start(timezone.localdate() - datetime.timedelta(days=days))
+
+
+def rollup_day(day, batch_size=1000):
+    """
+    Recompute the rollup rows of one day from the raw events; returns the
+    number of (user, file, action) groups written
+    """
+    groups = (
+        FileAccess.objects
+        .filter(timestamp__gte=day_start(day), timestamp__lt=day_start(day + datetime.timedelta(days=1)))
+        .order_by()
+        .values('user_id', 'filename', 'action')
+        .annotate(total=Count('id'), failures=Count('id', filter=Q(success=False)))
+    )
+    rows = [
+        FileAccessDailyRollup(
+            day=day,
+            user_id=group['user_id'],
+            filename=group['filename'],
+            action=group['action'],
+            count=group['total'],
+            failure_count=group['failures']
+        )
+        for group in groups
+    ]
+    if rows:
+        FileAccessDailyRollup.objects.bulk_create(
+            rows,
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=['day', 'user', 'filename', 'action'],
+            update_fields=ROLLUP_FIELDS
+        )
+    return len(rows)
+
+
+def rollup_range(first_day, last_day, batch_size=1000):
+    """
+    Roll up every day from first_day to last_day inclusive, one day at a time
+    """
+    written = 0
+    day = first_day
+    while day <= last_day:
+        written += rollup_day(day, batch_size=batch_size)
+        day += datetime.timedelta(days=1)
+    return written
+
+
+def oldest_event_day():
+    first = FileAccess.objects.order_by('timestamp').values_list('timestamp', flat=True).first()
+    return timezone.localtime(first).date() if first else None
+
+
+def prune_events(cutoff, batch_size=5000, archive_path=None, dry_run=False):
+    """
+    Delete events older than cutoff in batches of at most batch_size rows,
+    each in its own short transaction. With archive_path, every batch is
+    appended to a gzipped JSON-lines file before it is deleted.
+    Returns the number of events removed (or that would be removed).
+    """
+    old_events = FileAccess.objects.filter(timestamp__lt=cutoff)
+    if dry_run:
+        return old_events.count()
+
+    archive = gzip.open(archive_path, 'at', encoding='utf-8') if archive_path else None
+    removed = 0
+    try:
+        while True:
+            ids = list(old_events.order_by('timestamp').values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            if archive is not None:
+                rows = FileAccess.objects.filter(id__in=ids).order_by('id').values(
+                    'id', 'event_id', 'user_id', 'filename', 'action', 'timestamp', 'ip_address', 'success'
+                )
+                for row in rows:
+                    archive.write(json.dumps(row, default=str, separators=(',', ':')) + '\n')
+                archive.flush()
+            with transaction.atomic():
+                removed += FileAccess.objects.filter(id__in=ids).delete()[0]
+    finally:
+        if archive is not None:
+            archive.close()
+    return removed
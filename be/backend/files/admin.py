@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import FileAccess, FileMetadata
+from .models import ContentBlob, DownloadJob, FileAccess, FileAccessDailyRollup, FileMetadata
 
 @admin.register(FileMetadata)
 class FileMetadataAdmin(admin.ModelAdmin):
@@ -16,4 +16,30 @@ class FileAccessAdmin(admin.ModelAdmin):
     readonly_fields = ['timestamp']
     
     def get_queryset(self, request):
-        return super().get_queryset(request).select_related('user')
\ No newline at end of file
+        return super().get_queryset(request).select_related('user')
+
+@admin.register(FileAccessDailyRollup)
+class FileAccessDailyRollupAdmin(admin.ModelAdmin):
+    list_display = ['day', 'user', 'filename', 'action', 'count', 'failure_count']
+    list_filter = ['action', 'day']
+    search_fields = ['user__username', 'filename']
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('user')
+
+@admin.register(DownloadJob)
+class DownloadJobAdmin(admin.ModelAdmin):
+    list_display = ['file', 'status', 'source', 'attempts', 'bytes_done', 'total_bytes', 'created_at', 'finished_at']
+    list_filter = ['status', 'source', 'created_at']
+    search_fields = ['file__filename']
+    readonly_fields = ['created_at', 'updated_at', 'started_at', 'finished_at']
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('file')
+
+@admin.register(ContentBlob)
+class ContentBlobAdmin(admin.ModelAdmin):
+    list_display = ['digest', 'size', 'ref_count', 'created_at', 'released_at']
+    list_filter = ['created_at']
+    search_fields = ['digest', 'md5']
+    readonly_fields = ['digest', 'size', 'md5', 'ref_count', 'created_at', 'released_at']
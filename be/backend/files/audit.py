@@ -0,0 +1,267 @@
+import atexit
+import glob
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from . import metrics
+from .models import FileAccess
+
+try:
+    import fcntl
+except ImportError:  # Windows: orphaned spools of other processes are not replayed
+    fcntl = None
+
+WRITE_RETRIES = 3
+
+
+def _to_model(event):
+    return FileAccess(
+        event_id=uuid.UUID(event['event_id']),
+        user_id=event['user_id'],
+        user_role=event.get('user_role', ''),
+        filename=event['filename'],
+        action=event['action'],
+        ip_address=event['ip_address'],
+        success=event['success'],
+        timestamp=parse_datetime(event['timestamp'])
+    )
+
+
+class AuditLogWriter:
+    """
+    Asynchronous, batched FileAccess writer.
+
+    log() appends the event to this process's append-only spool file and
+    puts it on a bounded queue; a background thread writes queued events
+    with bulk_create every AUDIT_BATCH_SIZE events or AUDIT_FLUSH_INTERVAL_MS.
+    The spool is truncated once everything in it is committed, and spools
+    left behind by crashed processes are replayed on startup. A batch that
+    still fails after its retries is moved to a dead-letter file, replayed
+    the same way, so it does not hold the spool back. Each event carries a
+    unique event_id, so replays never create duplicates.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._spool_lock = threading.Lock()
+        self._started = False
+        self._queue = None
+        self._spool = None
+        self._pending = 0
+
+    # ----------------------------------------------------------------
+    # Public API
+    # ----------------------------------------------------------------
+
+    def log(self, user, filename, action, ip_address=None, success=True):
+        if not settings.AUDIT_LOG_ASYNC:
+            FileAccess.objects.create(
+                user=user,
+                filename=filename,
+                action=action,
+                ip_address=ip_address,
+                success=success
+            )
+            return
+
+        self._ensure_started()
+        event = {
+            'event_id': uuid.uuid4().hex,
+            'user_id': user.pk,
+            'user_role': getattr(user, 'role', '') or '',
+            'filename': filename,
+            'action': action,
+            'ip_address': ip_address,
+            'success': bool(success),
+            'timestamp': timezone.now().isoformat(),
+        }
+        self._append_to_spool(event)
+
+        try:
+            self._queue.put_nowait(event)
+            metrics.incr('audit.enqueued')
+        except queue.Full:
+            # Backpressure: write this event inline (one attempt, then the
+            # dead-letter file) rather than drop it
+            metrics.incr('audit.queue_full')
+            self._write_batch([event], inline=True)
+
+    def flush(self, timeout=5.0):
+        """
+        Wait until everything queued so far has been written
+        """
+        if not self._started:
+            return
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._spool_lock:
+                if self._pending == 0:
+                    return
+            time.sleep(0.01)
+
+    def queue_depth(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+    # ----------------------------------------------------------------
+    # Spool
+    # ----------------------------------------------------------------
+
+    def _spool_path(self):
+        return os.path.join(settings.AUDIT_SPOOL_DIR, f"audit-{os.getpid()}.jsonl")
+
+    def _append_to_spool(self, event):
+        line = json.dumps(event, separators=(',', ':')) + '\n'
+        with self._spool_lock:
+            self._spool.write(line)
+            self._spool.flush()
+            if settings.AUDIT_SPOOL_FSYNC:
+                os.fsync(self._spool.fileno())
+            self._pending += 1
+
+    def _dead_letter(self, events):
+        """
+        Set aside events that could not be written; the file appears
+        complete or not at all, and the next process to start replays it
+        """
+        name = f"audit-failed-{os.getpid()}-{uuid.uuid4().hex}.jsonl"
+        tmp_path = os.path.join(settings.AUDIT_SPOOL_DIR, f".{name}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for event in events:
+                f.write(json.dumps(event, separators=(',', ':')) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        path = os.path.join(settings.AUDIT_SPOOL_DIR, name)
+        os.replace(tmp_path, path)
+        return path
+
+    def _mark_done(self, count):
+        with self._spool_lock:
+            self._pending -= count
+            if self._pending == 0:
+                self._spool.seek(0)
+                self._spool.truncate()
+
+    def _replay_orphaned_spools(self):
+        """
+        Write events from spools whose owning process is gone
+        """
+        own_path = self._spool_path()
+        for path in glob.glob(os.path.join(settings.AUDIT_SPOOL_DIR, 'audit-*.jsonl')):
+            # A spool named after our own pid was left by an earlier process;
+            # dead-letter files are never written to again
+            if fcntl is None and path != own_path and not os.path.basename(path).startswith('audit-failed-'):
+                continue
+            with open(path, 'r+', encoding='utf-8') as spool:
+                if fcntl is not None:
+                    try:
+                        fcntl.flock(spool.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except BlockingIOError:
+                        continue  # still owned by a live process
+
+                events = []
+                for line in spool:
+                    try:
+                        events.append(json.loads(line))
+                    except ValueError:
+                        pass  # torn final line from a crash
+                for start in range(0, len(events), settings.AUDIT_BATCH_SIZE):
+                    batch = events[start:start + settings.AUDIT_BATCH_SIZE]
+                    FileAccess.objects.bulk_create([_to_model(e) for e in batch], ignore_conflicts=True)
+                metrics.incr('audit.replayed', len(events))
+            os.remove(path)
+
+    # ----------------------------------------------------------------
+    # Background flusher
+    # ----------------------------------------------------------------
+
+    def _ensure_started(self):
+        if self._started:
+            return
+        with self._lock:
+            if self._started:
+                return
+            os.makedirs(settings.AUDIT_SPOOL_DIR, exist_ok=True)
+            try:
+                self._replay_orphaned_spools()
+            except Exception as e:
+                print(f"Failed to replay audit spools: {e}")
+
+            self._spool = open(self._spool_path(), 'a', encoding='utf-8')
+            if fcntl is not None:
+                fcntl.flock(self._spool.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            self._queue = queue.Queue(maxsize=settings.AUDIT_QUEUE_SIZE)
+            metrics.register_gauge('audit.queue_depth', self.queue_depth)
+
+            thread = threading.Thread(target=self._run, name='audit-log-writer', daemon=True)
+            thread.start()
+            atexit.register(self.flush)
+            self._started = True
+
+    def _run(self):
+        interval = settings.AUDIT_FLUSH_INTERVAL_MS / 1000
+        batch_size = settings.AUDIT_BATCH_SIZE
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + interval
+            while len(batch) < batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._write_batch(batch)
+
+    def _write_batch(self, events, inline=False):
+        """
+        Insert a batch, retrying on the writer thread. Inline (on a request
+        thread) it is a single attempt inside a savepoint, leaving the
+        request's connection and any transaction it is in untouched.
+        """
+        attempts = 1 if inline else WRITE_RETRIES
+        for attempt in range(attempts):
+            try:
+                if not inline:
+                    close_old_connections()
+                with metrics.timed('audit.flush'), transaction.atomic():
+                    FileAccess.objects.bulk_create(
+                        [_to_model(event) for event in events],
+                        ignore_conflicts=True
+                    )
+                metrics.incr('audit.written', len(events))
+                self._mark_done(len(events))
+                return
+            except Exception as e:
+                metrics.incr('audit.write_errors')
+                print(f"Failed to write {len(events)} audit events (attempt {attempt + 1}): {e}")
+                if attempt + 1 < attempts:
+                    time.sleep(0.1 * (2 ** attempt))
+        metrics.incr('audit.dead_lettered', len(events))
+        try:
+            path = self._dead_letter(events)
+            print(f"Giving up on {len(events)} audit events; moved to {path}")
+        except OSError as e:
+            print(f"Dropping {len(events)} audit events, could not set them aside: {e}")
+        # No longer pending either way, so the spool can still be truncated
+        self._mark_done(len(events))
+
+
+audit_log = AuditLogWriter()
+
+
+def log_access(user, filename, action, ip_address=None, success=True):
+    """
+    Record a FileAccess event without blocking the request on a database write
+    """
+    try:
+        audit_log.log(user, filename, action, ip_address=ip_address, success=success)
+    except Exception as e:
+        print(f"Failed to log access: {e}")
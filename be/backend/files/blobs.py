@@ -0,0 +1,354 @@
+import hashlib
+import os
+import shutil
+import stat
+import tempfile
+import time
+from collections import Counter
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F
+from django.utils import timezone
+from . import metrics
+from .compression import open_local
+from .models import ContentBlob, FileMetadata
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def blob_path(digest):
+    return os.path.join(settings.BLOB_STORE_DIR, digest[:2], digest[2:4], digest)
+
+
+class HashingWriter:
+    """
+    File wrapper that computes SHA-256 and MD5 of everything written
+    through it, so a download is hashed while it streams to disk
+    """
+
+    def __init__(self, f):
+        self._f = f
+        self._sha256 = hashlib.sha256()
+        self._md5 = hashlib.md5()
+        self.size = 0
+
+    def write(self, data):
+        self._sha256.update(data)
+        self._md5.update(data)
+        self.size += len(data)
+        return self._f.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self._f, name)
+
+    @property
+    def digest(self):
+        return self._sha256.hexdigest()
+
+    @property
+    def md5(self):
+        return self._md5.hexdigest()
+
+
+def hash_file(path):
+    """
+    (sha256, md5, size) of the content of a file already on disk
+    """
+    sha256, md5, size = hashlib.sha256(), hashlib.md5(), 0
+    with open_local(path) as f:
+        while True:
+            data = f.read(HASH_CHUNK_SIZE)
+            if not data:
+                break
+            sha256.update(data)
+            md5.update(data)
+            size += len(data)
+    return sha256.hexdigest(), md5.hexdigest(), size
+
+
+def _store(path, digest, md5, size):
+    """
+    Put the file at `path` into the store as blob `digest` and return the
+    ContentBlob. If the blob is already there, `path` is left untouched and
+    the copy is not needed any more.
+    """
+    target = blob_path(digest)
+    if not os.path.exists(target):
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        # Blobs are shared by every name that links to them; nobody writes to them
+        os.chmod(path, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+        try:
+            # link() fails instead of replacing a blob another download just stored
+            os.link(path, target)
+        except FileExistsError:
+            pass
+    else:
+        metrics.incr('blobs.dedup')
+        metrics.incr('blobs.dedup_bytes', size)
+    blob, _ = ContentBlob.objects.get_or_create(digest=digest, defaults={'size': size, 'md5': md5})
+    return blob
+
+
+def link_blob(digest, local_path):
+    """
+    Make `local_path` a hard link to a blob, atomically replacing whatever
+    was there. Where hard links are not possible the blob is copied.
+    """
+    directory = os.path.dirname(local_path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(local_path)}.", suffix='.part')
+    os.close(fd)
+    os.remove(tmp_path)
+    try:
+        try:
+            os.link(blob_path(digest), tmp_path)
+        except FileNotFoundError:
+            raise
+        except OSError as e:
+            # e.g. EXDEV: BLOB_STORE_DIR on another filesystem than FILES_DIR
+            print(f"Cannot link blob {digest}, copying it: {e}")  # Debug log
+            metrics.incr('blobs.copy_fallback')
+            shutil.copyfile(blob_path(digest), tmp_path)
+        os.replace(tmp_path, local_path)
+        tmp_path = None
+    finally:
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def attach(filename, digest):
+    """
+    Point a catalog entry at a blob, moving its reference from whatever
+    blob it pointed at before. Returns the previous digest.
+    """
+    with transaction.atomic():
+        current = list(FileMetadata.objects.select_for_update().filter(
+            filename=filename
+        ).values_list('content_digest', flat=True))
+        if not current or current[0] == digest:
+            # No catalog entry means no reference to count
+            return current[0] if current else None
+        previous = current[0]
+        # Plain UPDATE: the digest is not part of the catalog listing
+        FileMetadata.objects.filter(filename=filename).update(content_digest=digest)
+        if digest:
+            ContentBlob.objects.filter(digest=digest).update(ref_count=F('ref_count') + 1, released_at=None)
+        if previous:
+            drop_reference(previous)
+    return previous
+
+
+def drop_reference(digest):
+    ContentBlob.objects.filter(digest=digest, ref_count__gt=0).update(ref_count=F('ref_count') - 1)
+    ContentBlob.objects.filter(digest=digest, ref_count=0, released_at__isnull=True).update(
+        released_at=timezone.now()
+    )
+
+
+def release(filename, purge=True):
+    """
+    Forget the blob behind a local copy that is being removed. With `purge`,
+    a blob nothing else links to is deleted right away, so the disk space
+    really comes back.
+    """
+    previous = attach(filename, None)
+    if previous and purge:
+        purge_blob(previous)
+    return previous
+
+
+def purge_blob(digest):
+    """
+    Delete a blob if it has no references; True if it was deleted
+    """
+    with transaction.atomic():
+        deleted, _ = ContentBlob.objects.filter(digest=digest, ref_count=0).delete()
+    if not deleted:
+        return False
+    try:
+        os.remove(blob_path(digest))
+    except FileNotFoundError:
+        pass
+    metrics.incr('blobs.purged')
+    return True
+
+
+def store_download(tmp_path, local_path, writer):
+    """
+    Finish a Drive download that was written through `writer` (a
+    HashingWriter) to `tmp_path`: keep the content as a blob, make
+    `local_path` a link to it and point the catalog entry at it
+    """
+    blob = _store(tmp_path, writer.digest, writer.md5, writer.size)
+    link_blob(blob.digest, local_path)
+    os.remove(tmp_path)
+    attach(os.path.basename(local_path), blob.digest)
+    return blob
+
+
+def find_blob(md5, size):
+    """
+    A held blob with this MD5 and size, as Drive reports them, or None
+    """
+    if not md5:
+        return None
+    for blob in ContentBlob.objects.filter(md5=md5, size=size):
+        if os.path.exists(blob_path(blob.digest)):
+            return blob
+    return None
+
+
+def reuse_blob(file_metadata, local_path):
+    """
+    Satisfy a download from the blob store when a blob already holds the
+    Drive file's content; returns the blob, or None if it must be fetched
+    """
+    if not settings.BLOB_STORE_ENABLED:
+        return None
+    blob = find_blob(file_metadata.drive_md5, file_metadata.size)
+    if blob is None:
+        return None
+    try:
+        link_blob(blob.digest, local_path)
+    except FileNotFoundError:
+        # Purged since it was looked up
+        return None
+    attach(file_metadata.filename, blob.digest)
+    metrics.incr('blobs.download_skipped')
+    metrics.incr('blobs.download_skipped_bytes', blob.size)
+    return blob
+
+
+def adopt_local_files(batch_size=500, dry_run=False, log=print):
+    """
+    Move Drive-backed local copies that predate the blob store into it.
+    Each file is hashed once and linked into the store in place (same
+    inode, no copy); a file whose content is already stored is replaced
+    by a link to that blob. Local-only files are left alone: they may be
+    written in place, which a shared blob must never be.
+    """
+    stats = Counter()
+    rows = (
+        FileMetadata.objects.filter(content_digest__isnull=True)
+        .exclude(google_drive_id__isnull=True).exclude(google_drive_id='')
+        .order_by('id').values_list('filename', flat=True)
+    )
+    for filename in rows.iterator(chunk_size=batch_size):
+        local_path = os.path.join(settings.FILES_DIR, filename)
+        if not os.path.isfile(local_path):
+            continue
+        if dry_run:
+            stats['adopted'] += 1
+            continue
+        try:
+            digest, md5, size = hash_file(local_path)
+            existing = os.path.exists(blob_path(digest))
+            _store(local_path, digest, md5, size)
+            if existing:
+                link_blob(digest, local_path)
+                stats['deduplicated'] += 1
+                stats['deduplicated_bytes'] += size
+            attach(filename, digest)
+            stats['adopted'] += 1
+        except OSError as e:
+            log(f"Could not adopt {filename}: {e}")
+            stats['errors'] += 1
+    return stats
+
+
+def _linked(filename, digest):
+    try:
+        local = os.stat(os.path.join(settings.FILES_DIR, filename))
+        blob = os.stat(blob_path(digest))
+    except FileNotFoundError:
+        return False
+    if (local.st_dev, local.st_ino) == (blob.st_dev, blob.st_ino):
+        return True
+    # A copy made where hard links are not possible
+    return local.st_dev != blob.st_dev and local.st_size == blob.st_size
+
+
+def collect_blobs(grace=None, batch_size=500, dry_run=False, log=print):
+    """
+    Garbage-collect the blob store:
+
+    1. detach catalog entries whose local copy is gone or is no longer the
+       blob they point at (replaced by hand, say);
+    2. recompute every ref_count from the catalog, fixing any drift;
+    3. delete blobs without references released more than `grace` seconds
+       ago, and blob files without a ContentBlob row that are that old.
+    """
+    grace = settings.BLOB_GC_GRACE if grace is None else grace
+    cutoff = timezone.now() - timedelta(seconds=grace)
+    stats = Counter()
+
+    with metrics.timed('blobs.collect'):
+        rows = (
+            FileMetadata.objects.filter(content_digest__isnull=False)
+            .order_by('id').values_list('filename', 'content_digest')
+        )
+        detached = [filename for filename, digest in rows.iterator(chunk_size=batch_size)
+                    if not _linked(filename, digest)]
+        stats['detached'] = len(detached)
+        if not dry_run:
+            for start in range(0, len(detached), batch_size):
+                FileMetadata.objects.filter(filename__in=detached[start:start + batch_size]).update(
+                    content_digest=None
+                )
+
+        if not dry_run:
+            with transaction.atomic():
+                counts = dict(
+                    FileMetadata.objects.filter(content_digest__isnull=False)
+                    .order_by().values_list('content_digest').annotate(refs=Count('id'))
+                )
+                for blob in ContentBlob.objects.only('id', 'digest', 'ref_count', 'released_at').iterator(
+                        chunk_size=batch_size):
+                    refs = counts.get(blob.digest, 0)
+                    if refs != blob.ref_count:
+                        stats['recounted'] += 1
+                        ContentBlob.objects.filter(pk=blob.pk).update(
+                            ref_count=refs,
+                            released_at=None if refs else (blob.released_at or timezone.now())
+                        )
+
+        unreferenced = ContentBlob.objects.filter(ref_count=0, released_at__lt=cutoff)
+        for digest, size in unreferenced.values_list('digest', 'size').iterator(chunk_size=batch_size):
+            if dry_run or purge_blob(digest):
+                stats['purged'] += 1
+                stats['purged_bytes'] += size
+
+        # Files a crashed process stored without ever recording them
+        known = set(ContentBlob.objects.values_list('digest', flat=True))
+        oldest = time.time() - grace
+        for root, _, names in os.walk(settings.BLOB_STORE_DIR):
+            for name in names:
+                path = os.path.join(root, name)
+                if name in known:
+                    continue
+                try:
+                    if os.stat(path).st_mtime >= oldest:
+                        continue
+                    stats['orphans'] += 1
+                    if not dry_run:
+                        os.remove(path)
+                except FileNotFoundError:
+                    continue
+    return stats
+
+
+def blob_stats():
+    """
+    How much the blob store holds and how much deduplication saves
+    """
+    blobs = ContentBlob.objects.all()
+    referenced = list(blobs.filter(ref_count__gt=0).values_list('size', 'ref_count'))
+    return {
+        'blobs': blobs.count(),
+        'stored_bytes': sum(blobs.values_list('size', flat=True)),
+        'unreferenced': blobs.filter(ref_count=0).count(),
+        'linked_files': FileMetadata.objects.filter(content_digest__isnull=False).count(),
+        # What the linked files would take as separate copies, and the difference
+        'logical_bytes': sum(size * refs for size, refs in referenced),
+        'saved_bytes': sum(size * (refs - 1) for size, refs in referenced),
+    }
@@ -0,0 +1,68 @@
+import hashlib
+import threading
+import time
+from django.conf import settings
+from django.db.models import F
+from .models import CatalogVersion
+
+CATALOG_VERSION_ID = 1
+
+# Last version read by this process: (version, monotonic read time)
+_cached = None
+_generation = 0
+_lock = threading.Lock()
+
+
+def _read_catalog_version():
+    version = CatalogVersion.objects.filter(pk=CATALOG_VERSION_ID).values_list('version', flat=True).first()
+    if version is None:
+        row, _ = CatalogVersion.objects.get_or_create(pk=CATALOG_VERSION_ID, defaults={'version': int(time.time() * 1000)})
+        version = row.version
+    return version
+
+
+def get_catalog_version():
+    """
+    Current catalog version, bumped on every FileMetadata change. Read from
+    the database at most every CATALOG_VERSION_CACHE_SECONDS per process:
+    a bump made by this process is seen on the next call, one made by
+    another process within that interval.
+    """
+    global _cached
+    cached = _cached
+    if cached is not None and time.monotonic() - cached[1] < settings.CATALOG_VERSION_CACHE_SECONDS:
+        return cached[0]
+    generation = _generation
+    read_at = time.monotonic()
+    version = _read_catalog_version()
+    with _lock:
+        # Not if a bump happened meanwhile; what we read may predate it
+        if generation == _generation:
+            _cached = (version, read_at)
+    return version
+
+
+def bump_catalog_version():
+    """
+    Invalidate everything derived from the catalog (listings, snapshots)
+    """
+    global _cached, _generation
+    if not CatalogVersion.objects.filter(pk=CATALOG_VERSION_ID).update(version=F('version') + 1):
+        get_catalog_version()
+        CatalogVersion.objects.filter(pk=CATALOG_VERSION_ID).update(version=F('version') + 1)
+    with _lock:
+        _cached = None
+        _generation += 1
+
+
+def listing_cache_key(role, query_params):
+    """
+    Cache key for one serialized listing: catalog version, role and query string
+    """
+    query = '&'.join(
+        f"{name}={value}"
+        for name in sorted(query_params)
+        for value in query_params.getlist(name)
+    )
+    digest = hashlib.sha1(query.encode('utf-8')).hexdigest()
+    return f"files:list:{get_catalog_version()}:{role}:{digest}"
@@ -0,0 +1,280 @@
+import io
+import os
+import struct
+import threading
+import zlib
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+
+# Files kept compressed at rest are a series of gzip members ("frames"),
+# each holding FRAME_SIZE bytes of the original except the last. Every
+# member carries an FEXTRA subfield 'SF' with its uncompressed length and
+# its own total length, so the frame table is rebuilt by hopping from
+# header to header, and any byte range is served by inflating only the
+# frames it touches. The whole file is still one valid gzip stream
+# (RFC 1952 allows several members), so it can be sent as is with
+# Content-Encoding: gzip.
+FRAME_HEADER = struct.Struct('<2sBBIBBH2sHII')
+FRAME_TRAILER = struct.Struct('<II')  # CRC32, ISIZE
+GZIP_MAGIC = b'\x1f\x8b'
+GZIP_DEFLATE = 8
+GZIP_FEXTRA = 0x04
+GZIP_OS_UNKNOWN = 255
+SUBFIELD_ID = b'SF'
+SUBFIELD_LENGTH = 8
+EXTRA_LENGTH = 4 + SUBFIELD_LENGTH
+
+# Frame tables are small (16 bytes per frame) and reused across requests
+MAX_CACHED_INDEXES = 1024
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+class FrameIndex:
+    """
+    Start of every frame in the original (ustarts) and in the compressed
+    file (cstarts), each with a final entry for the end
+    """
+    __slots__ = ('ustarts', 'cstarts')
+
+    def __init__(self, ustarts, cstarts):
+        self.ustarts = ustarts
+        self.cstarts = cstarts
+
+    @property
+    def size(self):
+        return self.ustarts[-1]
+
+    @property
+    def frames(self):
+        return len(self.ustarts) - 1
+
+
+def _frame_header(ulen, member_len):
+    return FRAME_HEADER.pack(GZIP_MAGIC, GZIP_DEFLATE, GZIP_FEXTRA, 0, 0, GZIP_OS_UNKNOWN,
+                             EXTRA_LENGTH, SUBFIELD_ID, SUBFIELD_LENGTH, ulen, member_len)
+
+
+def _parse_header(header):
+    """
+    (uncompressed length, member length) of a frame header, or None if
+    `header` does not start one
+    """
+    if len(header) < FRAME_HEADER.size:
+        return None
+    magic, method, flags, _, _, _, xlen, subfield, sublen, ulen, member_len = FRAME_HEADER.unpack_from(header)
+    if (magic, method, flags, xlen, subfield, sublen) != (
+            GZIP_MAGIC, GZIP_DEFLATE, GZIP_FEXTRA, EXTRA_LENGTH, SUBFIELD_ID, SUBFIELD_LENGTH):
+        return None
+    return ulen, member_len
+
+
+def is_framed(f):
+    """
+    Whether an open binary file is stored in the framed format; the file
+    position is left at 0
+    """
+    f.seek(0)
+    header = f.read(FRAME_HEADER.size)
+    f.seek(0)
+    return _parse_header(header) is not None
+
+
+def compress_frame(data, level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    body = compressor.compress(data) + compressor.flush()
+    member_len = FRAME_HEADER.size + len(body) + FRAME_TRAILER.size
+    return b''.join((
+        _frame_header(len(data), member_len),
+        body,
+        FRAME_TRAILER.pack(zlib.crc32(data), len(data) & 0xffffffff),
+    ))
+
+
+class FrameWriter:
+    """
+    Write-only file wrapper that stores what is written through it in the
+    framed format; call close() to flush the last frame
+    """
+
+    def __init__(self, f, frame_size, level=6):
+        self._f = f
+        self.frame_size = frame_size
+        self.level = level
+        self._buffer = bytearray()
+
+    def write(self, data):
+        self._buffer += data
+        while len(self._buffer) >= self.frame_size:
+            self._f.write(compress_frame(bytes(self._buffer[:self.frame_size]), self.level))
+            del self._buffer[:self.frame_size]
+        return len(data)
+
+    def close(self):
+        if self._buffer:
+            self._f.write(compress_frame(bytes(self._buffer), self.level))
+            self._buffer.clear()
+
+
+def read_frame_index(f):
+    """
+    Walk the frame headers of an open framed file; raises ValueError if
+    the file is not a complete framed file
+    """
+    ustarts = array('Q', [0])
+    cstarts = array('Q', [0])
+    size = os.fstat(f.fileno()).st_size
+    offset = 0
+    while offset < size:
+        f.seek(offset)
+        parsed = _parse_header(f.read(FRAME_HEADER.size))
+        if parsed is None:
+            raise ValueError(f"No frame header at offset {offset}")
+        ulen, member_len = parsed
+        offset += member_len
+        ustarts.append(ustarts[-1] + ulen)
+        cstarts.append(offset)
+    if offset != size:
+        raise ValueError('Truncated frame')
+    return FrameIndex(ustarts, cstarts)
+
+
+def get_frame_index(f):
+    """
+    Frame table of an open framed file, cached per file version
+    """
+    stat_result = os.fstat(f.fileno())
+    key = (stat_result.st_dev, stat_result.st_ino, stat_result.st_size, stat_result.st_mtime_ns)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is not None:
+            _indexes.move_to_end(key)
+            return index
+    index = read_frame_index(f)
+    with _indexes_lock:
+        _indexes[key] = index
+        while len(_indexes) > MAX_CACHED_INDEXES:
+            _indexes.popitem(last=False)
+    return index
+
+
+class FramedReader(io.RawIOBase):
+    """
+    Seekable read-only view of the original bytes of a framed file; only
+    the frame under the current position is inflated, and the last one
+    is kept for sequential reads
+    """
+
+    def __init__(self, f):
+        super().__init__()
+        self._f = f
+        self.index = get_frame_index(f)
+        self._pos = 0
+        self._frame = -1
+        self._data = b''
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += self.index.size
+        if offset < 0:
+            raise ValueError('negative seek position')
+        self._pos = offset
+        return offset
+
+    def tell(self):
+        return self._pos
+
+    def _load(self, frame):
+        start, end = self.index.cstarts[frame], self.index.cstarts[frame + 1]
+        self._f.seek(start + FRAME_HEADER.size)
+        body = self._f.read(end - start - FRAME_HEADER.size - FRAME_TRAILER.size)
+        self._data = zlib.decompress(body, -zlib.MAX_WBITS)
+        self._frame = frame
+
+    def readinto(self, buffer):
+        if self._pos >= self.index.size:
+            return 0
+        frame = bisect_right(self.index.ustarts, self._pos) - 1
+        if frame != self._frame:
+            self._load(frame)
+        start = self._pos - self.index.ustarts[frame]
+        count = min(len(buffer), len(self._data) - start)
+        buffer[:count] = self._data[start:start + count]
+        self._pos += count
+        return count
+
+    def close(self):
+        if not self.closed:
+            self._f.close()
+        super().close()
+
+
+def wrap_local(f, buffer_size=64 * 1024):
+    """
+    Reader for the original content of an open binary file: the file
+    itself, or a buffered FramedReader if it is stored framed
+    """
+    if is_framed(f):
+        return io.BufferedReader(FramedReader(f), buffer_size=buffer_size)
+    return f
+
+
+def open_local(path):
+    """
+    open(path, 'rb') for any file in FILES_DIR, compressed at rest or not
+    """
+    f = open(path, 'rb')
+    try:
+        return wrap_local(f)
+    except Exception:
+        f.close()
+        raise
+
+
+def local_size(path, stat_result=None):
+    """
+    Size of a file's original content
+    """
+    with open(path, 'rb') as f:
+        if is_framed(f):
+            return get_frame_index(f).size
+        return os.fstat(f.fileno()).st_size if stat_result is None else stat_result.st_size
+
+
+def convert_file(src, frame_size, level, decompress=False, chunk_size=1024 * 1024):
+    """
+    Write `src` framed (or back to plain with `decompress`) to a temporary
+    file next to it and return (temporary path, bytes before, bytes after).
+    Runs in `manage.py compress_store` worker processes, so it only uses
+    its arguments, not Django.
+    """
+    directory = os.path.dirname(src)
+    tmp_path = os.path.join(directory, f".{os.path.basename(src)}.{os.getpid()}.part")
+    try:
+        with open_local(src) as reader, open(tmp_path, 'wb') as out:
+            writer = out if decompress else FrameWriter(out, frame_size, level)
+            while True:
+                data = reader.read(chunk_size)
+                if not data:
+                    break
+                writer.write(data)
+            if not decompress:
+                writer.close()
+            out.flush()
+            os.fsync(out.fileno())
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+    return tmp_path, os.path.getsize(src), os.path.getsize(tmp_path)
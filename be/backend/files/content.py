@@ -0,0 +1,201 @@
+import os
+import re
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from .compression import get_frame_index, is_framed, open_local
+from .content_cache import content_cache
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeNotSatisfiable(Exception):
+    """
+    Raised when a Range header cannot be satisfied for the current file size
+    """
+    pass
+
+
+def file_etag(stat_result):
+    """
+    Build a strong ETag from file mtime and size
+    """
+    return quote_etag(f"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}")
+
+
+def parse_range_header(header, size):
+    """
+    Parse a single "bytes=" range into an inclusive (start, end) tuple.
+
+    Returns None when the header is absent or not something we serve as a
+    partial response (multiple ranges, other units); the caller then sends
+    the whole file, which RFC 9110 allows.
+    """
+    if not header:
+        return None
+
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None
+
+    first, last = match.groups()
+    if not first and not last:
+        return None
+
+    if not first:
+        # Suffix range: the last N bytes, of which an empty file has none
+        length = int(last)
+        if length == 0 or size == 0:
+            raise RangeNotSatisfiable()
+        return max(size - length, 0), size - 1
+
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        raise RangeNotSatisfiable()
+    return start, min(end, size - 1)
+
+
+def if_range_matches(request, etag, last_modified):
+    """
+    Check the If-Range precondition; a mismatch means the full file is sent
+    """
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def negotiate_encoding(request, available):
+    """
+    Pick the content coding to send from `available` (e.g. {'gzip', 'br'})
+    according to Accept-Encoding, preferring br; None means identity
+    """
+    header = request.META.get('HTTP_ACCEPT_ENCODING', '')
+    if not header or not available:
+        return None
+    accepted = {}
+    for item in header.split(','):
+        coding, _, params = item.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding.strip().lower()] = quality
+    wildcard = accepted.get('*', 0.0)
+    for coding in ('br', 'gzip'):
+        if coding in available and accepted.get(coding, wildcard) > 0:
+            return coding
+    return None
+
+
+def iter_file_range(path, start, length, chunk_size):
+    """
+    Yield `length` bytes of `path` starting at `start`, one chunk at a time
+    """
+    with open_local(path) as f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def build_content_response(request, path, content_type='text/plain; charset=utf-8'):
+    """
+    Build a streaming response for a local file.
+
+    Handles conditional GETs (If-None-Match / If-Modified-Since -> 304) and
+    single byte ranges (-> 206). Small files are served from the in-memory
+    content cache, compressed when the client accepts it; anything larger
+    is streamed and never loaded whole. A file compressed at rest is sent
+    as stored to clients that accept gzip, and decompressed otherwise;
+    sizes and ranges always refer to the original content.
+    """
+    stat_result = os.stat(path)
+    with open(path, 'rb') as f:
+        framed = is_framed(f)
+        size = get_frame_index(f).size if framed else stat_result.st_size
+    etag = file_etag(stat_result)
+    last_modified = int(stat_result.st_mtime)
+    chunk_size = settings.FILE_STREAM_CHUNK_SIZE
+
+    def finalize(response):
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        response['Accept-Ranges'] = 'bytes'
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return response
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return finalize(not_modified)
+
+    byte_range = None
+    if if_range_matches(request, etag, last_modified):
+        try:
+            byte_range = parse_range_header(request.META.get('HTTP_RANGE'), size)
+        except RangeNotSatisfiable:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return finalize(response)
+
+    cached = content_cache.get(path, stat_result, size)
+
+    if byte_range is None:
+        if cached is None and framed:
+            if negotiate_encoding(request, {'gzip'}):
+                # The stored frames are one gzip stream: no recompression
+                response = FileResponse(open(path, 'rb'), content_type=content_type)
+                response.block_size = chunk_size
+                finalize(response)
+                response['Content-Encoding'] = 'gzip'
+                response['ETag'] = f'W/{etag}'
+                return response
+            response = StreamingHttpResponse(iter_file_range(path, 0, size, chunk_size), content_type=content_type)
+            response['Content-Length'] = str(size)
+            return finalize(response)
+        if cached is None:
+            response = FileResponse(open(path, 'rb'), content_type=content_type)
+            response.block_size = chunk_size
+            return finalize(response)
+
+        encoding = negotiate_encoding(request, cached.variants)
+        body = cached.variants[encoding] if encoding else cached.data
+        response = HttpResponse(body, content_type=content_type)
+        response['Content-Length'] = str(len(body))
+        finalize(response)
+        if encoding:
+            response['Content-Encoding'] = encoding
+            # Same as GZipMiddleware: the encoded body is a different byte
+            # sequence, so its validator can only be weak
+            response['ETag'] = f'W/{etag}'
+        return response
+
+    start, end = byte_range
+    length = end - start + 1
+    if cached is not None:
+        response = HttpResponse(cached.data[start:end + 1], status=206, content_type=content_type)
+        response['Content-Length'] = str(length)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        return finalize(response)
+
+    response = StreamingHttpResponse(
+        iter_file_range(path, start, length, chunk_size),
+        status=206,
+        content_type=content_type
+    )
+    response['Content-Length'] = str(length)
+    response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return finalize(response)
@@ -0,0 +1,152 @@
+import gzip
+import threading
+from collections import OrderedDict
+from django.conf import settings
+from . import metrics
+from .compression import wrap_local
+
+try:
+    import brotli
+except ImportError:  # optional: without it only gzip variants are stored
+    brotli = None
+
+
+class CachedContent:
+    """
+    One file version held in memory, with optional compressed variants
+    """
+    __slots__ = ('data', 'variants', 'nbytes')
+
+    def __init__(self, data, variants):
+        self.data = data
+        self.variants = variants  # {'br': bytes, 'gzip': bytes}
+        self.nbytes = len(data) + sum(len(body) for body in variants.values())
+
+
+def compress_variants(data, gzip_body=None):
+    """
+    Pre-compressed bodies worth keeping, i.e. the ones smaller than the
+    original; `gzip_body` is used as is when the file is stored gzipped
+    """
+    variants = {}
+    if len(data) < settings.FILE_CONTENT_CACHE_MIN_COMPRESS_SIZE:
+        return variants
+    candidates = [('gzip', lambda: gzip_body or gzip.compress(data, compresslevel=6, mtime=0))]
+    if brotli is not None:
+        candidates.insert(0, ('br', lambda: brotli.compress(data, quality=5)))
+    for encoding, compress in candidates:
+        body = compress()
+        if len(body) < len(data):
+            variants[encoding] = body
+    return variants
+
+
+class ContentCache:
+    """
+    Byte-budgeted LRU of small file contents, keyed by (path, mtime, size).
+
+    A changed file gets a new key, so stale content is never served; the old
+    version is dropped when the new one is admitted. Files larger than
+    FILE_CONTENT_CACHE_MAX_FILE_SIZE are not admitted and keep streaming
+    from disk.
+    """
+
+    def __init__(self, max_bytes, max_entry_bytes):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._key_by_path = {}
+
+    def admits(self, size):
+        return 0 < size <= self.max_entry_bytes and size <= self.max_bytes
+
+    def get(self, path, stat_result, size=None):
+        """
+        Cached content for this version of the file, loading it on a miss;
+        None if the file is not admitted. `size` is the size of the original
+        content when the file is compressed at rest.
+        """
+        size = stat_result.st_size if size is None else size
+        if not self.admits(size):
+            metrics.incr('content_cache.bypass')
+            return None
+
+        key = (path, stat_result.st_mtime_ns, stat_result.st_size)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            if entry is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if entry is not None:
+            metrics.incr('content_cache.hit')
+            return entry
+
+        metrics.incr('content_cache.miss')
+        with open(path, 'rb') as raw:
+            f = wrap_local(raw)
+            data = f.read(size + 1)
+            if f is not raw:
+                raw.seek(0)
+                stored = raw.read(stat_result.st_size + 1)
+            else:
+                stored = None
+        if len(data) != size or (stored is not None and len(stored) != stat_result.st_size):
+            # Changed while we read it; serve from disk this time
+            return None
+        variants = compress_variants(data, stored) if settings.FILE_CONTENT_CACHE_COMPRESS else {}
+        entry = CachedContent(data, variants)
+        self._put(key, entry)
+        return entry
+
+    def _put(self, key, entry):
+        with self._lock:
+            old_key = self._key_by_path.get(key[0])
+            if old_key is not None:
+                self._remove(old_key)
+            self._entries[key] = entry
+            self._key_by_path[key[0]] = key
+            self.bytes += entry.nbytes
+            while self.bytes > self.max_bytes and self._entries:
+                self._remove(next(iter(self._entries)))
+                metrics.incr('content_cache.eviction')
+
+    def discard(self, path):
+        with self._lock:
+            key = self._key_by_path.get(path)
+            if key is not None:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._key_by_path.clear()
+            self.bytes = 0
+
+    def hit_ratio(self):
+        total = self.hits + self.misses
+        return round(self.hits / total, 4) if total else None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self.bytes -= entry.nbytes
+        if self._key_by_path.get(key[0]) == key:
+            del self._key_by_path[key[0]]
+
+
+content_cache = ContentCache(settings.FILE_CONTENT_CACHE_BYTES, settings.FILE_CONTENT_CACHE_MAX_FILE_SIZE)
+
+metrics.register_gauge('content_cache.bytes', lambda: content_cache.bytes)
+metrics.register_gauge('content_cache.entries', lambda: len(content_cache))
+metrics.register_gauge('content_cache.hit_ratio', content_cache.hit_ratio)
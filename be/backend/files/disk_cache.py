@@ -0,0 +1,301 @@
+import os
+import threading
+import time
+from collections import Counter, namedtuple
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max
+from django.utils import timezone
+from . import metrics
+from .catalog import bump_catalog_version
+from .content_cache import content_cache
+from .line_index import discard_line_index
+from .blobs import release
+from .models import FileAccess, FileMetadata
+from .search import discard_document
+
+LocalFile = namedtuple('LocalFile', 'filename size mtime_ns inode')
+
+EVICTION_POLICIES = ('lru', 'lfu')
+
+
+def chunked(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def scan_local_files():
+    """
+    Regular files in FILES_DIR by name. Dot entries (the lock directory,
+    in-progress `.part` downloads) are not cached files and are skipped.
+    """
+    local = {}
+    with os.scandir(settings.FILES_DIR) as entries:
+        for entry in entries:
+            if entry.name.startswith('.'):
+                continue
+            try:
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+                stat_result = entry.stat(follow_symlinks=False)
+            except FileNotFoundError:
+                continue
+            local[entry.name] = LocalFile(entry.name, stat_result.st_size, stat_result.st_mtime_ns,
+                                          stat_result.st_ino)
+    return local
+
+
+def disk_usage(local):
+    """
+    Bytes the scanned files take on disk. Names that are links to the same
+    blob (see files.blobs) share one inode and are counted once.
+    """
+    sizes = {local_file.inode: local_file.size for local_file in local.values()}
+    return sum(sizes.values())
+
+
+def stale_partial_downloads(max_age):
+    """
+    Paths of `.part` files left behind by downloads that died more than
+    `max_age` seconds ago
+    """
+    cutoff = time.time() - max_age
+    stale = []
+    with os.scandir(settings.FILES_DIR) as entries:
+        for entry in entries:
+            if not (entry.name.startswith('.') and entry.name.endswith('.part')):
+                continue
+            try:
+                if entry.stat(follow_symlinks=False).st_mtime < cutoff:
+                    stale.append(entry.path)
+            except FileNotFoundError:
+                continue
+    return stale
+
+
+def _set_is_local(ids, value, batch_size):
+    with transaction.atomic():
+        # update() bypasses the post_save signal
+        transaction.on_commit(bump_catalog_version)
+        for batch in chunked(ids, batch_size):
+            if value:
+                FileMetadata.objects.filter(id__in=batch).update(is_local=True)
+            else:
+                FileMetadata.objects.filter(id__in=batch).update(is_local=False, prefetched_at=None)
+
+
+def reconcile_is_local(local, batch_size=500, dry_run=False):
+    """
+    Make FileMetadata.is_local match what is actually in FILES_DIR.
+
+    The catalog is read in id order, `batch_size` rows at a time, and the
+    mismatches are written with one UPDATE per batch.
+    """
+    stats = Counter()
+    mark_local = []
+    mark_remote = []
+    catalogued = set()
+
+    rows = FileMetadata.objects.order_by('id').values_list('id', 'filename', 'is_local')
+    for file_id, filename, is_local in rows.iterator(chunk_size=batch_size):
+        catalogued.add(filename)
+        on_disk = filename in local
+        if on_disk and not is_local:
+            mark_local.append(file_id)
+        elif is_local and not on_disk:
+            mark_remote.append(file_id)
+
+    stats['marked_local'] = len(mark_local)
+    stats['marked_remote'] = len(mark_remote)
+    # Files on disk without a catalog entry are reported, never deleted
+    stats['orphans'] = sum(1 for filename in local if filename not in catalogued)
+    if not dry_run:
+        if mark_local:
+            _set_is_local(mark_local, True, batch_size)
+        if mark_remote:
+            _set_is_local(mark_remote, False, batch_size)
+    return stats
+
+
+def access_history(filenames, since, batch_size=500):
+    """
+    (last access, number of accesses) per filename since `since`, from the
+    (filename, timestamp) index on FileAccess
+    """
+    history = {}
+    for batch in chunked(list(filenames), batch_size):
+        rows = (
+            FileAccess.objects.filter(filename__in=batch, timestamp__gte=since)
+            .order_by()
+            .values('filename')
+            .annotate(last=Max('timestamp'), hits=Count('id'))
+        )
+        for row in rows:
+            history[row['filename']] = (row['last'].timestamp(), row['hits'])
+    return history
+
+
+def evictable_files(local, batch_size=500):
+    """
+    Local files that can be downloaded again, i.e. have a Drive copy, with
+    their catalog ids. Files that only exist locally are never evicted.
+    """
+    evictable = {}
+    for batch in chunked(list(local), batch_size):
+        rows = (
+            FileMetadata.objects.filter(filename__in=batch)
+            .exclude(google_drive_id__isnull=True).exclude(google_drive_id='')
+            .values_list('filename', 'id')
+        )
+        evictable.update(rows)
+    return evictable
+
+
+def eviction_order(local, evictable, policy, batch_size=500):
+    """
+    Evictable LocalFiles, first victim first, with the time each was last
+    used. A file's download counts as a use, so a fresh copy nobody has
+    opened yet is not the first to go.
+    """
+    since = timezone.now() - timedelta(days=settings.DISK_CACHE_HISTORY_DAYS)
+    history = access_history(evictable, since, batch_size=batch_size)
+
+    ranked = []
+    for filename in evictable:
+        local_file = local[filename]
+        last_access, hits = history.get(filename, (0.0, 0))
+        last_used = max(last_access, local_file.mtime_ns / 1e9)
+        key = (hits, last_used) if policy == 'lfu' else (last_used,)
+        ranked.append((key, last_used, local_file))
+    ranked.sort(key=lambda item: item[0])
+    return [(local_file, last_used) for _, last_used, local_file in ranked]
+
+
+def evict_file(local_file):
+    """
+    Delete a cached copy and everything derived from it; False if the file
+    changed since it was scanned (e.g. it was just downloaded again)
+    """
+    path = os.path.join(settings.FILES_DIR, local_file.filename)
+    try:
+        stat_result = os.stat(path)
+        if (stat_result.st_mtime_ns, stat_result.st_size) != (local_file.mtime_ns, local_file.size):
+            return False
+        os.remove(path)
+    except FileNotFoundError:
+        return False
+    discard_line_index(local_file.filename)
+    discard_document(local_file.filename)
+    content_cache.discard(path)
+    release(local_file.filename)
+    return True
+
+
+def collect(max_bytes=None, policy=None, low_watermark=None, min_age=None,
+            batch_size=500, reconcile=True, dry_run=False, log=print):
+    """
+    When FILES_DIR holds more than `max_bytes`, evict Drive-backed files
+    down to `max_bytes * low_watermark`, then (with `reconcile`) make
+    is_local match the directory. Returns a Counter of what was done.
+    """
+    max_bytes = settings.DISK_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    policy = policy or settings.DISK_CACHE_POLICY
+    low_watermark = settings.DISK_CACHE_LOW_WATERMARK if low_watermark is None else low_watermark
+    min_age = settings.DISK_CACHE_MIN_AGE if min_age is None else min_age
+    if policy not in EVICTION_POLICIES:
+        raise ValueError(f"Unknown eviction policy: {policy}")
+
+    stats = Counter()
+    with metrics.timed('disk_cache.collect'):
+        for path in stale_partial_downloads(settings.DOWNLOAD_JOB_STALE_AFTER):
+            stats['partials_removed'] += 1
+            if not dry_run:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+        local = scan_local_files()
+        used = disk_usage(local)
+        links = Counter(local_file.inode for local_file in local.values())
+        stats['files'] = len(local)
+        stats['used_bytes'] = used
+
+        if max_bytes > 0 and used > max_bytes:
+            target = int(max_bytes * low_watermark)
+            evictable = evictable_files(local, batch_size=batch_size)
+            protect_after = time.time() - min_age
+            evicted_ids = []
+            for local_file, last_used in eviction_order(local, evictable, policy, batch_size=batch_size):
+                if used <= target:
+                    break
+                if last_used > protect_after:
+                    stats['protected'] += 1
+                    continue
+                if dry_run or evict_file(local_file):
+                    evicted_ids.append(evictable[local_file.filename])
+                    del local[local_file.filename]
+                    stats['evicted'] += 1
+                    links[local_file.inode] -= 1
+                    # Space only comes back with the last name linked to the content
+                    if not links[local_file.inode]:
+                        used -= local_file.size
+                        stats['evicted_bytes'] += local_file.size
+            if used > target:
+                log(f"Disk cache still holds {used} bytes after eviction (target {target})")
+            if evicted_ids and not dry_run:
+                _set_is_local(evicted_ids, False, batch_size)
+                metrics.incr('disk_cache.evicted', len(evicted_ids))
+                metrics.incr('disk_cache.evicted_bytes', stats['evicted_bytes'])
+
+        if reconcile:
+            stats.update(reconcile_is_local(local, batch_size=batch_size, dry_run=dry_run))
+        stats['used_bytes_after'] = used
+    return stats
+
+
+def cache_stats(batch_size=500):
+    """
+    Current size of the disk cache against its quota
+    """
+    local = scan_local_files()
+    evictable = evictable_files(local, batch_size=batch_size)
+    return {
+        'quota_bytes': settings.DISK_CACHE_MAX_BYTES,
+        'policy': settings.DISK_CACHE_POLICY,
+        'files': len(local),
+        'used_bytes': disk_usage(local),
+        'evictable_files': len(evictable),
+        'evictable_bytes': disk_usage({filename: local[filename] for filename in evictable}),
+        'partial_downloads': len(stale_partial_downloads(0)),
+    }
+
+
+_collect_lock = threading.Lock()
+_last_collect = 0.0
+
+
+def collect_if_due():
+    """
+    Run a collection after a download, at most once per
+    DISK_CACHE_GC_INTERVAL seconds and never two at a time in this process
+    """
+    global _last_collect
+    if settings.DISK_CACHE_MAX_BYTES <= 0:
+        return None
+    if time.monotonic() - _last_collect < settings.DISK_CACHE_GC_INTERVAL:
+        return None
+    if not _collect_lock.acquire(blocking=False):
+        return None
+    try:
+        _last_collect = time.monotonic()
+        if disk_usage(scan_local_files()) <= settings.DISK_CACHE_MAX_BYTES:
+            return None
+        # Evicted files are marked remote; the full reconcile is left to cache_gc
+        stats = collect(reconcile=False)
+        if stats['evicted']:
+            print(f"Disk cache evicted {stats['evicted']} file(s), {stats['evicted_bytes']} bytes")  # Debug log
+        return stats
+    finally:
+        _collect_lock.release()
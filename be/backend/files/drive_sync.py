@@ -0,0 +1,280 @@
+import os
+from collections import Counter
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .blobs import release
+from .catalog import bump_catalog_version
+from .line_index import discard_line_index
+from .models import DriveSyncState, FileMetadata, roles_to_mask
+from .paths import UnsafeFilename, is_safe_filename, local_file_path
+from .search import discard_document
+from .utils import get_drive_start_page_token, iter_drive_change_pages, iter_drive_file_pages
+
+
+class DriveSyncError(Exception):
+    pass
+
+
+def chunked(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class DriveSync:
+    """
+    Reconcile FileMetadata with the .txt files of one Drive folder.
+
+    Drive entries are processed in batches: each batch costs two indexed
+    lookups plus one bulk_create and one bulk_update, independent of how many
+    rows it touches.
+    """
+
+    def __init__(self, folder_id, batch_size=1000, default_roles=None, prune=False,
+                 dry_run=False, log=print):
+        self.folder_id = folder_id
+        self.batch_size = batch_size
+        self.default_roles = list(default_roles if default_roles is not None
+                                  else settings.DRIVE_SYNC_DEFAULT_ROLES)
+        self.prune = prune
+        self.dry_run = dry_run
+        self.log = log
+        self.stats = Counter()
+
+    # ----------------------------------------------------------------
+    # Entry points
+    # ----------------------------------------------------------------
+
+    def full_sync(self):
+        """
+        Page through the whole folder, then optionally prune missing files
+        """
+        # Taken first so changes made while we list are replayed next time
+        start_token = get_drive_start_page_token()
+        seen_ids = set()
+        pending = []
+
+        for page in iter_drive_file_pages(self.folder_id, page_size=min(self.batch_size, 1000)):
+            self.stats['listed'] += len(page)
+            pending.extend(page)
+            while len(pending) >= self.batch_size:
+                batch, pending = pending[:self.batch_size], pending[self.batch_size:]
+                seen_ids.update(entry['id'] for entry in batch)
+                self.apply_batch(batch)
+
+        if pending:
+            seen_ids.update(entry['id'] for entry in pending)
+            self.apply_batch(pending)
+
+        if self.prune:
+            self.prune_missing(seen_ids)
+
+        self.save_state(start_page_token=start_token, last_full_sync_at=timezone.now())
+        return self.stats
+
+    def incremental_sync(self):
+        """
+        Apply only what changed since the stored changes-feed page token
+        """
+        state = DriveSyncState.objects.filter(folder_id=self.folder_id).first()
+        if state is None or not state.start_page_token:
+            raise DriveSyncError('No stored page token for this folder; run a full sync first')
+
+        new_token = None
+        for changes, page_new_token in iter_drive_change_pages(state.start_page_token,
+                                                               page_size=min(self.batch_size, 1000)):
+            self.stats['changes'] += len(changes)
+            upserts = []
+            removed_ids = []
+            for change in changes:
+                entry = change.get('file')
+                if (change.get('removed') or not entry or entry.get('trashed') or
+                        self.folder_id not in entry.get('parents', []) or
+                        entry.get('mimeType', 'text/plain') != 'text/plain'):
+                    removed_ids.append(change['fileId'])
+                else:
+                    upserts.append(entry)
+
+            for batch in chunked(upserts, self.batch_size):
+                self.apply_batch(batch)
+            if self.prune:
+                self.remove(removed_ids)
+            elif removed_ids:
+                self.stats['ignored_removals'] += len(removed_ids)
+
+            new_token = page_new_token or new_token
+
+        self.save_state(start_page_token=new_token or state.start_page_token,
+                        last_incremental_sync_at=timezone.now())
+        return self.stats
+
+    # ----------------------------------------------------------------
+    # Batch reconciliation
+    # ----------------------------------------------------------------
+
+    def apply_batch(self, entries):
+        """
+        Diff a batch of Drive entries against FileMetadata and write the result
+        """
+        by_id = {}
+        for entry in entries:
+            # Names become paths in FILES_DIR; '../x' or 'a/b' must never get that far
+            if not is_safe_filename(entry['name']):
+                self.log(f"Skipping Drive file {entry['id']}: unsafe name {entry['name']!r}")
+                self.stats['unsafe_names'] += 1
+                continue
+            by_id[entry['id']] = entry  # the last change wins
+        existing = {
+            metadata.google_drive_id: metadata
+            for metadata in FileMetadata.objects.filter(google_drive_id__in=list(by_id))
+        }
+        wanted_names = {
+            entry['name'] for file_id, entry in by_id.items()
+            if file_id not in existing or existing[file_id].filename != entry['name']
+        }
+        taken = {
+            metadata.filename: metadata
+            for metadata in FileMetadata.objects.filter(filename__in=wanted_names)
+        }
+
+        now = timezone.now()
+        to_create = []
+        to_update = []
+
+        for file_id, entry in by_id.items():
+            name = entry['name']
+            size = int(entry.get('size') or 0)
+            md5 = entry.get('md5Checksum') or ''
+            modified = parse_datetime(entry['modifiedTime']) if entry.get('modifiedTime') else None
+            current = existing.get(file_id)
+            adopted = False
+
+            if current is None:
+                owner = taken.get(name)
+                if owner is None:
+                    metadata = FileMetadata(
+                        filename=name,
+                        size=size,
+                        last_modified=now,
+                        is_local=False,
+                        google_drive_id=file_id,
+                        drive_modified_time=modified,
+                        drive_md5=md5,
+                        allowed_roles=list(self.default_roles),
+                        role_mask=roles_to_mask(self.default_roles)
+                    )
+                    taken[name] = metadata
+                    to_create.append(metadata)
+                    continue
+                if owner.google_drive_id:
+                    self.log(f"Skipping Drive file {file_id}: '{name}' belongs to {owner.google_drive_id}")
+                    self.stats['conflicts'] += 1
+                    continue
+                # A catalog entry created by hand, now linked to its Drive file
+                current = owner
+                current.google_drive_id = file_id
+                adopted = True
+
+            renamed = current.filename != name
+            if renamed and taken.get(name) not in (None, current):
+                self.log(f"Skipping rename of '{current.filename}' to '{name}': name already in use")
+                self.stats['conflicts'] += 1
+                continue
+
+            content_changed = (current.drive_modified_time is not None and
+                               (current.drive_modified_time != modified or current.size != size))
+            if content_changed and md5 and current.drive_md5 == md5 and current.size == size:
+                # Touched on Drive but the bytes are the same: keep the local copy
+                content_changed = False
+                self.stats['content_unchanged'] += 1
+            if not (adopted or renamed or content_changed or current.drive_modified_time != modified
+                    or current.drive_md5 != md5):
+                self.stats['unchanged'] += 1
+                continue
+
+            if not self.dry_run:
+                if renamed:
+                    self._rename_local_copy(current.filename, name)
+                if content_changed and current.is_local:
+                    self._discard_local_copy(name if renamed else current.filename)
+                    current.is_local = False
+
+            if renamed:
+                taken[name] = current
+            current.filename = name
+            current.size = size
+            current.drive_modified_time = modified
+            current.drive_md5 = md5
+            current.last_modified = now
+            to_update.append(current)
+
+        self.stats['created'] += len(to_create)
+        self.stats['updated'] += len(to_update)
+        if self.dry_run:
+            return
+
+        with transaction.atomic():
+            if to_create or to_update:
+                # Bulk writes bypass the post_save signal
+                transaction.on_commit(bump_catalog_version)
+            if to_create:
+                FileMetadata.objects.bulk_create(to_create, batch_size=self.batch_size)
+            if to_update:
+                FileMetadata.objects.bulk_update(
+                    to_update,
+                    ['filename', 'size', 'is_local', 'google_drive_id', 'drive_modified_time', 'drive_md5',
+                     'last_modified'],
+                    batch_size=self.batch_size
+                )
+
+    def prune_missing(self, seen_ids):
+        """
+        Remove Drive-backed catalog entries that were not in the full listing
+        """
+        missing = [
+            file_id for file_id in FileMetadata.objects.exclude(google_drive_id__isnull=True)
+            .exclude(google_drive_id='').values_list('google_drive_id', flat=True).iterator(chunk_size=self.batch_size)
+            if file_id not in seen_ids
+        ]
+        self.remove(missing)
+
+    def remove(self, drive_ids):
+        for batch in chunked(list(drive_ids), self.batch_size):
+            doomed = list(FileMetadata.objects.filter(google_drive_id__in=batch).values_list('id', 'filename'))
+            self.stats['removed'] += len(doomed)
+            if self.dry_run or not doomed:
+                continue
+            for _, filename in doomed:
+                self._discard_local_copy(filename)
+            FileMetadata.objects.filter(id__in=[pk for pk, _ in doomed]).delete()
+
+    def save_state(self, **fields):
+        if self.dry_run:
+            return
+        DriveSyncState.objects.update_or_create(folder_id=self.folder_id, defaults=fields)
+
+    # ----------------------------------------------------------------
+    # Local copies
+    # ----------------------------------------------------------------
+
+    def _discard_local_copy(self, filename):
+        try:
+            os.remove(local_file_path(filename))
+            self.stats['local_discarded'] += 1
+        except (FileNotFoundError, UnsafeFilename):
+            pass
+        discard_line_index(filename)
+        discard_document(filename)
+        release(filename)
+
+    def _rename_local_copy(self, old_name, new_name):
+        try:
+            old_path = local_file_path(old_name)
+        except UnsafeFilename:
+            old_path = None
+        if old_path and os.path.exists(old_path):
+            os.replace(old_path, local_file_path(new_name))
+        discard_line_index(old_name)
+        # Picked up under the new name by the next `manage.py reindex`
+        discard_document(old_name)
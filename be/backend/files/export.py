@@ -0,0 +1,107 @@
+import csv
+import io
+import json
+import zlib
+from django.conf import settings
+from .models import FileAccess
+
+# (output name, values_list lookup)
+EXPORT_COLUMNS = [
+    ('id', 'id'),
+    ('timestamp', 'timestamp'),
+    ('user_id', 'user_id'),
+    ('username', 'user__username'),
+    ('user_role', 'user_role'),
+    ('filename', 'filename'),
+    ('action', 'action'),
+    ('success', 'success'),
+    ('ip_address', 'ip_address'),
+    ('event_id', 'event_id'),
+]
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+# Rendered lines are coalesced into writes of about this size
+WRITE_BUFFER_SIZE = 64 * 1024
+
+
+def export_rows(events, after_id=None, through_id=None, chunk_size=None):
+    """
+    Tuples of EXPORT_COLUMNS in id order, fetched chunk by chunk without
+    building model instances. Resume an interrupted export with after_id
+    set to the last id received.
+    """
+    if after_id is not None:
+        events = events.filter(id__gt=after_id)
+    if through_id is not None:
+        events = events.filter(id__lte=through_id)
+    lookups = [lookup for _, lookup in EXPORT_COLUMNS]
+    return events.order_by('id').values_list(*lookups).iterator(
+        chunk_size=chunk_size or settings.ACTIVITY_LOG_EXPORT_CHUNK_SIZE
+    )
+
+
+def _cell(value):
+    if value is None:
+        return None
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    if isinstance(value, (bool, int, str)):
+        return value
+    return str(value)  # UUID
+
+
+def iter_ndjson(rows):
+    names = [name for name, _ in EXPORT_COLUMNS]
+    for row in rows:
+        yield json.dumps(dict(zip(names, map(_cell, row))), separators=(',', ':')) + '\n'
+
+
+def iter_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([name for name, _ in EXPORT_COLUMNS])
+    for row in rows:
+        writer.writerow(['' if value is None else _cell(value) for value in row])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # Header only, for an empty export
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def iter_export(rows, export_format='ndjson', compress=False):
+    """
+    Encoded export body as a stream of byte chunks; memory use does not
+    depend on the number of rows
+    """
+    lines = iter_csv(rows) if export_format == 'csv' else iter_ndjson(rows)
+    # wbits=31 writes a gzip header and trailer around the deflate stream
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+
+    pending = []
+    pending_size = 0
+    for line in lines:
+        pending.append(line)
+        pending_size += len(line)
+        if pending_size < WRITE_BUFFER_SIZE:
+            continue
+        data = ''.join(pending).encode('utf-8')
+        pending = []
+        pending_size = 0
+        if compressor is not None:
+            data = compressor.compress(data)
+        if data:
+            yield data
+
+    data = ''.join(pending).encode('utf-8')
+    if compressor is not None:
+        data = compressor.compress(data) + compressor.flush()
+    if data:
+        yield data
+
+
+def latest_event_id():
+    return FileAccess.objects.order_by('-id').values_list('id', flat=True).first() or 0
@@ -0,0 +1,290 @@
+"""
+Offline stand-in for the Google Drive v3 API, backed by a local SQLite file.
+
+It implements the subset of the service object this app uses (files.list,
+files.get, files.get_media and the changes feed) closely enough that the
+real code paths, including MediaIoBaseDownload, run against it unchanged.
+Select it with GOOGLE_DRIVE_BACKEND=fake and fill it with
+`manage.py fake_drive seed`.
+"""
+import hashlib
+import random
+import re
+import sqlite3
+from datetime import datetime, timezone
+import httplib2
+from googleapiclient.errors import HttpError
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    parent TEXT NOT NULL,
+    mime_type TEXT NOT NULL DEFAULT 'text/plain',
+    size INTEGER NOT NULL,
+    modified_time TEXT NOT NULL,
+    md5 TEXT NOT NULL,
+    content BLOB NOT NULL,
+    trashed INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS files_parent ON files (parent, trashed);
+CREATE TABLE IF NOT EXISTS changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    file_id TEXT NOT NULL,
+    removed INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+PARENT_RE = re.compile(r"'([^']+)' in parents")
+URI_PREFIX = 'fake-drive://files/'
+
+
+def now_rfc3339():
+    return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+
+
+def sample_content(file_id, version=0):
+    lines = [f"Fake Drive file {file_id}, revision {version}"]
+    lines += [f"line {i}: lorem ipsum dolor sit amet" for i in range(1, 1 + len(file_id) % 7 + 3)]
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+class _Request:
+    """
+    Mimics googleapiclient.http.HttpRequest for execute() and media downloads
+    """
+
+    def __init__(self, http, uri=None, result=None):
+        self.http = http
+        self.uri = uri
+        self.headers = {}
+        self._result = result
+
+    def execute(self, num_retries=0):
+        return self._result() if callable(self._result) else self._result
+
+
+class _FakeHttp:
+    """
+    Serves get_media ranges the way Drive does, for MediaIoBaseDownload
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    def request(self, uri, method='GET', body=None, headers=None, **kwargs):
+        file_id = uri[len(URI_PREFIX):]
+        content = self.store.get_content(file_id)
+        if content is None:
+            resp = httplib2.Response({'status': 404})
+            return resp, b'File not found'
+
+        start, end = 0, len(content) - 1
+        range_header = (headers or {}).get('range')
+        if range_header:
+            first, last = range_header[len('bytes='):].split('-')
+            start, end = int(first), min(int(last), len(content) - 1)
+        if len(content) == 0 or start >= len(content):
+            return httplib2.Response({'status': 416, 'content-range': f'bytes */{len(content)}'}), b''
+
+        chunk = content[start:end + 1]
+        return httplib2.Response({
+            'status': 206,
+            'content-range': f'bytes {start}-{start + len(chunk) - 1}/{len(content)}'
+        }), chunk
+
+
+class FakeDriveStore:
+    """
+    The SQLite file behind the fake service; also used by the fake_drive command
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def _file_resource(self, row):
+        file_id, name, parent, mime_type, size, modified_time, md5, trashed = row
+        return {
+            'id': file_id,
+            'name': name,
+            'parents': [parent],
+            'mimeType': mime_type,
+            'size': str(size),
+            'modifiedTime': modified_time,
+            'md5Checksum': md5,
+            'trashed': bool(trashed),
+        }
+
+    def get_file(self, file_id):
+        row = self.conn.execute(
+            "SELECT id, name, parent, mime_type, size, modified_time, md5, trashed FROM files WHERE id = ?",
+            (file_id,)
+        ).fetchone()
+        return self._file_resource(row) if row else None
+
+    def get_content(self, file_id):
+        row = self.conn.execute("SELECT content FROM files WHERE id = ?", (file_id,)).fetchone()
+        return bytes(row[0]) if row else None
+
+    def list_files(self, parent, page_size, page_token):
+        after = int(page_token or 0)
+        rows = self.conn.execute(
+            "SELECT rowid, id, name, parent, mime_type, size, modified_time, md5, trashed FROM files "
+            "WHERE parent = ? AND trashed = 0 AND mime_type = 'text/plain' AND rowid > ? "
+            "ORDER BY rowid LIMIT ?",
+            (parent, after, page_size + 1)
+        ).fetchall()
+        result = {'files': [self._file_resource(row[1:]) for row in rows[:page_size]]}
+        if len(rows) > page_size:
+            result['nextPageToken'] = str(rows[page_size - 1][0])
+        return result
+
+    def start_page_token(self):
+        row = self.conn.execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()
+        return str(row[0] + 1)
+
+    def list_changes(self, page_token, page_size):
+        start = int(page_token)
+        rows = self.conn.execute(
+            "SELECT seq, file_id, removed FROM changes WHERE seq >= ? ORDER BY seq LIMIT ?",
+            (start, page_size + 1)
+        ).fetchall()
+        changes = []
+        for seq, file_id, removed in rows[:page_size]:
+            change = {'fileId': file_id, 'removed': bool(removed)}
+            if not removed:
+                change['file'] = self.get_file(file_id)
+            changes.append(change)
+        result = {'changes': changes}
+        if len(rows) > page_size:
+            result['nextPageToken'] = str(rows[page_size][0])
+        else:
+            result['newStartPageToken'] = str((rows[-1][0] if rows else start - 1) + 1)
+        return result
+
+    def _record_changes(self, file_ids, removed=False):
+        self.conn.executemany(
+            "INSERT INTO changes (file_id, removed) VALUES (?, ?)",
+            [(file_id, int(removed)) for file_id in file_ids]
+        )
+
+    def seed(self, parent, count, batch_size=10000):
+        """
+        Add `count` new files to a folder
+        """
+        start = self.conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+        for batch_start in range(start, start + count, batch_size):
+            rows = []
+            for i in range(batch_start, min(batch_start + batch_size, start + count)):
+                file_id = f"fake-{i:08d}"
+                content = sample_content(file_id)
+                rows.append((file_id, f"document-{i:08d}.txt", parent, len(content),
+                             now_rfc3339(), hashlib.md5(content).hexdigest(), content))
+            self.conn.executemany(
+                "INSERT INTO files (id, name, parent, size, modified_time, md5, content) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            self._record_changes(row[0] for row in rows)
+        self.conn.commit()
+
+    def put_file(self, parent, name, content, file_id=None):
+        """
+        Create or replace a single file with the given content
+        """
+        file_id = file_id or 'fake-' + hashlib.sha1(f"{parent}/{name}".encode('utf-8')).hexdigest()[:16]
+        self.conn.execute(
+            "INSERT OR REPLACE INTO files (id, name, parent, size, modified_time, md5, content) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (file_id, name, parent, len(content), now_rfc3339(),
+             hashlib.md5(content).hexdigest(), content)
+        )
+        self._record_changes([file_id])
+        self.conn.commit()
+        return file_id
+
+    def _random_ids(self, count):
+        ids = [row[0] for row in self.conn.execute("SELECT id FROM files WHERE trashed = 0")]
+        return random.sample(ids, min(count, len(ids)))
+
+    def touch(self, count):
+        """
+        Rewrite the content of `count` random files
+        """
+        file_ids = self._random_ids(count)
+        for file_id in file_ids:
+            content = sample_content(file_id, version=random.randint(1, 10 ** 6))
+            self.conn.execute(
+                "UPDATE files SET content = ?, size = ?, md5 = ?, modified_time = ? WHERE id = ?",
+                (content, len(content), hashlib.md5(content).hexdigest(), now_rfc3339(), file_id)
+            )
+        self._record_changes(file_ids)
+        self.conn.commit()
+        return file_ids
+
+    def trash(self, count):
+        """
+        Move `count` random files to the trash
+        """
+        file_ids = self._random_ids(count)
+        self.conn.executemany("UPDATE files SET trashed = 1 WHERE id = ?", [(i,) for i in file_ids])
+        self._record_changes(file_ids)
+        self.conn.commit()
+        return file_ids
+
+
+class _FilesResource:
+    def __init__(self, service):
+        self.service = service
+
+    def list(self, q='', pageSize=100, pageToken=None, fields=None, **kwargs):
+        match = PARENT_RE.search(q or '')
+        parent = match.group(1) if match else ''
+        return _Request(self.service.http, result=lambda: self.service.store.list_files(
+            parent, pageSize, pageToken))
+
+    def get(self, fileId, fields=None, **kwargs):
+        def result():
+            resource = self.service.store.get_file(fileId)
+            if resource is None:
+                raise HttpError(httplib2.Response({'status': 404}), b'File not found')
+            return resource
+        return _Request(self.service.http, result=result)
+
+    def get_media(self, fileId, **kwargs):
+        return _Request(self.service.http, uri=URI_PREFIX + fileId)
+
+
+class _ChangesResource:
+    def __init__(self, service):
+        self.service = service
+
+    def getStartPageToken(self, **kwargs):
+        return _Request(self.service.http, result=lambda: {
+            'startPageToken': self.service.store.start_page_token()
+        })
+
+    def list(self, pageToken, pageSize=100, fields=None, **kwargs):
+        return _Request(self.service.http, result=lambda: self.service.store.list_changes(
+            pageToken, pageSize))
+
+
+class FakeDriveService:
+    """
+    Drop-in replacement for the object returned by build('drive', 'v3')
+    """
+
+    def __init__(self, path):
+        self.store = FakeDriveStore(path)
+        self.http = _FakeHttp(self.store)
+
+    def files(self):
+        return _FilesResource(self)
+
+    def changes(self):
+        return _ChangesResource(self)
@@ -0,0 +1,336 @@
+import json
+import mmap
+import multiprocessing
+import os
+import re
+import time
+from django.conf import settings
+from . import metrics
+from .compression import is_framed, local_size, wrap_local
+
+# Seconds a worker gets past the time budget to stop and send its summary
+WORKER_GRACE = 1.0
+
+
+def compile_pattern(pattern, ignore_case=False, fixed=False):
+    """
+    Compile a user pattern for searching bytes; raises re.error
+    """
+    source = re.escape(pattern) if fixed else pattern
+    flags = re.MULTILINE | (re.IGNORECASE if ignore_case else 0)
+    return re.compile(source.encode('utf-8'), flags)
+
+
+def _decode_line(mm, start, end, max_line_bytes):
+    end = min(end, start + max_line_bytes)
+    line = mm[start:end]
+    if line.endswith(b'\r'):
+        line = line[:-1]
+    return line.decode('utf-8', errors='replace')
+
+
+def _line_end(mm, pos, size):
+    end = mm.find(b'\n', pos)
+    return size if end == -1 else end
+
+
+def _context_before(mm, line_start, count, max_line_bytes):
+    lines = []
+    end = line_start - 1
+    while len(lines) < count and end >= 0:
+        start = mm.rfind(b'\n', 0, end) + 1
+        lines.append(_decode_line(mm, start, end, max_line_bytes))
+        end = start - 1
+    lines.reverse()
+    return lines
+
+
+def _context_after(mm, line_end, count, size, max_line_bytes):
+    lines = []
+    start = line_end + 1
+    while len(lines) < count and start < size:
+        end = _line_end(mm, start, size)
+        lines.append(_decode_line(mm, start, end, max_line_bytes))
+        start = end + 1
+    return lines
+
+
+def _mapped_windows(mm, size, window_size):
+    pos = 0
+    while pos < size:
+        end = mm.find(b'\n', min(pos + window_size, size))
+        window_end = size if end == -1 else end + 1
+        if hasattr(mm, 'madvise'):
+            # The window is read once, front to back
+            mm.madvise(mmap.MADV_SEQUENTIAL, pos - pos % mmap.PAGESIZE, window_end - pos + pos % mmap.PAGESIZE)
+        yield mm, pos, window_end, 0
+        pos = window_end
+
+
+def _framed_windows(f, window_size, context):
+    """
+    Windows of a file compressed at rest, inflated as they are scanned.
+    Each buffer holds the `context` lines before the window, the window
+    and at least `context` lines after it, so matches near the edges get
+    the same context lines as in an mmapped file.
+    """
+    base = 0
+    prefix = b''
+    pending = b''
+    eof = False
+    while True:
+        while True:
+            cut = pending.find(b'\n', window_size)
+            if eof or (cut != -1 and pending.count(b'\n', cut + 1) >= context):
+                break
+            data = f.read(window_size)
+            eof = not data
+            pending += data
+        window_end = len(pending) if cut == -1 else cut + 1
+        if not window_end:
+            return
+        buffer = prefix + pending
+        yield buffer, len(prefix), len(prefix) + window_end, base - len(prefix)
+        base += window_end
+        kept = buffer[:len(prefix) + window_end]
+        pending = pending[window_end:]
+        start = len(kept)
+        for _ in range(context):
+            if start == 0:
+                break
+            start = kept.rfind(b'\n', 0, start - 1) + 1
+        prefix = kept[start:]
+
+
+def grep_lines(path, regex, context=0, max_matches=None, time_budget=None, window_size=None,
+               max_line_bytes=None):
+    """
+    Yield NDJSON-ready records for the lines of `path` that match `regex`.
+
+    The file is mmapped and scanned in windows of about `window_size` bytes
+    that always end on a newline, so a line is never split between two
+    windows and only one window's worth of data is touched at a time (a
+    file compressed at rest is inflated window by window instead). Each
+    matching line is reported once, as {"type": "match", "line", "offset",
+    "text", "before", "after"} with zero-based line numbers. A progress
+    record is emitted at least once a second while nothing matches, which
+    lets the server notice a client that went away. The last record is a
+    summary saying whether the scan stopped early and why.
+
+    The time budget is only checked between matches and windows; a
+    pattern that backtracks for long inside one search() is stopped by
+    running the scan in a worker process (see scan_file).
+    """
+    max_matches = max_matches or settings.GREP_MAX_MATCHES
+    time_budget = time_budget or settings.GREP_TIME_BUDGET
+    window_size = window_size or settings.GREP_WINDOW_SIZE
+    max_line_bytes = max_line_bytes or settings.GREP_MAX_LINE_BYTES
+    started = time.monotonic()
+    deadline = started + time_budget
+    next_progress = started + 1
+    matches = 0
+    stopped = None
+    pos = 0
+    line = 0
+
+    with open(path, 'rb') as f:
+        mm = None
+        if is_framed(f):
+            reader = wrap_local(f)
+            size = reader.seek(0, os.SEEK_END)
+            reader.seek(0)
+            windows = _framed_windows(reader, window_size, context)
+        else:
+            size = os.fstat(f.fileno()).st_size
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+            windows = _mapped_windows(mm, size, window_size)
+        try:
+            # Positions are within `buffer`; `base` is where it starts in the file
+            for buffer, window_start, window_end, base in windows:
+                buffer_size = len(buffer)
+                counted = window_start
+                search_from = window_start
+                while True:
+                    match = regex.search(buffer, search_from, window_end)
+                    if match is None:
+                        break
+                    if match.start() == window_end and buffer[window_end - 1] == 0x0a:
+                        # Empty match at the start of the next window's first line
+                        break
+                    line_start = buffer.rfind(b'\n', 0, match.start()) + 1
+                    line += buffer[counted:line_start].count(b'\n')
+                    counted = line_start
+                    line_end = _line_end(buffer, match.start(), buffer_size)
+                    yield {
+                        'type': 'match',
+                        'line': line,
+                        'offset': base + line_start,
+                        'text': _decode_line(buffer, line_start, line_end, max_line_bytes),
+                        'before': _context_before(buffer, line_start, context, max_line_bytes) if context else [],
+                        'after': (_context_after(buffer, line_end, context, buffer_size, max_line_bytes)
+                                  if context else []),
+                    }
+                    matches += 1
+                    if matches >= max_matches:
+                        stopped = 'max_matches'
+                        break
+                    if time.monotonic() >= deadline:
+                        stopped = 'time_budget'
+                        break
+                    # One record per line, whatever else matches on it
+                    search_from = line_end + 1
+                    if search_from >= window_end:
+                        break
+
+                line += buffer[counted:window_end].count(b'\n')
+                pos = base + window_end
+                if stopped:
+                    break
+                now = time.monotonic()
+                if now >= deadline and pos < size:
+                    stopped = 'time_budget'
+                    break
+                if now >= next_progress:
+                    next_progress = now + 1
+                    yield {'type': 'progress', 'scanned_bytes': pos, 'size': size, 'matches': matches}
+        finally:
+            windows.close()
+            if mm is not None:
+                mm.close()
+
+    yield {
+        'type': 'summary',
+        'matches': matches,
+        'scanned_bytes': pos,
+        'size': size,
+        'complete': pos >= size and stopped != 'max_matches',
+        'stopped': stopped,
+        'elapsed_ms': round((time.monotonic() - started) * 1000, 1),
+    }
+
+
+def _grep_worker(conn, path, pattern, ignore_case, fixed, context, max_matches, time_budget,
+                 window_size, max_line_bytes):
+    """
+    Worker process body: send grep_lines() records to the parent. Only
+    uses its arguments, not Django settings.
+    """
+    try:
+        regex = compile_pattern(pattern, ignore_case=ignore_case, fixed=fixed)
+        for record in grep_lines(path, regex, context=context, max_matches=max_matches,
+                                 time_budget=time_budget, window_size=window_size,
+                                 max_line_bytes=max_line_bytes):
+            conn.send(record)
+    except (BrokenPipeError, EOFError):
+        pass  # The parent is gone
+    except Exception as e:
+        print(f"Grep worker failed on {path}: {e}")  # Debug log
+    finally:
+        conn.close()
+
+
+def _fork_context():
+    """
+    Forking start method, or None where there is none (Windows). A forked
+    child only reads the file and writes to its pipe, and is killed if it
+    ever stalls, so forking the threaded web process is safe here.
+    """
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        return None
+    return multiprocessing.get_context('fork')
+
+
+def _grep_in_worker(path, pattern, ignore_case, fixed, context, max_matches, time_budget):
+    """
+    grep_lines() in a child process that is killed once the time budget
+    (plus a grace period for the worker to stop on its own) runs out, or
+    when the client goes away; records pass through a pipe
+    """
+    started = time.monotonic()
+    deadline = started + time_budget + WORKER_GRACE
+    size = local_size(path)
+    fork = _fork_context()
+    receiver, sender = fork.Pipe(duplex=False)
+    worker = fork.Process(
+        target=_grep_worker,
+        args=(sender, path, pattern, ignore_case, fixed, context, max_matches, time_budget,
+              settings.GREP_WINDOW_SIZE, settings.GREP_MAX_LINE_BYTES),
+        daemon=True
+    )
+    worker.start()
+    sender.close()
+    matches = scanned = 0
+    stopped = 'error'
+    try:
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                stopped = 'time_budget'
+                metrics.incr('grep.killed')
+                break
+            if not receiver.poll(min(remaining, 1)):
+                # Stuck inside one search(); keep the client (and disconnect detection) going
+                yield {'type': 'progress', 'scanned_bytes': scanned, 'size': size, 'matches': matches}
+                continue
+            try:
+                record = receiver.recv()
+            except EOFError:
+                break  # The worker died without a summary
+            if record['type'] == 'match':
+                matches += 1
+            elif record['type'] == 'progress':
+                scanned = record['scanned_bytes']
+            yield record
+            if record['type'] == 'summary':
+                return
+    finally:
+        receiver.close()
+        if worker.is_alive():
+            worker.kill()
+        worker.join()
+
+    yield {
+        'type': 'summary',
+        'matches': matches,
+        'scanned_bytes': scanned,
+        'size': size,
+        'complete': False,
+        'stopped': stopped,
+        'elapsed_ms': round((time.monotonic() - started) * 1000, 1),
+    }
+
+
+def scan_file(path, pattern, ignore_case=False, fixed=False, context=0, max_matches=None, time_budget=None):
+    """
+    Yield the grep_lines() records for a user pattern, with metrics. With
+    GREP_USE_WORKER the scan runs in a worker process that is killed when
+    it overruns GREP_TIME_BUDGET, as a backtracking pattern can.
+    """
+    max_matches = max_matches or settings.GREP_MAX_MATCHES
+    time_budget = time_budget or settings.GREP_TIME_BUDGET
+    started = time.monotonic()
+    if settings.GREP_USE_WORKER and _fork_context() is not None:
+        records = _grep_in_worker(path, pattern, ignore_case, fixed, context, max_matches, time_budget)
+    else:
+        regex = compile_pattern(pattern, ignore_case=ignore_case, fixed=fixed)
+        records = grep_lines(path, regex, context=context, max_matches=max_matches, time_budget=time_budget)
+    try:
+        for record in records:
+            if record['type'] == 'summary':
+                metrics.incr('grep.matches', record['matches'])
+                if record['stopped'] == 'time_budget':
+                    metrics.incr('grep.timeouts')
+            yield record
+    except GeneratorExit:
+        # The WSGI server closes the iterator when the client disconnects
+        metrics.incr('grep.cancelled')
+        raise
+    finally:
+        records.close()
+        metrics.observe('grep.scan', time.monotonic() - started)
+
+
+def iter_ndjson_records(records):
+    # One write per record: matches reach the client as soon as they are found
+    for record in records:
+        yield (json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n').encode('utf-8')
@@ -0,0 +1,238 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Case, F, When
+from django.utils import timezone
+from .audit import log_access
+from .blobs import reuse_blob
+from .compression import local_size
+from .disk_cache import collect_if_due
+from .models import DownloadJob
+from .paths import local_file_path
+from .search import index_file
+from .singleflight import FlightInProgress
+from .utils import fetch_drive_file
+
+ACTIVE_STATUSES = ('queued', 'running')
+
+# Write bytes_done to the database at most this often per job
+PROGRESS_UPDATE_INTERVAL = 0.5
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    Process-wide bounded pool used to run jobs inside the web process
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.DOWNLOAD_JOB_WORKERS,
+                thread_name_prefix='download-job'
+            )
+        return _executor
+
+
+def submit(job_id, delay=0):
+    """
+    Run a job on the in-process pool, optionally after `delay` seconds
+    """
+    if delay > 0:
+        timer = threading.Timer(delay, submit, args=(job_id,))
+        timer.daemon = True
+        timer.start()
+        return
+    get_executor().submit(run_job, job_id)
+
+
+def enqueue_download(file_id, user=None, ip_address=None, source='user'):
+    """
+    Return the active download job for a file, creating one if needed
+    """
+    with transaction.atomic():
+        job = DownloadJob.objects.filter(
+            file_id=file_id,
+            status__in=ACTIVE_STATUSES
+        ).first()
+        if job is not None:
+            if job.source == 'prefetch' and source == 'user':
+                # Someone is waiting for it now, so it no longer counts as a prefetch
+                DownloadJob.objects.filter(pk=job.pk).update(
+                    source='user', requested_by=user, ip_address=ip_address
+                )
+                job.source, job.requested_by, job.ip_address = 'user', user, ip_address
+            return job, False
+
+        job = DownloadJob.objects.create(
+            file_id=file_id,
+            requested_by=user,
+            ip_address=ip_address,
+            source=source,
+            max_attempts=settings.DOWNLOAD_JOB_MAX_ATTEMPTS
+        )
+
+    if settings.DOWNLOAD_JOBS_IN_PROCESS:
+        transaction.on_commit(lambda: submit(job.pk))
+    return job, True
+
+
+def retry_delay(attempts):
+    """
+    Exponential backoff in seconds for the given (1-based) attempt number
+    """
+    delay = settings.DOWNLOAD_JOB_RETRY_BACKOFF * (2 ** max(attempts - 1, 0))
+    return min(delay, settings.DOWNLOAD_JOB_RETRY_MAX_DELAY)
+
+
+def claim_job(job_id):
+    """
+    Atomically move a due job from queued to running; False if someone else got it
+    """
+    now = timezone.now()
+    claimed = DownloadJob.objects.filter(
+        pk=job_id,
+        status='queued',
+        next_attempt_at__lte=now
+    ).update(
+        status='running',
+        attempts=F('attempts') + 1,
+        started_at=now,
+        updated_at=now
+    )
+    return claimed == 1
+
+
+def requeue_stale_jobs():
+    """
+    Put running jobs whose worker stopped reporting progress back in the queue
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.DOWNLOAD_JOB_STALE_AFTER)
+    return DownloadJob.objects.filter(
+        status='running',
+        updated_at__lt=cutoff
+    ).update(status='queued', next_attempt_at=timezone.now())
+
+
+def due_job_ids(limit, exclude=()):
+    """
+    Ids of queued jobs whose next attempt is due, oldest first; jobs
+    someone is waiting for go before prefetches
+    """
+    return list(
+        DownloadJob.objects.filter(
+            status='queued',
+            next_attempt_at__lte=timezone.now()
+        ).exclude(
+            pk__in=list(exclude)
+        ).order_by(
+            Case(When(source='prefetch', then=1), default=0),
+            'next_attempt_at', 'id'
+        ).values_list('id', flat=True)[:limit]
+    )
+
+
+def _progress_reporter(job_id):
+    last_update = [0.0]
+
+    def report(bytes_done, total_bytes):
+        now = time.monotonic()
+        if now - last_update[0] < PROGRESS_UPDATE_INTERVAL:
+            return
+        last_update[0] = now
+        DownloadJob.objects.filter(pk=job_id).update(
+            bytes_done=bytes_done,
+            total_bytes=total_bytes,
+            updated_at=timezone.now()
+        )
+
+    return report
+
+
+def run_job(job_id):
+    """
+    Execute one download job, rescheduling it with backoff on failure
+    """
+    close_old_connections()
+    try:
+        if not claim_job(job_id):
+            return
+
+        job = DownloadJob.objects.select_related('file', 'requested_by').get(pk=job_id)
+        file_metadata = job.file
+        print(f"Running download job {job.pk} for {file_metadata.filename} (attempt {job.attempts})")  # Debug log
+
+        try:
+            local_path = local_file_path(file_metadata.filename)
+            # Content we already hold under another name needs no transfer
+            success = reuse_blob(file_metadata, local_path) is not None or fetch_drive_file(
+                file_metadata.google_drive_id,
+                local_path,
+                progress=_progress_reporter(job.pk)
+            )
+            error = '' if success else 'Failed to download file from Google Drive'
+        except FlightInProgress:
+            success = False
+            error = 'Another worker is still downloading this file'
+        except Exception as e:
+            success = False
+            error = str(e)
+
+        now = timezone.now()
+        if success:
+            # The size of the content, as Drive reports it, even when stored compressed
+            size = local_size(local_path)
+            DownloadJob.objects.filter(pk=job.pk).update(
+                status='succeeded',
+                bytes_done=size,
+                total_bytes=size,
+                error='',
+                finished_at=now,
+                updated_at=now
+            )
+            # Re-read: a user may have taken the job over while it ran
+            source = DownloadJob.objects.filter(pk=job.pk).values_list('source', flat=True).first()
+            file_metadata.is_local = True
+            file_metadata.prefetched_at = now if source == 'prefetch' else None
+            # Only these fields: the download itself pointed content_digest at its blob
+            file_metadata.save(update_fields=['is_local', 'prefetched_at', 'last_modified'])
+            if settings.SEARCH_INDEX_ON_DOWNLOAD:
+                try:
+                    index_file(file_metadata.filename)
+                except Exception as e:
+                    print(f"Failed to index {file_metadata.filename} for search: {e}")  # Debug log
+            collect_if_due()
+        elif job.attempts < job.max_attempts:
+            delay = retry_delay(job.attempts)
+            DownloadJob.objects.filter(pk=job.pk).update(
+                status='queued',
+                error=error,
+                next_attempt_at=now + timedelta(seconds=delay),
+                updated_at=now
+            )
+            print(f"Download job {job.pk} failed, retrying in {delay}s: {error}")  # Debug log
+            if settings.DOWNLOAD_JOBS_IN_PROCESS:
+                submit(job.pk, delay=delay)
+            return
+        else:
+            DownloadJob.objects.filter(pk=job.pk).update(
+                status='failed',
+                error=error,
+                finished_at=now,
+                updated_at=now
+            )
+
+        # Log the final outcome of the download
+        job.refresh_from_db(fields=['requested_by', 'ip_address'])
+        if job.requested_by is not None:
+            log_access(job.requested_by, file_metadata.filename, 'download',
+                       ip_address=job.ip_address, success=success)
+    except Exception as e:
+        print(f"Error running download job {job_id}: {e}")  # Debug log
+    finally:
+        close_old_connections()
@@ -0,0 +1,203 @@
+import os
+import mmap
+import struct
+import threading
+from array import array
+from django.conf import settings
+from .compression import is_framed, wrap_local
+
+# Sidecar layout: header followed by a native-order array('Q') of offsets,
+# where offsets[k] is the byte offset of line k * stride.
+INDEX_MAGIC = b'FVLIDX01'
+INDEX_HEADER = struct.Struct('<8sQQQQ')  # magic, size, mtime_ns, stride, line_count
+SCAN_CHUNK_SIZE = 1024 * 1024
+
+_loaded_indexes = {}
+_loaded_lock = threading.Lock()
+
+
+class LineIndex:
+    """
+    Sparse line-offset index for a single local text file
+    """
+
+    def __init__(self, path, size, mtime_ns, stride, line_count, offsets):
+        self.path = path
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.stride = stride
+        self.line_count = line_count
+        self.offsets = offsets
+
+    def matches(self, stat_result):
+        return (self.size == stat_result.st_size and
+                self.mtime_ns == stat_result.st_mtime_ns)
+
+    def read_lines(self, start, count):
+        """
+        Return up to `count` decoded lines starting at zero-based line `start`
+        """
+        if count <= 0 or start >= self.line_count or self.size == 0:
+            return []
+
+        block = start // self.stride
+        with open(self.path, 'rb') as f:
+            if is_framed(f):
+                return self._read_framed_lines(wrap_local(f), block, start, count)
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                pos = self.offsets[block]
+
+                # At most stride - 1 lines are skipped inside the block
+                for _ in range(start - block * self.stride):
+                    pos = mm.find(b'\n', pos) + 1
+
+                lines = []
+                while len(lines) < count and pos < self.size:
+                    end = mm.find(b'\n', pos)
+                    if end == -1:
+                        end = self.size
+                    line = mm[pos:end]
+                    if line.endswith(b'\r'):
+                        line = line[:-1]
+                    lines.append(line.decode('utf-8', errors='replace'))
+                    pos = end + 1
+                return lines
+
+    def _read_framed_lines(self, f, block, start, count):
+        # Compressed at rest: only the frames holding the block are inflated
+        f.seek(self.offsets[block])
+        for _ in range(start - block * self.stride):
+            f.readline()
+        lines = []
+        while len(lines) < count:
+            line = f.readline()
+            if not line:
+                break
+            line = line.rstrip(b'\n')
+            if line.endswith(b'\r'):
+                line = line[:-1]
+            lines.append(line.decode('utf-8', errors='replace'))
+        return lines
+
+
+def index_path_for(filename):
+    return os.path.join(settings.FILE_INDEX_DIR, f"{filename}.lidx")
+
+
+def build_line_index(path, stride):
+    """
+    Scan a file once and record the byte offset of every `stride`-th line
+    """
+    stat_result = os.stat(path)
+    offsets = array('Q', [0])
+    newlines = 0
+    next_mark = stride
+
+    with open(path, 'rb') as raw:
+        f = wrap_local(raw)
+        base = 0
+        last_byte = b''
+        while True:
+            chunk = f.read(SCAN_CHUNK_SIZE)
+            if not chunk:
+                break
+            chunk_end = newlines + chunk.count(b'\n')
+
+            # Line k starts right after the k-th newline; only walk newline by
+            # newline up to the last mark that falls inside this chunk
+            pos = 0
+            seen = newlines
+            while next_mark <= chunk_end:
+                while seen < next_mark:
+                    pos = chunk.find(b'\n', pos) + 1
+                    seen += 1
+                offsets.append(base + pos)
+                next_mark += stride
+
+            newlines = chunk_end
+            base += len(chunk)
+            last_byte = chunk[-1:]
+
+    line_count = newlines
+    if base and last_byte != b'\n':
+        line_count += 1
+
+    return LineIndex(path, stat_result.st_size, stat_result.st_mtime_ns,
+                     stride, line_count, offsets)
+
+
+def save_line_index(index, sidecar_path):
+    """
+    Persist an index atomically next to the other sidecars
+    """
+    os.makedirs(os.path.dirname(sidecar_path), exist_ok=True)
+    tmp_path = f"{sidecar_path}.tmp{os.getpid()}"
+    with open(tmp_path, 'wb') as f:
+        f.write(INDEX_HEADER.pack(INDEX_MAGIC, index.size, index.mtime_ns,
+                                  index.stride, index.line_count))
+        index.offsets.tofile(f)
+    os.replace(tmp_path, sidecar_path)
+
+
+def load_line_index(path, sidecar_path, stat_result, stride):
+    """
+    Load a persisted index, or None if it is missing or stale
+    """
+    try:
+        with open(sidecar_path, 'rb') as f:
+            header = f.read(INDEX_HEADER.size)
+            if len(header) != INDEX_HEADER.size:
+                return None
+            magic, size, mtime_ns, saved_stride, line_count = INDEX_HEADER.unpack(header)
+            if (magic != INDEX_MAGIC or saved_stride != stride or
+                    size != stat_result.st_size or mtime_ns != stat_result.st_mtime_ns):
+                return None
+            offsets = array('Q')
+            offsets.frombytes(f.read())
+    except (OSError, ValueError, struct.error):
+        return None
+
+    return LineIndex(path, size, mtime_ns, stride, line_count, offsets)
+
+
+def get_line_index(filename):
+    """
+    Return an up-to-date line index for a file in FILES_DIR.
+
+    The index is kept in memory per process and persisted as a sidecar in
+    FILE_INDEX_DIR; it is rebuilt whenever the file's size or mtime changes.
+    """
+    path = os.path.join(settings.FILES_DIR, filename)
+    stat_result = os.stat(path)
+    stride = settings.FILE_LINE_INDEX_STRIDE
+
+    with _loaded_lock:
+        index = _loaded_indexes.get(path)
+    if index is not None and index.stride == stride and index.matches(stat_result):
+        return index
+
+    sidecar_path = index_path_for(filename)
+    index = load_line_index(path, sidecar_path, stat_result, stride)
+    if index is None:
+        index = build_line_index(path, stride)
+        try:
+            save_line_index(index, sidecar_path)
+        except OSError as e:
+            print(f"Failed to persist line index for {filename}: {e}")
+
+    with _loaded_lock:
+        _loaded_indexes[path] = index
+    return index
+
+
+def discard_line_index(filename):
+    """
+    Drop the cached and persisted index for a file
+    """
+    path = os.path.join(settings.FILES_DIR, filename)
+    with _loaded_lock:
+        _loaded_indexes.pop(path, None)
+    try:
+        os.remove(index_path_for(filename))
+    except FileNotFoundError:
+        pass
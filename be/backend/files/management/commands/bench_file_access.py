@@ -0,0 +1,172 @@
+import datetime
+import random
+import statistics
+import time
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+from authentication.models import User
+from files.activity import day_start, prune_events, rollup_range
+from files.models import FileAccess, FileAccessDailyRollup
+
+
+class Command(BaseCommand):
+    help = (
+        'Time the FileAccess history, retention and dashboard queries on a large synthetic '
+        'event table. Rows are inserted inside a transaction that is rolled back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000000, help='Synthetic events to insert')
+        parser.add_argument('--days', type=int, default=365, help='Days the events are spread over')
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--files', type=int, default=20000)
+        parser.add_argument(
+            '--working-set', type=int, default=20,
+            help='Files each user keeps returning to, drawn with a skew towards popular files'
+        )
+        parser.add_argument('--repeat', type=int, default=5, help='Timed runs per query')
+
+    def time_it(self, fn, repeat):
+        samples = []
+        result = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = fn()
+            samples.append(time.perf_counter() - start)
+        return statistics.median(samples), result
+
+    def populate(self, rows, days, working_sets, roles):
+        table = FileAccess._meta.db_table
+        sql = (f'INSERT INTO "{table}" (user_id, user_role, filename, action, timestamp, ip_address, success) '
+               'VALUES (%s, %s, %s, %s, %s, %s, %s)')
+        sqlite = connection.vendor == 'sqlite'
+        first = timezone.now() - datetime.timedelta(days=days)
+        step = datetime.timedelta(days=days) / rows
+        user_ids = list(working_sets)
+
+        # Events arrive in time order, like the real append-only log
+        with connection.cursor() as cursor:
+            for chunk_start in range(0, rows, 50000):
+                batch = []
+                for i in range(chunk_start, min(chunk_start + 50000, rows)):
+                    ts = first + step * i
+                    user_id = random.choice(user_ids)
+                    batch.append((
+                        user_id,
+                        roles[user_id],
+                        random.choice(working_sets[user_id]),
+                        'view' if random.random() < 0.9 else 'download',
+                        ts.strftime('%Y-%m-%d %H:%M:%S.%f') if sqlite else ts,
+                        '127.0.0.1',
+                        random.random() < 0.97,
+                    ))
+                cursor.executemany(sql, batch)
+
+    def scan_time(self, sql, params, repeat):
+        """
+        The same query with SQLite told not to use any index, for comparison
+        """
+        def run():
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                return cursor.fetchall()
+        return self.time_it(run, repeat)[0]
+
+    def report(self, label, indexed, scan=None):
+        line = f"{label:<40} {indexed * 1000:>10.1f}ms"
+        if scan is not None:
+            line += f" {scan * 1000:>10.1f}ms {scan / indexed:>7.1f}x"
+        self.stdout.write(line)
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        days = options['days']
+        repeat = options['repeat']
+        sqlite = connection.vendor == 'sqlite'
+        table = FileAccess._meta.db_table
+
+        with transaction.atomic():
+            users = User.objects.bulk_create([
+                User(username=f"bench-user-{i:05d}", password='!', role=random.choice(['Manager', 'Employee']))
+                for i in range(options['users'])
+            ])
+            user_ids = [user.pk for user in users]
+            filenames = [f"bench-{i:06d}.txt" for i in range(options['files'])]
+            popularity = [1 / (rank + 1) for rank in range(len(filenames))]
+            working_sets = {
+                user_id: random.choices(filenames, weights=popularity, k=options['working_set'])
+                for user_id in user_ids
+            }
+
+            started = time.perf_counter()
+            self.populate(rows, days, working_sets, {user.pk: user.role for user in users})
+            insert_time = time.perf_counter() - started
+            if sqlite:
+                with connection.cursor() as cursor:
+                    cursor.execute('ANALYZE')
+            self.stdout.write(f"Backend: {connection.vendor}, {rows} events over {days} days, "
+                              f"inserted in {insert_time:.1f}s ({rows / insert_time:,.0f} rows/s)")
+            header = f"{'query':<40} {'indexed':>12}"
+            if sqlite:
+                header += f" {'no index':>12} {'speedup':>8}"
+            self.stdout.write(header)
+
+            user_id = user_ids[0]
+            filename = working_sets[user_id][0]
+            now = timezone.now()
+            recent = now - datetime.timedelta(days=1)
+
+            # Latest activity of one user / one file
+            indexed, _ = self.time_it(
+                lambda: list(FileAccess.objects.filter(user_id=user_id).order_by('-timestamp')
+                             .values_list('id', flat=True)[:50]), repeat)
+            scan = self.scan_time(
+                f'SELECT id FROM "{table}" NOT INDEXED WHERE user_id = %s ORDER BY timestamp DESC LIMIT 50',
+                [user_id], repeat) if sqlite else None
+            self.report('latest 50 events of a user', indexed, scan)
+
+            indexed, _ = self.time_it(
+                lambda: list(FileAccess.objects.filter(filename=filename).order_by('-timestamp')
+                             .values_list('id', flat=True)[:50]), repeat)
+            scan = self.scan_time(
+                f'SELECT id FROM "{table}" NOT INDEXED WHERE filename = %s ORDER BY timestamp DESC LIMIT 50',
+                [filename], repeat) if sqlite else None
+            self.report('latest 50 events of a file', indexed, scan)
+
+            indexed, _ = self.time_it(lambda: FileAccess.objects.filter(timestamp__gte=recent).count(), repeat)
+            scan = self.scan_time(
+                f'SELECT COUNT(*) FROM "{table}" NOT INDEXED WHERE timestamp >= %s',
+                [recent.strftime('%Y-%m-%d %H:%M:%S.%f')], repeat) if sqlite else None
+            self.report('events in the last 24h', indexed, scan)
+
+            # Dashboard: top files of the last 30 days, raw events vs rollups
+            window_start = timezone.localdate() - datetime.timedelta(days=29)
+            raw_time, _ = self.time_it(
+                lambda: list(FileAccess.objects.filter(timestamp__gte=day_start(window_start)).order_by()
+                             .values('filename').annotate(total=Count('id')).order_by('-total')[:20]), 1)
+            self.report('top 20 files, 30 days, raw events', raw_time)
+
+            started = time.perf_counter()
+            rollup_rows = rollup_range(timezone.localdate() - datetime.timedelta(days=days), timezone.localdate())
+            rollup_time = time.perf_counter() - started
+            self.stdout.write(f"{'build rollups for all days':<40} {rollup_time * 1000:>10.1f}ms "
+                              f"({rollup_rows} rows)")
+
+            rollup_query_time, _ = self.time_it(
+                lambda: list(FileAccessDailyRollup.objects.filter(day__gte=window_start).order_by()
+                             .values('filename').annotate(total=Sum('count')).order_by('-total')[:20]), repeat)
+            self.report('top 20 files, 30 days, rollups', rollup_query_time)
+
+            # Retention: one bounded batch of the oldest events
+            cutoff = day_start(timezone.localdate() - datetime.timedelta(days=days // 2))
+            prune_time, removed = self.time_it(lambda: prune_events(cutoff, batch_size=5000), 1)
+            self.stdout.write(f"{'prune to half the period (5000/batch)':<40} {prune_time * 1000:>10.1f}ms "
+                              f"({removed} events, {removed / prune_time:,.0f} rows/s)")
+
+            if options['verbosity'] > 1:
+                plan = FileAccess.objects.filter(user_id=user_id).order_by('-timestamp')[:50].explain()
+                self.stdout.write(f"  user history plan: {plan}")
+
+            transaction.set_rollback(True)
@@ -0,0 +1,90 @@
+import random
+import statistics
+import time
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from files.models import ROLE_BITS, FileMetadata, roles_to_mask
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the JSON allowed_roles scan with the indexed role_mask filter. '
+        'Synthetic rows are inserted inside a transaction that is rolled back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', type=int, nargs='+', default=[10000, 100000, 1000000],
+            help='Catalog sizes to benchmark'
+        )
+        parser.add_argument('--repeat', type=int, default=5, help='Timed runs per query')
+        parser.add_argument('--role', default='Manager', choices=list(ROLE_BITS))
+
+    def json_scan(self, role):
+        """
+        The allowed_roles containment query, the way each backend can run it
+        """
+        if connection.features.supports_json_field_contains:
+            return FileMetadata.objects.filter(allowed_roles__contains=[role])
+        # SQLite has no JSON containment lookup; json_each is the equivalent scan
+        table = FileMetadata._meta.db_table
+        return FileMetadata.objects.extra(
+            where=[f'EXISTS (SELECT 1 FROM json_each("{table}"."allowed_roles") WHERE json_each.value = %s)'],
+            params=[role]
+        )
+
+    def time_query(self, queryset, repeat):
+        samples = []
+        rows = 0
+        for _ in range(repeat):
+            start = time.perf_counter()
+            rows = len(list(queryset.values_list('id', flat=True)))
+            samples.append(time.perf_counter() - start)
+        return statistics.median(samples), rows
+
+    def populate(self, count):
+        roles = list(ROLE_BITS)
+        batch = []
+        for i in range(count):
+            allowed = [role for role in roles if random.random() < 0.4] or ['Admin']
+            batch.append(FileMetadata(
+                filename=f"bench-{i:08d}.txt",
+                size=random.randint(1, 10 ** 6),
+                allowed_roles=allowed,
+                role_mask=roles_to_mask(allowed)
+            ))
+            if len(batch) == 10000:
+                FileMetadata.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            FileMetadata.objects.bulk_create(batch)
+
+    def handle(self, *args, **options):
+        role = options['role']
+        repeat = options['repeat']
+        self.stdout.write(f"Backend: {connection.vendor}, role: {role}, median of {repeat} runs")
+        self.stdout.write(f"{'files':>10} {'matches':>10} {'json scan':>12} {'role_mask':>12} {'speedup':>8}")
+
+        for size in options['sizes']:
+            with transaction.atomic():
+                FileMetadata.objects.all().delete()
+                self.populate(size)
+                with connection.cursor() as cursor:
+                    if connection.vendor in ('sqlite', 'postgresql'):
+                        cursor.execute('ANALYZE')
+
+                json_time, json_rows = self.time_query(self.json_scan(role), repeat)
+                mask_queryset = FileMetadata.objects.visible_to_role(role)
+                mask_time, mask_rows = self.time_query(mask_queryset, repeat)
+                plan = mask_queryset.values_list('id', flat=True).explain()
+
+                if json_rows != mask_rows:
+                    self.stderr.write(f"Row count mismatch: json={json_rows} mask={mask_rows}")
+                self.stdout.write(
+                    f"{size:>10} {mask_rows:>10} {json_time * 1000:>10.1f}ms "
+                    f"{mask_time * 1000:>10.1f}ms {json_time / mask_time:>7.1f}x"
+                )
+                if options['verbosity'] > 1:
+                    self.stdout.write(f"  plan: {plan}")
+
+                transaction.set_rollback(True)
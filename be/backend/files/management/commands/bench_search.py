@@ -0,0 +1,120 @@
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from files.search import index_shard, index_stats, search, shard_for, shard_path
+
+
+class Command(BaseCommand):
+    help = (
+        'Build the search index over a synthetic corpus in a temporary directory and '
+        'report build throughput and query latency. FILES_DIR is not touched.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size-mb', type=int, default=10240, help='Corpus size in MB')
+        parser.add_argument('--files', type=int, default=2000, help='Number of files in the corpus')
+        parser.add_argument('--shards', type=int, default=8)
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--repeat', type=int, default=20, help='Timed runs per query')
+        parser.add_argument('--keep', metavar='DIR', help='Build in DIR and keep it afterwards')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+        root = options['keep'] or tempfile.mkdtemp(prefix='bench-search-')
+        files_dir = os.path.join(root, 'files')
+        index_dir = os.path.join(root, 'search')
+        os.makedirs(files_dir, exist_ok=True)
+        try:
+            with override_settings(FILES_DIR=files_dir, SEARCH_INDEX_DIR=index_dir,
+                                   SEARCH_INDEX_SHARDS=options['shards']):
+                filenames = self.generate(files_dir, options['size_mb'], max(options['files'], 1))
+                self.build(files_dir, filenames, options['shards'], max(options['workers'], 1))
+                self.query(filenames, max(options['repeat'], 1))
+        finally:
+            if not options['keep']:
+                shutil.rmtree(root, ignore_errors=True)
+
+    def generate(self, files_dir, size_mb, file_count):
+        """
+        Files of lines drawn from a Zipf-like vocabulary, with a rare marker
+        phrase planted in a few of them
+        """
+        vocabulary = [''.join(random.choices('abcdefghijklmnopqrstuvwxyz', k=random.randint(3, 10)))
+                      for _ in range(50000)]
+        weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+        lines = [' '.join(random.choices(vocabulary, weights, k=random.randint(8, 18))) + '\n'
+                 for _ in range(20000)]
+        self.vocabulary = vocabulary
+
+        started = time.monotonic()
+        file_size = size_mb * 1024 * 1024 // file_count
+        filenames = []
+        for i in range(file_count):
+            filename = f"bench-{i:06d}.txt"
+            with open(os.path.join(files_dir, filename), 'w') as f:
+                written = 0
+                while written < file_size:
+                    block = ''.join(random.choices(lines, k=1000))
+                    if i % 97 == 0 and written == 0:
+                        block = 'zebra quartz marker\n' + block
+                    f.write(block)
+                    written += len(block)
+            filenames.append(filename)
+        self.stdout.write(f"Generated {file_count} files, {size_mb} MB in {time.monotonic() - started:.1f}s")
+        return filenames
+
+    def build(self, files_dir, filenames, shard_count, workers):
+        work = {}
+        for filename in filenames:
+            work.setdefault(shard_for(filename, shard_count), []).append(filename)
+
+        started = time.monotonic()
+        with ProcessPoolExecutor(max_workers=min(workers, len(work))) as pool:
+            futures = [
+                pool.submit(index_shard, shard_path(shard), shard_count, files_dir, names,
+                            settings.SEARCH_CHUNK_BYTES, True)
+                for shard, names in work.items()
+            ]
+            results = [future.result() for future in futures]
+        elapsed = time.monotonic() - started
+
+        size = sum(result[2] for result in results)
+        stats = index_stats()
+        self.stdout.write(
+            f"Indexed {size / 1024 ** 2:.0f} MB in {elapsed:.1f}s with {min(workers, len(work))} worker(s): "
+            f"{size / 1024 ** 2 / elapsed:.1f} MB/s, {stats['chunks']} chunks, "
+            f"index {stats['index_bytes'] / 1024 ** 2:.0f} MB ({stats['index_bytes'] / size:.0%} of the corpus)"
+        )
+
+    def query(self, filenames, repeat):
+        half = frozenset(filenames[::2])
+        queries = [
+            ('common word', self.vocabulary[0], None),
+            ('mid-frequency word', self.vocabulary[500], None),
+            ('rare word', self.vocabulary[5000], None),
+            ('two words', f"{self.vocabulary[3]} {self.vocabulary[40]}", None),
+            ('phrase', '"zebra quartz marker"', None),
+            ('prefix', self.vocabulary[200][:3] + '*', None),
+            ('common word, role-filtered', self.vocabulary[0], half),
+        ]
+        for label, text, visible in queries:
+            samples = []
+            results = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                results = search(text, visible=visible, limit=20)
+                samples.append(time.perf_counter() - start)
+            samples.sort()
+            p95 = samples[min(int(len(samples) * 0.95), len(samples) - 1)]
+            self.stdout.write(
+                f"{label:28} {len(results):3} result(s)  p50 {statistics.median(samples) * 1000:8.1f}ms  "
+                f"p95 {p95 * 1000:8.1f}ms"
+            )
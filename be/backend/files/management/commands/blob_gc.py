@@ -0,0 +1,58 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from files.blobs import adopt_local_files, blob_stats, collect_blobs
+
+
+class Command(BaseCommand):
+    help = (
+        'Garbage-collect the content-addressed blob store: fix reference counts '
+        'and delete blobs no local file links to any more'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace', type=int, default=settings.BLOB_GC_GRACE,
+            help='Keep unreferenced blobs for this many seconds after their last reference went away'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Catalog rows read and updated per query'
+        )
+        parser.add_argument(
+            '--adopt', action='store_true',
+            help='First move Drive-backed local files that are not blobs yet into the store'
+        )
+        parser.add_argument(
+            '--stats', action='store_true',
+            help='Print blob store usage and exit'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Report what would be adopted, fixed or deleted without changing anything'
+        )
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            for key, value in blob_stats().items():
+                self.stdout.write(f"{key}: {value}")
+            return
+
+        batch_size = max(options['batch_size'], 1)
+        log = lambda message: self.stdout.write(self.style.WARNING(message))
+        started = time.monotonic()
+        stats = {}
+        if options['adopt']:
+            stats.update(adopt_local_files(batch_size=batch_size, dry_run=options['dry_run'], log=log))
+        stats.update(collect_blobs(
+            grace=max(options['grace'], 0),
+            batch_size=batch_size,
+            dry_run=options['dry_run'],
+            log=log
+        ))
+
+        summary = ', '.join(f"{key}={value}" for key, value in sorted(stats.items()))
+        prefix = '[dry run] ' if options['dry_run'] else ''
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}Blob GC finished in {time.monotonic() - started:.2f}s: {summary}"
+        ))
@@ -0,0 +1,72 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from files.disk_cache import EVICTION_POLICIES, cache_stats, collect
+
+
+class Command(BaseCommand):
+    help = (
+        'Enforce the disk quota on FILES_DIR by evicting Drive-backed files, '
+        'and reconcile FileMetadata.is_local with the files actually on disk'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max-bytes', type=int, default=settings.DISK_CACHE_MAX_BYTES,
+            help='Disk quota in bytes (defaults to DISK_CACHE_MAX_BYTES; 0 disables eviction)'
+        )
+        parser.add_argument(
+            '--policy', choices=EVICTION_POLICIES, default=settings.DISK_CACHE_POLICY,
+            help='Evict least recently (lru) or least frequently (lfu) used files first'
+        )
+        parser.add_argument(
+            '--low-watermark', type=float, default=settings.DISK_CACHE_LOW_WATERMARK,
+            help='Evict down to this fraction of the quota'
+        )
+        parser.add_argument(
+            '--min-age', type=int, default=settings.DISK_CACHE_MIN_AGE,
+            help='Never evict files used within this many seconds'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Catalog rows read and updated per query'
+        )
+        parser.add_argument(
+            '--reconcile-only', action='store_true',
+            help='Only fix is_local, do not evict anything'
+        )
+        parser.add_argument(
+            '--stats', action='store_true',
+            help='Print cache usage and exit'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Report what would be evicted or fixed without changing anything'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = max(options['batch_size'], 1)
+        if options['stats']:
+            for key, value in cache_stats(batch_size=batch_size).items():
+                self.stdout.write(f"{key}: {value}")
+            return
+
+        if not 0 < options['low_watermark'] <= 1:
+            raise CommandError('--low-watermark must be in (0, 1]')
+
+        started = time.monotonic()
+        stats = collect(
+            max_bytes=0 if options['reconcile_only'] else options['max_bytes'],
+            policy=options['policy'],
+            low_watermark=options['low_watermark'],
+            min_age=max(options['min_age'], 0),
+            batch_size=batch_size,
+            dry_run=options['dry_run'],
+            log=lambda message: self.stdout.write(self.style.WARNING(message))
+        )
+
+        summary = ', '.join(f"{key}={value}" for key, value in sorted(stats.items()))
+        prefix = '[dry run] ' if options['dry_run'] else ''
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}Cache GC finished in {time.monotonic() - started:.2f}s: {summary}"
+        ))
@@ -0,0 +1,171 @@
+import os
+import stat
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from files.compression import convert_file, is_framed
+from files.disk_cache import scan_local_files
+from files.models import FileMetadata
+
+
+class Command(BaseCommand):
+    help = (
+        'Convert the files in FILES_DIR to compressed-at-rest storage (seekable gzip frames), '
+        'or back to plain files with --decompress. Files are converted in worker processes; '
+        'names linked to the same blob share one inode and are converted once.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+            help='Worker processes'
+        )
+        parser.add_argument(
+            '--decompress', action='store_true',
+            help='Restore compressed files to plain files'
+        )
+        parser.add_argument(
+            '--include-local-only', action='store_true',
+            help='Also convert files without a Drive copy; appending to a compressed file corrupts it'
+        )
+        parser.add_argument(
+            '--min-age', type=int, default=settings.COMPRESS_STORE_MIN_AGE,
+            help='Skip files modified less than this many seconds ago'
+        )
+        parser.add_argument(
+            '--frame-size', type=int, default=settings.COMPRESS_AT_REST_FRAME_SIZE,
+            help='Original bytes per frame'
+        )
+        parser.add_argument(
+            '--level', type=int, default=settings.COMPRESS_AT_REST_LEVEL,
+            help='gzip compression level (1-9)'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Report what would be converted'
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        decompress = options['decompress']
+        groups = self.find_work(options)
+        pending_bytes = sum(group['size'] for group in groups.values())
+        action = 'decompress' if decompress else 'compress'
+        self.stdout.write(f"{len(groups)} file(s) ({pending_bytes} bytes) to {action}")
+        if options['dry_run'] or not groups:
+            return
+
+        stats = Counter()
+        workers = max(min(options['workers'], len(groups)), 1)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                pool.submit(convert_file, group['paths'][0], options['frame_size'], options['level'], decompress): key
+                for key, group in groups.items()
+            }
+            for future in as_completed(futures):
+                group = groups[futures[future]]
+                try:
+                    tmp_path, before, after = future.result()
+                except (OSError, ValueError) as e:
+                    self.stdout.write(self.style.WARNING(f"Skipped {group['paths'][0]}: {e}"))
+                    stats['errors'] += 1
+                    continue
+                if not decompress and after >= before:
+                    os.remove(tmp_path)
+                    stats['incompressible'] += 1
+                    continue
+                try:
+                    replaced = self.replace(group, tmp_path)
+                except OSError as e:
+                    self.stdout.write(self.style.WARNING(f"Could not replace {group['paths'][0]}: {e}"))
+                    stats['errors'] += 1
+                    continue
+                if not replaced:
+                    stats['changed'] += 1
+                    continue
+                stats['converted'] += 1
+                stats['before'] += before
+                stats['after'] += after
+
+        elapsed = time.monotonic() - started
+        if stats['incompressible'] or stats['changed']:
+            self.stdout.write(
+                f"Left {stats['incompressible']} incompressible and {stats['changed']} changed file(s) as they were"
+            )
+        original, compressed = (stats['after'], stats['before']) if decompress else (stats['before'], stats['after'])
+        ratio = original / compressed if compressed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Converted {stats['converted']} file(s): {stats['before']} -> {stats['after']} bytes "
+            f"(compression {ratio:.2f}x) in {elapsed:.2f}s ({workers} worker(s))"
+        ))
+        if stats['converted']:
+            self.stdout.write('Run `manage.py reindex` to refresh the search index for the converted files')
+
+    def find_work(self, options):
+        """
+        Files to convert, grouped by inode: {inode: {'paths', 'size', 'stat'}}
+        """
+        local = scan_local_files()
+        if not options['include_local_only']:
+            drive_backed = set(
+                FileMetadata.objects.exclude(google_drive_id__isnull=True).exclude(google_drive_id='')
+                .values_list('filename', flat=True)
+            )
+            local = {filename: entry for filename, entry in local.items() if filename in drive_backed}
+        # Still being written (e.g. a log that is followed); it may grow in place
+        newest = time.time_ns() - options['min_age'] * 10 ** 9
+
+        groups = defaultdict(lambda: {'paths': [], 'size': 0, 'stat': None})
+        for filename, entry in local.items():
+            if entry.mtime_ns > newest:
+                continue
+            group = groups[entry.inode]
+            group['paths'].append(os.path.join(settings.FILES_DIR, filename))
+            group['size'] = entry.size
+            group['stat'] = (entry.inode, entry.size, entry.mtime_ns)
+
+        # Blobs are the same inode as the names linked to them and are converted with them
+        for root, _, names in os.walk(settings.BLOB_STORE_DIR):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    inode = os.stat(path).st_ino
+                except FileNotFoundError:
+                    continue
+                if inode in groups:
+                    groups[inode]['paths'].append(path)
+
+        work = {}
+        for inode, group in groups.items():
+            try:
+                with open(group['paths'][0], 'rb') as f:
+                    framed = is_framed(f)
+            except OSError:
+                continue
+            if framed == options['decompress']:
+                work[inode] = group
+        return work
+
+    def replace(self, group, tmp_path):
+        """
+        Put the converted file in place of every path of the group, unless
+        the file changed while it was converted. Each name is swapped
+        atomically, so readers see either version but never a partial one.
+        """
+        first = group['paths'][0]
+        try:
+            current = os.stat(first)
+            if (current.st_ino, current.st_size, current.st_mtime_ns) != group['stat']:
+                return False
+            # Keep the mode (blobs are read-only) and the mtime the LRU eviction goes by
+            os.chmod(tmp_path, stat.S_IMODE(current.st_mode))
+            os.utime(tmp_path, ns=(current.st_atime_ns, current.st_mtime_ns))
+            for path in group['paths']:
+                link_path = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.{os.getpid()}.part")
+                os.link(tmp_path, link_path)
+                os.replace(link_path, path)
+            return True
+        finally:
+            os.remove(tmp_path)
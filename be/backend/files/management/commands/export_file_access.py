@@ -0,0 +1,56 @@
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+from files.export import EXPORT_FORMATS, export_rows, iter_export, latest_event_id
+from files.models import FileAccess
+
+
+class Command(BaseCommand):
+    help = (
+        'Stream FileAccess events in id order as NDJSON or CSV. Interrupted exports '
+        'can be resumed with --after-id set to the last id written.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=list(EXPORT_FORMATS), default='ndjson')
+        parser.add_argument('--gzip', action='store_true', help='Gzip the output')
+        parser.add_argument('--output', '-o', help='File to write (default: stdout)')
+        parser.add_argument('--after-id', type=int, help='Export only events with a larger id')
+        parser.add_argument('--since', help='Only events at or after this ISO 8601 time')
+        parser.add_argument('--until', help='Only events before this ISO 8601 time')
+        parser.add_argument('--chunk-size', type=int, help='Rows fetched per query')
+
+    def parse_time(self, value):
+        if value is None:
+            return None
+        parsed = parse_datetime(value)
+        if parsed is None:
+            raise CommandError(f"Invalid datetime: {value}")
+        return parsed
+
+    def handle(self, *args, **options):
+        events = FileAccess.objects.all()
+        since = self.parse_time(options['since'])
+        until = self.parse_time(options['until'])
+        if since is not None:
+            events = events.filter(timestamp__gte=since)
+        if until is not None:
+            events = events.filter(timestamp__lt=until)
+
+        through_id = latest_event_id()
+        rows = export_rows(events, after_id=options['after_id'], through_id=through_id,
+                           chunk_size=options['chunk_size'])
+
+        out = open(options['output'], 'wb') if options['output'] else sys.stdout.buffer
+        written = 0
+        try:
+            for chunk in iter_export(rows, options['format'], compress=options['gzip']):
+                out.write(chunk)
+                written += len(chunk)
+        finally:
+            if options['output']:
+                out.close()
+            else:
+                out.flush()
+
+        self.stderr.write(f"Exported events through id {through_id} ({written} bytes)")
@@ -0,0 +1,48 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from files.fake_drive import FakeDriveStore
+
+
+class Command(BaseCommand):
+    help = 'Populate or modify the offline fake Google Drive (GOOGLE_DRIVE_BACKEND=fake)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['seed', 'touch', 'trash', 'put', 'stats'])
+        parser.add_argument(
+            '--folder', default=settings.GOOGLE_DRIVE_FOLDER_ID,
+            help='Folder that new files are placed in'
+        )
+        parser.add_argument(
+            '--count', type=int, default=100,
+            help='Number of files to create (seed) or modify (touch/trash)'
+        )
+        parser.add_argument('--name', help='File name for put')
+        parser.add_argument('--source', help='Local file whose content put uploads')
+
+    def handle(self, *args, **options):
+        store = FakeDriveStore(settings.FAKE_DRIVE_PATH)
+        try:
+            action = options['action']
+            if action == 'seed':
+                store.seed(options['folder'], options['count'])
+                self.stdout.write(f"Added {options['count']} files to {options['folder']}")
+            elif action == 'touch':
+                changed = store.touch(options['count'])
+                self.stdout.write(f"Modified {len(changed)} files")
+            elif action == 'trash':
+                trashed = store.trash(options['count'])
+                self.stdout.write(f"Trashed {len(trashed)} files")
+            elif action == 'put':
+                with open(options['source'], 'rb') as f:
+                    file_id = store.put_file(options['folder'], options['name'], f.read())
+                self.stdout.write(f"Stored {options['name']} as {file_id}")
+
+            total, trashed = store.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(trashed), 0) FROM files"
+            ).fetchone()
+            self.stdout.write(self.style.SUCCESS(
+                f"Fake Drive at {settings.FAKE_DRIVE_PATH}: {total} files ({trashed} trashed), "
+                f"changes token {store.start_page_token()}"
+            ))
+        finally:
+            store.close()
@@ -0,0 +1,56 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from files.models import ROLE_BITS
+from files.prefetch import schedule_prefetch
+
+
+class Command(BaseCommand):
+    help = (
+        "Queue downloads of the non-local Drive files each role opens most, "
+        "within a transfer and disk budget"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--roles', default=','.join(ROLE_BITS),
+            help='Comma-separated roles to prefetch for'
+        )
+        parser.add_argument(
+            '--top-k', type=int, default=settings.PREFETCH_TOP_K,
+            help='Files considered per role (defaults to PREFETCH_TOP_K)'
+        )
+        parser.add_argument(
+            '--max-bytes', type=int, default=settings.PREFETCH_MAX_BYTES,
+            help='Bytes queued per run (defaults to PREFETCH_MAX_BYTES)'
+        )
+        parser.add_argument(
+            '--days', type=int, default=settings.PREFETCH_HISTORY_DAYS,
+            help='Rank files by accesses over this many days'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='List the files that would be queued'
+        )
+
+    def handle(self, *args, **options):
+        roles = [role.strip() for role in options['roles'].split(',') if role.strip()]
+        started = time.monotonic()
+        planned, stats = schedule_prefetch(
+            roles=roles,
+            top_k=max(options['top_k'], 0),
+            max_bytes=max(options['max_bytes'], 0),
+            history_days=max(options['days'], 1),
+            dry_run=options['dry_run']
+        )
+
+        for candidate in planned:
+            self.stdout.write(
+                f"{candidate.filename}: {candidate.hits} access(es) by {','.join(candidate.roles)}, "
+                f"{candidate.size} bytes"
+            )
+        summary = ', '.join(f"{key}={value}" for key, value in sorted(stats.items())) or 'nothing to do'
+        prefix = '[dry run] ' if options['dry_run'] else ''
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}Prefetch planned in {time.monotonic() - started:.2f}s: {summary}"
+        ))
@@ -0,0 +1,57 @@
+import datetime
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from files.activity import oldest_event_day, prune_events, retention_cutoff, rollup_range
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete (and optionally archive) FileAccess events older than the retention period. '
+        'The affected days are rolled up first so their counts are kept.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=settings.FILE_ACCESS_RETENTION_DAYS,
+            help='Keep this many days of raw events (defaults to FILE_ACCESS_RETENTION_DAYS)'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help='Events deleted per transaction'
+        )
+        parser.add_argument(
+            '--archive', metavar='PATH',
+            help='Append pruned events to this gzipped JSON-lines file before deleting them'
+        )
+        parser.add_argument(
+            '--skip-rollup', action='store_true',
+            help='Do not roll up the pruned days first'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Report how many events would be removed'
+        )
+
+    def handle(self, *args, **options):
+        cutoff = retention_cutoff(max(options['days'], 0))
+        self.stdout.write(f"Pruning FileAccess events before {cutoff.isoformat()}")
+        started = time.monotonic()
+
+        first_day = oldest_event_day()
+        last_day = cutoff.date() - datetime.timedelta(days=1)
+        if not options['skip_rollup'] and not options['dry_run'] and first_day and first_day <= last_day:
+            written = rollup_range(first_day, last_day)
+            self.stdout.write(f"Rolled up {first_day} to {last_day}: {written} row(s)")
+
+        removed = prune_events(
+            cutoff,
+            batch_size=max(options['batch_size'], 1),
+            archive_path=options['archive'],
+            dry_run=options['dry_run']
+        )
+        prefix = '[dry run] ' if options['dry_run'] else ''
+        verb = 'would remove' if options['dry_run'] else 'removed'
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}Pruning finished in {time.monotonic() - started:.2f}s: {verb} {removed} event(s)"
+        ))
@@ -0,0 +1,108 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from files.disk_cache import scan_local_files
+from files.search import (
+    SearchIndexError, clear_shard, get_shard, index_shard, indexed_documents, remove_document,
+    shard_for, shard_path
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Bring the full-text search index up to date with FILES_DIR. New and changed '
+        'files are indexed with one worker process per shard; removed files are dropped.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+            help='Worker processes (at most one per shard is useful)'
+        )
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Empty every shard and index all files again; reclaims space left by re-indexed files'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Report what would be indexed or dropped'
+        )
+
+    def handle(self, *args, **options):
+        shard_count = settings.SEARCH_INDEX_SHARDS
+        started = time.monotonic()
+
+        if options['full'] and not options['dry_run']:
+            self.reset_shards(shard_count)
+
+        try:
+            local = scan_local_files()
+            by_shard = {shard: [] for shard in range(shard_count)}
+            for filename in local:
+                by_shard[shard_for(filename, shard_count)].append(filename)
+
+            work = {}
+            removed = 0
+            for shard, filenames in by_shard.items():
+                indexed = indexed_documents(shard)
+                work[shard] = [
+                    filename for filename in filenames
+                    if indexed.get(filename) != (local[filename].size, local[filename].mtime_ns)
+                ]
+                for filename in indexed.keys() - local.keys():
+                    removed += 1
+                    if not options['dry_run']:
+                        remove_document(get_shard(shard), filename)
+        except SearchIndexError as e:
+            raise CommandError(str(e))
+
+        pending = sum(len(filenames) for filenames in work.values())
+        pending_bytes = sum(local[filename].size for filenames in work.values() for filename in filenames)
+        self.stdout.write(f"{pending} file(s) ({pending_bytes} bytes) to index, {removed} to drop")
+        if options['dry_run'] or not pending:
+            return
+
+        indexed = chunks = size = 0
+        workers = max(min(options['workers'], sum(1 for filenames in work.values() if filenames)), 1)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(index_shard, shard_path(shard), shard_count, str(settings.FILES_DIR),
+                            filenames, settings.SEARCH_CHUNK_BYTES, options['full'])
+                for shard, filenames in work.items() if filenames
+            ]
+            for future in futures:
+                shard_indexed, shard_chunks, shard_size, errors = future.result()
+                indexed += shard_indexed
+                chunks += shard_chunks
+                size += shard_size
+                for error in errors:
+                    self.stdout.write(self.style.WARNING(f"Skipped {error}"))
+
+        elapsed = time.monotonic() - started
+        rate = size / elapsed / 1024 ** 2 if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {indexed} file(s), {chunks} chunk(s), {size} bytes in {elapsed:.2f}s "
+            f"({rate:.1f} MB/s, {workers} worker(s))"
+        ))
+
+    def reset_shards(self, shard_count):
+        for shard in range(shard_count):
+            try:
+                clear_shard(get_shard(shard))
+            except SearchIndexError:
+                # Built for another shard count; nothing in it is usable
+                self.remove_shard(shard)
+        # Shards beyond the configured count are never queried
+        shard = shard_count
+        while os.path.exists(shard_path(shard)):
+            self.remove_shard(shard)
+            shard += 1
+
+    def remove_shard(self, shard):
+        for suffix in ('', '-wal', '-shm'):
+            try:
+                os.remove(shard_path(shard) + suffix)
+            except FileNotFoundError:
+                pass
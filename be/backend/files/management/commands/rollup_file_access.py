@@ -0,0 +1,41 @@
+import datetime
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from files.activity import oldest_event_day, rollup_range
+
+
+class Command(BaseCommand):
+    help = 'Recompute the daily FileAccess rollups from the raw events'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=2,
+            help='Roll up this many days ending today (default: yesterday and today)'
+        )
+        parser.add_argument('--since', help='First day to roll up (YYYY-MM-DD); overrides --days')
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Roll up every day since the oldest stored event'
+        )
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        if options['all']:
+            first_day = oldest_event_day()
+            if first_day is None:
+                self.stdout.write('No events to roll up')
+                return
+        elif options['since']:
+            first_day = parse_date(options['since'])
+            if first_day is None:
+                raise CommandError(f"Invalid date: {options['since']}")
+        else:
+            first_day = today - datetime.timedelta(days=max(options['days'], 1) - 1)
+
+        started = time.monotonic()
+        written = rollup_range(first_day, today)
+        self.stdout.write(self.style.SUCCESS(
+            f"Rolled up {first_day} to {today}: {written} row(s) in {time.monotonic() - started:.2f}s"
+        ))
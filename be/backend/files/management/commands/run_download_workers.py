@@ -0,0 +1,69 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from files.jobs import due_job_ids, requeue_stale_jobs, run_job
+from files.prefetch import schedule_prefetch
+
+
+class Command(BaseCommand):
+    help = 'Run background workers that process queued Google Drive download jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=settings.DOWNLOAD_JOB_WORKERS,
+            help='Maximum number of downloads running at once'
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=1.0,
+            help='Seconds to wait between queue polls when idle'
+        )
+        parser.add_argument(
+            '--prefetch-interval', type=int, default=settings.PREFETCH_INTERVAL,
+            help='Queue prefetch downloads at startup and then every N seconds (0 disables)'
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Process the jobs that are currently due, then exit'
+        )
+
+    def handle(self, *args, **options):
+        workers = max(options['workers'], 1)
+        poll_interval = options['poll_interval']
+        prefetch_interval = options['prefetch_interval']
+        next_prefetch = time.monotonic()
+        running = {}
+
+        self.stdout.write(f"Starting download workers (concurrency={workers})")
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='download-job') as pool:
+            try:
+                while True:
+                    running = {future: job_id for future, job_id in running.items() if not future.done()}
+
+                    stale = requeue_stale_jobs()
+                    if stale:
+                        self.stdout.write(f"Requeued {stale} stale job(s)")
+
+                    if prefetch_interval > 0 and time.monotonic() >= next_prefetch:
+                        next_prefetch = time.monotonic() + prefetch_interval
+                        try:
+                            _, stats = schedule_prefetch()
+                            if stats['enqueued']:
+                                self.stdout.write(f"Queued {stats['enqueued']} prefetch download(s)")
+                        except Exception as e:
+                            self.stdout.write(self.style.WARNING(f"Prefetch failed: {e}"))
+
+                    free_slots = workers - len(running)
+                    job_ids = []
+                    if free_slots > 0:
+                        job_ids = due_job_ids(free_slots, exclude=running.values())
+                    for job_id in job_ids:
+                        running[pool.submit(run_job, job_id)] = job_id
+
+                    if options['once'] and not job_ids and not running:
+                        break
+                    time.sleep(poll_interval if not job_ids else 0.1)
+            except KeyboardInterrupt:
+                self.stdout.write('Stopping, waiting for running downloads to finish...')
+
+        self.stdout.write(self.style.SUCCESS('Download workers stopped'))
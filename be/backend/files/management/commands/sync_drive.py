@@ -0,0 +1,58 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from files.drive_sync import DriveSync, DriveSyncError
+
+
+class Command(BaseCommand):
+    help = 'Reconcile FileMetadata with the .txt files in the Google Drive folder'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--folder', default=settings.GOOGLE_DRIVE_FOLDER_ID,
+            help='Drive folder id (defaults to GOOGLE_DRIVE_FOLDER_ID)'
+        )
+        parser.add_argument(
+            '--incremental', action='store_true',
+            help='Apply only changes since the last sync, using the stored changes-feed token'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Drive entries reconciled per bulk write'
+        )
+        parser.add_argument(
+            '--prune', action='store_true',
+            help='Delete Drive-backed catalog entries (and local copies) that are gone from the folder'
+        )
+        parser.add_argument(
+            '--roles', default=','.join(settings.DRIVE_SYNC_DEFAULT_ROLES),
+            help='Comma-separated roles granted to newly discovered files'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Report what would change without writing anything'
+        )
+
+    def handle(self, *args, **options):
+        roles = [role.strip() for role in options['roles'].split(',') if role.strip()]
+        sync = DriveSync(
+            options['folder'],
+            batch_size=max(options['batch_size'], 1),
+            default_roles=roles,
+            prune=options['prune'],
+            dry_run=options['dry_run'],
+            log=lambda message: self.stdout.write(self.style.WARNING(message))
+        )
+
+        mode = 'incremental' if options['incremental'] else 'full'
+        self.stdout.write(f"Starting {mode} sync of Drive folder {options['folder']}")
+        started = time.monotonic()
+        try:
+            stats = sync.incremental_sync() if options['incremental'] else sync.full_sync()
+        except DriveSyncError as e:
+            raise CommandError(str(e))
+
+        elapsed = time.monotonic() - started
+        summary = ', '.join(f"{key}={value}" for key, value in sorted(stats.items())) or 'no changes'
+        prefix = '[dry run] ' if options['dry_run'] else ''
+        self.stdout.write(self.style.SUCCESS(f"{prefix}Sync finished in {elapsed:.2f}s: {summary}"))
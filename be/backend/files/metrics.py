@@ -0,0 +1,79 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# Process-local counters and timings, exposed through the metrics endpoint
+_lock = threading.Lock()
+_counters = {}
+_timings = {}
+_gauges = {}
+
+
+def incr(name, amount=1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+def counter(name):
+    with _lock:
+        return _counters.get(name, 0)
+
+
+def observe(name, seconds):
+    """
+    Record one duration sample
+    """
+    with _lock:
+        count, total, maximum = _timings.get(name, (0, 0.0, 0.0))
+        _timings[name] = (count + 1, total + seconds, max(maximum, seconds))
+
+
+@contextmanager
+def timed(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start)
+
+
+def register_gauge(name, fn):
+    """
+    Register a callable whose return value is reported on every snapshot
+    """
+    with _lock:
+        _gauges[name] = fn
+
+
+def snapshot():
+    with _lock:
+        counters = dict(_counters)
+        timings = dict(_timings)
+        gauges = dict(_gauges)
+
+    gauge_values = {}
+    for name, fn in gauges.items():
+        try:
+            gauge_values[name] = fn()
+        except Exception as e:
+            gauge_values[name] = f"error: {e}"
+
+    return {
+        'counters': counters,
+        'timings': {
+            name: {
+                'count': count,
+                'total_ms': round(total * 1000, 3),
+                'avg_ms': round(total * 1000 / count, 3) if count else 0,
+                'max_ms': round(maximum * 1000, 3),
+            }
+            for name, (count, total, maximum) in timings.items()
+        },
+        'gauges': gauge_values,
+    }
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _timings.clear()
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-18 14:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0002_downloadjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DriveSyncState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('folder_id', models.CharField(max_length=255, unique=True)),
+                ('start_page_token', models.CharField(blank=True, max_length=255)),
+                ('last_full_sync_at', models.DateTimeField(blank=True, null=True)),
+                ('last_incremental_sync_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='filemetadata',
+            name='drive_modified_time',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='filemetadata',
+            name='google_drive_id',
+            field=models.CharField(blank=True, db_index=True, max_length=255, null=True),
+        ),
+    ]
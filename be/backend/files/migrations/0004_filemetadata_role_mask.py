@@ -0,0 +1,38 @@
+# Generated by Django 4.2.7 on 2026-10-18 14:19
+
+from django.db import migrations, models
+
+# Frozen copy of files.models.ROLE_BITS at the time of this migration
+ROLE_BITS = {'Admin': 1, 'Manager': 2, 'Employee': 4}
+
+
+def populate_role_mask(apps, schema_editor):
+    FileMetadata = apps.get_model('files', 'FileMetadata')
+    batch = []
+    for metadata in FileMetadata.objects.only('id', 'allowed_roles').iterator(chunk_size=1000):
+        mask = 0
+        for role in metadata.allowed_roles or []:
+            mask |= ROLE_BITS.get(role, 0)
+        metadata.role_mask = mask
+        batch.append(metadata)
+        if len(batch) >= 1000:
+            FileMetadata.objects.bulk_update(batch, ['role_mask'])
+            batch = []
+    if batch:
+        FileMetadata.objects.bulk_update(batch, ['role_mask'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0003_drive_sync'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='filemetadata',
+            name='role_mask',
+            field=models.PositiveSmallIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.RunPython(populate_role_mask, migrations.RunPython.noop),
+    ]
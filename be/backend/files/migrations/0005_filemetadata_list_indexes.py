@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-18 14:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0004_filemetadata_role_mask'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='filemetadata',
+            index=models.Index(fields=['is_local', 'filename'], name='files_filem_is_loca_c710d7_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='filemetadata',
+            index=models.Index(fields=['size'], name='files_filem_size_9caa9f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='filemetadata',
+            index=models.Index(fields=['last_modified'], name='files_filem_last_mo_279f56_idx'),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 4.2.7 on 2026-10-18 14:46
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('files', '0006_fileaccess_event_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FileAccessDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('filename', models.CharField(max_length=255)),
+                ('action', models.CharField(choices=[('view', 'View'), ('download', 'Download')], max_length=20)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('failure_count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-day'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='fileaccess',
+            index=models.Index(fields=['timestamp'], name='fileaccess_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fileaccess',
+            index=models.Index(fields=['user', 'timestamp'], name='fileaccess_user_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fileaccess',
+            index=models.Index(fields=['filename', 'timestamp'], name='fileaccess_file_ts_idx'),
+        ),
+        migrations.AddField(
+            model_name='fileaccessdailyrollup',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='file_access_rollups', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='fileaccessdailyrollup',
+            index=models.Index(fields=['user', 'day', 'count', 'failure_count'], name='rollup_user_day_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fileaccessdailyrollup',
+            index=models.Index(fields=['filename', 'day', 'count', 'failure_count'], name='rollup_file_day_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='fileaccessdailyrollup',
+            constraint=models.UniqueConstraint(fields=('day', 'user', 'filename', 'action'), name='fileaccess_rollup_unique'),
+        ),
+    ]
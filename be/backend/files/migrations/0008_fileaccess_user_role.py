@@ -0,0 +1,32 @@
+# Generated by Django 4.2.7 on 2026-10-18 14:47
+
+from django.db import migrations, models
+
+# Frozen copy of the role names in User.ROLE_CHOICES at the time of this migration
+ROLES = ['Admin', 'Manager', 'Employee']
+
+
+def populate_user_role(apps, schema_editor):
+    FileAccess = apps.get_model('files', 'FileAccess')
+    for role in ROLES:
+        FileAccess.objects.filter(user__role=role).update(user_role=role)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0007_fileaccess_indexes_daily_rollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fileaccess',
+            name='user_role',
+            field=models.CharField(blank=True, default='', editable=False, max_length=20),
+        ),
+        migrations.RunPython(populate_user_role, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='fileaccess',
+            index=models.Index(fields=['user_role', 'timestamp'], name='fileaccess_role_ts_idx'),
+        ),
+    ]
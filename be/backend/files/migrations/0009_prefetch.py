@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-18 14:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0008_fileaccess_user_role'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='downloadjob',
+            name='source',
+            field=models.CharField(choices=[('user', 'User request'), ('prefetch', 'Prefetch')], default='user', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='filemetadata',
+            name='prefetched_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,8 +1,34 @@
 from django.db import models
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 
 User = get_user_model()
 
+# Bit assigned to each role in FileMetadata.role_mask, in ROLE_CHOICES order
+ROLE_BITS = {role: 1 << i for i, (role, _) in enumerate(User.ROLE_CHOICES)}
+
+def roles_to_mask(roles):
+    """
+    Encode a list of role names as a role_mask bitmask
+    """
+    mask = 0
+    for role in roles or []:
+        mask |= ROLE_BITS.get(role, 0)
+    return mask
+
+def masks_with_role(role):
+    """
+    Every role_mask value that grants `role`; small enough for an indexed IN (...)
+    """
+    bit = ROLE_BITS.get(role, 0)
+    if not bit:
+        return []
+    return [mask for mask in range(1 << len(ROLE_BITS)) if mask & bit]
+
+class FileMetadataQuerySet(models.QuerySet):
+    def visible_to_role(self, role):
+        return self.filter(role_mask__in=masks_with_role(role))
+
 class FileAccess(models.Model):
     ACTION_CHOICES = [
         ('view', 'View'),
@@ -12,23 +38,175 @@ class FileAccess(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     filename = models.CharField(max_length=255)
     action = models.CharField(max_length=20, choices=ACTION_CHOICES)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
     ip_address = models.GenericIPAddressField(blank=True, null=True)
     success = models.BooleanField(default=True)
+    # Set by the async audit writer so spooled events can be replayed idempotently
+    event_id = models.UUIDField(blank=True, null=True, unique=True, editable=False)
+    # The user's role when the event happened, so role-scoped views need no join
+    user_role = models.CharField(max_length=20, blank=True, default='', editable=False)
     
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            # Retention and time-range scans
+            models.Index(fields=['timestamp'], name='fileaccess_ts_idx'),
+            # Per-user and per-file history, newest first
+            models.Index(fields=['user', 'timestamp'], name='fileaccess_user_ts_idx'),
+            models.Index(fields=['filename', 'timestamp'], name='fileaccess_file_ts_idx'),
+            # Manager-scoped activity, newest first
+            models.Index(fields=['user_role', 'timestamp'], name='fileaccess_role_ts_idx'),
+        ]
+    
+    def save(self, *args, **kwargs):
+        if not self.user_role and self.user_id:
+            self.user_role = getattr(self.user, 'role', '') or ''
+        super().save(*args, **kwargs)
     
     def __str__(self):
         return f"{self.user.username} {self.action} {self.filename}"
 
+class FileAccessDailyRollup(models.Model):
+    """
+    FileAccess counts per day, user, file and action, so dashboards and
+    retention do not need the raw events
+    """
+    day = models.DateField()
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='file_access_rollups')
+    filename = models.CharField(max_length=255)
+    action = models.CharField(max_length=20, choices=FileAccess.ACTION_CHOICES)
+    count = models.PositiveIntegerField(default=0)
+    failure_count = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        ordering = ['-day']
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'user', 'filename', 'action'],
+                                    name='fileaccess_rollup_unique'),
+        ]
+        # The counts are part of the per-user and per-file indexes so
+        # dashboard aggregates are answered from the index alone
+        indexes = [
+            models.Index(fields=['user', 'day', 'count', 'failure_count'], name='rollup_user_day_idx'),
+            models.Index(fields=['filename', 'day', 'count', 'failure_count'], name='rollup_file_day_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.day} {self.user_id} {self.action} {self.filename}: {self.count}"
+
 class FileMetadata(models.Model):
     filename = models.CharField(max_length=255, unique=True)
     size = models.BigIntegerField(default=0)
     last_modified = models.DateTimeField(auto_now=True)
     is_local = models.BooleanField(default=False)
-    google_drive_id = models.CharField(max_length=255, blank=True, null=True)
+    google_drive_id = models.CharField(max_length=255, blank=True, null=True, db_index=True)
+    drive_modified_time = models.DateTimeField(blank=True, null=True)
     allowed_roles = models.JSONField(default=list)  # ['Admin', 'Manager', 'Employee']
+    # Indexed copy of allowed_roles (see ROLE_BITS), maintained by save()
+    role_mask = models.PositiveSmallIntegerField(default=0, db_index=True, editable=False)
+    # Set when the prefetcher downloaded the local copy, cleared by its first open
+    prefetched_at = models.DateTimeField(blank=True, null=True)
+    # Drive's md5Checksum, recorded by the sync
+    drive_md5 = models.CharField(max_length=32, blank=True, default='')
+    # SHA-256 of the local copy while it is a link to a ContentBlob
+    content_digest = models.CharField(max_length=64, blank=True, null=True, db_index=True)
+    
+    objects = FileMetadataQuerySet.as_manager()
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['is_local', 'filename']),
+            models.Index(fields=['size']),
+            models.Index(fields=['last_modified']),
+        ]
+    
+    def save(self, *args, **kwargs):
+        self.role_mask = roles_to_mask(self.allowed_roles)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'allowed_roles' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'role_mask'}
+        super().save(*args, **kwargs)
+    
+    def __str__(self):
+        return self.filename
+
+class ContentBlob(models.Model):
+    """
+    One stored copy of some content, addressed by its SHA-256 (see
+    files.blobs). ref_count is the number of FileMetadata rows whose local
+    copy links to it.
+    """
+    digest = models.CharField(max_length=64, unique=True)
+    size = models.BigIntegerField()
+    md5 = models.CharField(max_length=32)
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # When ref_count last dropped to zero
+    released_at = models.DateTimeField(blank=True, null=True)
+    
+    class Meta:
+        indexes = [
+            # Drive reports md5Checksum and size; this finds a blob we already hold
+            models.Index(fields=['md5', 'size'], name='contentblob_md5_size_idx'),
+            models.Index(fields=['ref_count', 'released_at'], name='contentblob_gc_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.digest} ({self.ref_count} ref(s))"
+
+class CatalogVersion(models.Model):
+    """
+    Single row counting FileMetadata changes (see files.catalog). It lives
+    in the database so that every process, web workers as well as
+    sync_drive and cache_gc, sees a change made by any other.
+    """
+    version = models.BigIntegerField(default=0)
+    
+    def __str__(self):
+        return f"Catalog version {self.version}"
+
+class DriveSyncState(models.Model):
+    folder_id = models.CharField(max_length=255, unique=True)
+    start_page_token = models.CharField(max_length=255, blank=True)
+    last_full_sync_at = models.DateTimeField(blank=True, null=True)
+    last_incremental_sync_at = models.DateTimeField(blank=True, null=True)
+    
+    def __str__(self):
+        return f"Sync state for {self.folder_id}"
+
+class DownloadJob(models.Model):
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+    SOURCE_CHOICES = [
+        ('user', 'User request'),
+        ('prefetch', 'Prefetch'),
+    ]
+    
+    file = models.ForeignKey(FileMetadata, on_delete=models.CASCADE, related_name='download_jobs')
+    requested_by = models.ForeignKey(User, on_delete=models.SET_NULL, blank=True, null=True)
+    ip_address = models.GenericIPAddressField(blank=True, null=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    source = models.CharField(max_length=20, choices=SOURCE_CHOICES, default='user')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    bytes_done = models.BigIntegerField(default=0)
+    total_bytes = models.BigIntegerField(blank=True, null=True)
+    error = models.TextField(blank=True)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
     
     def __str__(self):
-        return self.filename
\ No newline at end of file
+        return f"Download of {self.file.filename} ({self.status})"
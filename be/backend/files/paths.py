@@ -0,0 +1,44 @@
+import os
+from django.conf import settings
+
+
+class UnsafeFilename(ValueError):
+    """
+    Raised for a catalog name that cannot be used as a file in FILES_DIR
+    """
+    pass
+
+
+def is_safe_filename(name):
+    """
+    Whether `name` (e.g. a Drive file name) names a plain entry of
+    FILES_DIR: no directory parts, no '..', and no leading dot, which
+    would hide it among the lock, blob and partial-download entries
+    """
+    return (
+        bool(name)
+        and name == os.path.basename(name)
+        and not name.startswith('.')
+        and '\x00' not in name
+        and not (os.altsep and os.altsep in name)
+    )
+
+
+def is_within_files_dir(path):
+    """
+    Whether `path`, resolved, is directly inside FILES_DIR
+    """
+    return os.path.dirname(os.path.realpath(path)) == os.path.realpath(settings.FILES_DIR)
+
+
+def local_file_path(filename):
+    """
+    Path of a catalog file's local copy; raises UnsafeFilename rather than
+    return a path outside FILES_DIR
+    """
+    if not is_safe_filename(filename):
+        raise UnsafeFilename(f"Unsafe file name: {filename!r}")
+    path = os.path.join(settings.FILES_DIR, filename)
+    if not is_within_files_dir(path):
+        raise UnsafeFilename(f"Unsafe file name: {filename!r}")
+    return path
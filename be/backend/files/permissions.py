@@ -0,0 +1,125 @@
+import threading
+import time
+from django.conf import settings
+from . import metrics
+from .catalog import get_catalog_version
+from .models import ROLE_BITS, FileMetadata
+
+# Each file is packed into one int: id << 8 | has_drive_copy << 7 | role_mask
+DRIVE_BIT = 1 << 7
+MASK_BITS = DRIVE_BIT - 1
+
+
+class PermissionSnapshot:
+    """
+    Immutable view of who may see which file, built from one catalog version.
+
+    Answers "can this user see this file" and "which files can this role
+    see" from memory; get_permission_snapshot() swaps in a new snapshot
+    when the catalog version changes, or when it is older than
+    PERMISSION_SNAPSHOT_MAX_AGE.
+    """
+    __slots__ = ('version', 'built_at', '_files', '_visible', '_prefetched')
+
+    def __init__(self, version, rows):
+        files = {}
+        visible = {role: [] for role in ROLE_BITS}
+        prefetched = []
+        for filename, file_id, role_mask, google_drive_id, prefetched_at in rows:
+            files[filename] = (file_id << 8) | (DRIVE_BIT if google_drive_id else 0) | role_mask
+            if prefetched_at is not None:
+                prefetched.append(filename)
+            for role, bit in ROLE_BITS.items():
+                if role_mask & bit:
+                    visible[role].append(filename)
+        self.version = version
+        self.built_at = time.monotonic()
+        self._files = files
+        self._visible = {role: frozenset(names) for role, names in visible.items()}
+        self._prefetched = frozenset(prefetched)
+
+    def is_current(self, version):
+        return (self.version == version and
+                time.monotonic() - self.built_at < settings.PERMISSION_SNAPSHOT_MAX_AGE)
+
+    def __len__(self):
+        return len(self._files)
+
+    def __contains__(self, filename):
+        return filename in self._files
+
+    def can_access(self, user, filename):
+        """
+        True or False, or None if the file is not in the catalog
+        """
+        packed = self._files.get(filename)
+        if packed is None:
+            return None
+        role = getattr(user, 'role', None)
+        # Admins, and users without a role, are not restricted
+        if role is None or role == 'Admin':
+            return True
+        return bool(packed & ROLE_BITS.get(role, 0))
+
+    def file_id(self, filename):
+        packed = self._files.get(filename)
+        return None if packed is None else packed >> 8
+
+    def has_drive_copy(self, filename):
+        packed = self._files.get(filename)
+        return packed is not None and bool(packed & DRIVE_BIT)
+
+    def was_prefetched(self, filename):
+        """
+        Downloaded by the prefetcher and not opened since, as of this snapshot
+        """
+        return filename in self._prefetched
+
+    def role_mask(self, filename):
+        packed = self._files.get(filename)
+        return None if packed is None else packed & MASK_BITS
+
+    def visible_files(self, role):
+        """
+        Frozen set of the filenames a role may see
+        """
+        if role == 'Admin':
+            return frozenset(self._files)
+        return self._visible.get(role, frozenset())
+
+
+_lock = threading.Lock()
+_snapshot = None
+
+
+def get_permission_snapshot():
+    """
+    The snapshot for the current catalog version, rebuilt when it is stale.
+    Changes made by this process are enforced from the next request on,
+    and those made by other processes within CATALOG_VERSION_CACHE_SECONDS
+    (see get_catalog_version); the age limit also catches writes that skip
+    the post_save bump (raw SQL, update()).
+    """
+    global _snapshot
+    version = get_catalog_version()
+    snapshot = _snapshot
+    if snapshot is not None and snapshot.is_current(version):
+        return snapshot
+
+    with _lock:
+        snapshot = _snapshot
+        if snapshot is not None and snapshot.is_current(version):
+            return snapshot
+        # Tagged with the version read before loading, so a change made
+        # while loading triggers another rebuild on the next call
+        with metrics.timed('permissions.snapshot.build'):
+            rows = FileMetadata.objects.values_list(
+                'filename', 'id', 'role_mask', 'google_drive_id', 'prefetched_at'
+            ).iterator(chunk_size=10000)
+            snapshot = PermissionSnapshot(version, rows)
+        metrics.incr('permissions.snapshot.rebuild')
+        _snapshot = snapshot
+        return snapshot
+
+
+metrics.register_gauge('permissions.snapshot.files', lambda: len(_snapshot) if _snapshot is not None else 0)
@@ -0,0 +1,199 @@
+import os
+import queue
+import threading
+from collections import Counter, namedtuple
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Count
+from django.utils import timezone
+from . import metrics
+from .disk_cache import disk_usage, scan_local_files
+from .jobs import ACTIVE_STATUSES, enqueue_download
+from .models import ROLE_BITS, DownloadJob, FileAccess, FileMetadata
+from .permissions import get_permission_snapshot
+
+PrefetchCandidate = namedtuple('PrefetchCandidate', 'filename file_id size hits roles')
+
+
+def role_demand(role, since):
+    """
+    (filename, accesses) by users of `role` since `since`, busiest first.
+    Failed opens count too: they are exactly the files that were not local.
+    """
+    return (
+        FileAccess.objects.filter(user_role=role, timestamp__gte=since)
+        .order_by()
+        .values_list('filename')
+        .annotate(hits=Count('id'))
+        .order_by('-hits', 'filename')
+    )
+
+
+def disk_headroom():
+    """
+    Bytes that can be added to FILES_DIR without pushing it past the low
+    watermark of the disk cache quota, or None without a quota
+    """
+    if settings.DISK_CACHE_MAX_BYTES <= 0:
+        return None
+    used = disk_usage(scan_local_files())
+    return max(int(settings.DISK_CACHE_MAX_BYTES * settings.DISK_CACHE_LOW_WATERMARK) - used, 0)
+
+
+def plan_prefetch(roles=None, top_k=None, max_bytes=None, history_days=None):
+    """
+    Pick the non-local Drive files to download ahead of demand.
+
+    Each role contributes its `top_k` most accessed files that it may see
+    and that are not on disk yet. The union is taken busiest first until
+    `max_bytes` (the per-run transfer budget) or the disk headroom runs
+    out. Returns (candidates, stats).
+    """
+    roles = list(roles or ROLE_BITS)
+    top_k = settings.PREFETCH_TOP_K if top_k is None else top_k
+    max_bytes = settings.PREFETCH_MAX_BYTES if max_bytes is None else max_bytes
+    history_days = settings.PREFETCH_HISTORY_DAYS if history_days is None else history_days
+    since = timezone.now() - timedelta(days=history_days)
+    snapshot = get_permission_snapshot()
+    stats = Counter()
+
+    hits = Counter()
+    wanted_by = {}
+    for role in roles:
+        visible = snapshot.visible_files(role)
+        picked = 0
+        for filename, count in role_demand(role, since).iterator():
+            if picked >= top_k:
+                break
+            if filename not in visible or not snapshot.has_drive_copy(filename):
+                continue
+            if os.path.exists(os.path.join(settings.FILES_DIR, filename)):
+                continue
+            hits[filename] += count
+            wanted_by.setdefault(filename, []).append(role)
+            picked += 1
+    stats['ranked'] = len(hits)
+
+    file_ids = {filename: snapshot.file_id(filename) for filename in hits}
+    sizes = dict(FileMetadata.objects.filter(id__in=list(file_ids.values())).values_list('id', 'size'))
+    in_flight = set(DownloadJob.objects.filter(
+        file_id__in=list(file_ids.values()), status__in=ACTIVE_STATUSES
+    ).values_list('file_id', flat=True))
+
+    budget = max_bytes
+    headroom = disk_headroom()
+    if headroom is not None:
+        budget = min(budget, headroom)
+
+    planned = []
+    for filename, count in hits.most_common():
+        file_id = file_ids[filename]
+        if file_id in in_flight:
+            stats['in_flight'] += 1
+            continue
+        size = sizes.get(file_id, 0)
+        if size > budget:
+            # A smaller file further down may still fit
+            stats['over_budget'] += 1
+            continue
+        budget -= size
+        planned.append(PrefetchCandidate(filename, file_id, size, count, wanted_by[filename]))
+    stats['planned'] = len(planned)
+    stats['planned_bytes'] = sum(candidate.size for candidate in planned)
+    return planned, stats
+
+
+def schedule_prefetch(dry_run=False, **options):
+    """
+    Plan a prefetch run and queue a background download job per file
+    """
+    with metrics.timed('prefetch.plan'):
+        planned, stats = plan_prefetch(**options)
+    if dry_run:
+        return planned, stats
+    for candidate in planned:
+        job, created = enqueue_download(candidate.file_id, source='prefetch')
+        if created:
+            stats['enqueued'] += 1
+    metrics.incr('prefetch.enqueued', stats['enqueued'])
+    metrics.incr('prefetch.enqueued_bytes', stats['planned_bytes'])
+    return planned, stats
+
+
+class PrefetchHits:
+    """
+    Clears prefetched_at for opened files in a background thread, so that
+    opening a file never waits for SQLite's write lock. Hits are counted
+    from the rows the UPDATE changed, so an open that another worker
+    already claimed is not counted twice.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queue = None
+        self._claimed = set()
+        self._claimed_for = None
+
+    def claim(self, snapshot, file_id):
+        """
+        Queue the first open of a prefetched file seen with this snapshot;
+        the cleared flag only shows in snapshots built after the UPDATE
+        """
+        with self._lock:
+            if self._claimed_for is not snapshot:
+                self._claimed_for = snapshot
+                self._claimed = set()
+            if file_id in self._claimed:
+                return False
+            self._claimed.add(file_id)
+            if self._queue is None:
+                self._queue = queue.Queue()
+                threading.Thread(target=self._run, name='prefetch-hits', daemon=True).start()
+        self._queue.put(file_id)
+        return True
+
+    def _run(self):
+        while True:
+            ids = [self._queue.get()]
+            while True:
+                try:
+                    ids.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                close_old_connections()
+                # Plain UPDATE: no post_save, so the catalog version is not bumped
+                hits = FileMetadata.objects.filter(id__in=ids, prefetched_at__isnull=False).update(prefetched_at=None)
+                metrics.incr('files.open.prefetched', hits)
+            except Exception as e:
+                print(f"Failed to record prefetch hits for {len(ids)} file(s): {e}")  # Debug log
+
+
+prefetch_hits = PrefetchHits()
+
+
+def record_open(snapshot, filename, exists_locally):
+    """
+    Count a file open for the prefetch hit rate. An open is a prefetch hit
+    when it is the first one since the prefetcher downloaded the file; the
+    flag comes from the permission snapshot and is cleared in the
+    background, so no query runs on the request path. Returns whether the
+    open was queued as a possible hit.
+    """
+    metrics.incr('files.open')
+    if not exists_locally:
+        metrics.incr('files.open.remote')
+        return False
+    file_id = snapshot.file_id(filename)
+    if file_id is None or not snapshot.was_prefetched(filename):
+        return False
+    return prefetch_hits.claim(snapshot, file_id)
+
+
+def prefetch_hit_ratio():
+    opens = metrics.counter('files.open')
+    return round(metrics.counter('files.open.prefetched') / opens, 4) if opens else None
+
+
+metrics.register_gauge('prefetch.hit_ratio', prefetch_hit_ratio)
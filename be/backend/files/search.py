@@ -0,0 +1,533 @@
+"""
+Full-text search over the local copies in FILES_DIR.
+
+Files are split into chunks of whole lines (about SEARCH_CHUNK_BYTES each)
+and indexed in a contentless SQLite FTS5 table, so the index does not keep a
+second copy of the text: snippets are read back from the file itself using
+the chunk's byte offset. The index is split into SEARCH_INDEX_SHARDS
+database files by a hash of the filename, which lets `manage.py reindex`
+build the shards in parallel processes and keeps concurrent writers apart.
+
+A contentless table cannot delete rows without their original text, so
+re-indexing a file gives it a new doc id and drops the old id from
+`documents` and `chunk_meta`; queries join on those, and the orphaned FTS
+entries are reclaimed by `reindex --full`.
+"""
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from . import metrics
+from .compression import open_local
+
+# chunk id = doc_id << DOC_SHIFT | chunk number within the document
+DOC_SHIFT = 24
+READ_SIZE = 1024 * 1024
+# Rows written per transaction while a document is being indexed
+WRITE_BATCH = 500
+SNIPPET_CHARS = 200
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS doc_ids (doc_id INTEGER PRIMARY KEY AUTOINCREMENT);
+CREATE TABLE IF NOT EXISTS documents (
+    doc_id INTEGER PRIMARY KEY,
+    filename TEXT NOT NULL UNIQUE,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    chunks INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS chunk_meta (
+    chunk_id INTEGER PRIMARY KEY,
+    line INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS index_state (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+CREATE VIRTUAL TABLE IF NOT EXISTS chunks USING fts5(
+    body, content='', columnsize=0, tokenize='unicode61 remove_diacritics 2'
+);
+"""
+
+# Best chunk per document, grouped before the joins so they run once per
+# document rather than once per matching chunk. MATERIALIZED keeps the FTS
+# query from being flattened into the join, which bm25() does not allow.
+SEARCH_SQL = """
+WITH h AS MATERIALIZED (
+    SELECT rowid AS chunk_id, bm25(chunks) AS score FROM chunks WHERE chunks MATCH ?
+), best AS (
+    SELECT chunk_id >> {shift} AS doc_id, chunk_id, MIN(score) AS score, COUNT(*) AS hits
+    FROM h GROUP BY chunk_id >> {shift}
+)
+SELECT d.filename, d.size, d.mtime_ns, m.line, m.offset, m.length, best.score, best.hits
+FROM best
+JOIN documents AS d ON d.doc_id = best.doc_id
+JOIN chunk_meta AS m ON m.chunk_id = best.chunk_id
+WHERE visible(d.filename)
+ORDER BY best.score
+LIMIT ?
+""".format(shift=DOC_SHIFT)
+
+QUERY_TERM_RE = re.compile(r'"([^"]*)"|(\S+)')
+WORD_RE = re.compile(r'\w+')
+
+
+class SearchIndexError(Exception):
+    pass
+
+
+# ----------------------------------------------------------------
+# Shards
+# ----------------------------------------------------------------
+
+def shard_for(filename, shard_count):
+    return zlib.crc32(filename.encode('utf-8')) % shard_count
+
+
+def shard_path(shard):
+    return os.path.join(settings.SEARCH_INDEX_DIR, f"shard-{shard}.sqlite3")
+
+
+def open_shard(path, shard_count):
+    """
+    Open (creating if needed) one shard of the index
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.executescript(SCHEMA)
+    conn.execute('INSERT OR IGNORE INTO index_state VALUES (?, ?)', ('shard_count', shard_count))
+    stored = conn.execute("SELECT value FROM index_state WHERE key = 'shard_count'").fetchone()[0]
+    if stored != shard_count:
+        conn.close()
+        raise SearchIndexError(
+            f"{path} was built for {stored} shards, not {shard_count}; run `manage.py reindex --full`"
+        )
+    return conn
+
+
+_connections = threading.local()
+
+
+def get_shard(shard):
+    """
+    This thread's connection to a shard
+    """
+    cache = getattr(_connections, 'shards', None)
+    if cache is None:
+        cache = _connections.shards = {}
+    path = shard_path(shard)
+    conn = cache.get(path)
+    if conn is None:
+        conn = cache[path] = open_shard(path, settings.SEARCH_INDEX_SHARDS)
+    return conn
+
+
+# ----------------------------------------------------------------
+# Indexing
+# ----------------------------------------------------------------
+
+def iter_chunks(path, chunk_bytes):
+    """
+    Yield (first line, byte offset, bytes) for runs of whole lines of
+    about `chunk_bytes`; a single line longer than that is split
+    """
+    line = 0
+    offset = 0
+    with open_local(path) as f:
+        pending = b''
+        while True:
+            block = f.read(READ_SIZE)
+            if not block:
+                break
+            data = pending + block
+            pos = 0
+            while len(data) - pos >= chunk_bytes:
+                cut = data.rfind(b'\n', pos, pos + chunk_bytes) + 1
+                if cut <= pos:
+                    cut = pos + chunk_bytes
+                piece = data[pos:cut]
+                yield line, offset, piece
+                line += piece.count(b'\n')
+                offset += len(piece)
+                pos = cut
+            pending = data[pos:]
+        if pending:
+            yield line, offset, pending
+
+
+def index_document(conn, filename, path, chunk_bytes):
+    """
+    (Re)index one file in an open shard; returns the number of chunks.
+
+    Chunks are committed in batches under a fresh doc id and only become
+    visible when the documents row is swapped at the end.
+    """
+    stat_result = os.stat(path)
+    doc_id = conn.execute('INSERT INTO doc_ids DEFAULT VALUES').lastrowid
+    base = doc_id << DOC_SHIFT
+    count = 0
+    batch = []
+
+    def flush():
+        conn.execute('BEGIN')
+        try:
+            conn.executemany('INSERT INTO chunks (rowid, body) VALUES (?, ?)',
+                             [(chunk_id, body) for chunk_id, body, _, _, _ in batch])
+            conn.executemany('INSERT INTO chunk_meta VALUES (?, ?, ?, ?)',
+                             [(chunk_id, line, offset, length) for chunk_id, _, line, offset, length in batch])
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        batch.clear()
+
+    for line, offset, piece in iter_chunks(path, chunk_bytes):
+        if count >= 1 << DOC_SHIFT:
+            raise SearchIndexError(f"{filename} has too many chunks to index")
+        batch.append((base + count, piece.decode('utf-8', errors='replace'), line, offset, len(piece)))
+        count += 1
+        if len(batch) >= WRITE_BATCH:
+            flush()
+    if batch:
+        flush()
+
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        _drop_document(conn, filename)
+        conn.execute('INSERT INTO documents VALUES (?, ?, ?, ?, ?)',
+                     (doc_id, filename, stat_result.st_size, stat_result.st_mtime_ns, count))
+        # AUTOINCREMENT remembers the highest id, the rows are not needed
+        conn.execute('DELETE FROM doc_ids WHERE doc_id <= ?', (doc_id,))
+        conn.execute('COMMIT')
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    return count
+
+
+def _drop_document(conn, filename):
+    row = conn.execute('SELECT doc_id, chunks FROM documents WHERE filename = ?', (filename,)).fetchone()
+    if row is None:
+        return False
+    doc_id, chunks = row
+    conn.execute('DELETE FROM chunk_meta WHERE chunk_id BETWEEN ? AND ?',
+                 (doc_id << DOC_SHIFT, ((doc_id + 1) << DOC_SHIFT) - 1))
+    conn.execute('DELETE FROM documents WHERE doc_id = ?', (doc_id,))
+    conn.execute(
+        "INSERT INTO index_state VALUES ('dead_chunks', ?) "
+        "ON CONFLICT (key) DO UPDATE SET value = value + excluded.value",
+        (chunks,)
+    )
+    return True
+
+
+def remove_document(conn, filename):
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        removed = _drop_document(conn, filename)
+        conn.execute('COMMIT')
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    return removed
+
+
+def clear_shard(conn):
+    """
+    Empty a shard in place (open connections elsewhere stay valid)
+    """
+    conn.execute('BEGIN IMMEDIATE')
+    conn.execute("INSERT INTO chunks (chunks) VALUES ('delete-all')")
+    conn.execute('DELETE FROM chunk_meta')
+    conn.execute('DELETE FROM documents')
+    conn.execute("DELETE FROM index_state WHERE key = 'dead_chunks'")
+    conn.execute('COMMIT')
+    conn.execute('VACUUM')
+
+
+def index_shard(path, shard_count, files_dir, filenames, chunk_bytes, optimize=False):
+    """
+    Index `filenames` into one shard. Runs in a worker process of
+    `manage.py reindex`, so it only uses its arguments, not Django.
+    Returns (files indexed, chunks, bytes, errors).
+    """
+    conn = open_shard(path, shard_count)
+    indexed = chunks = size = 0
+    errors = []
+    try:
+        for filename in filenames:
+            file_path = os.path.join(files_dir, filename)
+            try:
+                chunks += index_document(conn, filename, file_path, chunk_bytes)
+                size += os.path.getsize(file_path)
+                indexed += 1
+            except (OSError, SearchIndexError) as e:
+                errors.append(f"{filename}: {e}")
+        if optimize:
+            conn.execute("INSERT INTO chunks (chunks) VALUES ('optimize')")
+    finally:
+        conn.close()
+    return indexed, chunks, size, errors
+
+
+def indexed_documents(shard):
+    """
+    {filename: (size, mtime_ns)} for everything indexed in a shard
+    """
+    rows = get_shard(shard).execute('SELECT filename, size, mtime_ns FROM documents')
+    return {filename: (size, mtime_ns) for filename, size, mtime_ns in rows}
+
+
+def index_file(filename):
+    """
+    Index (or re-index) one local file, e.g. right after it was downloaded
+    """
+    path = os.path.join(settings.FILES_DIR, filename)
+    conn = get_shard(shard_for(filename, settings.SEARCH_INDEX_SHARDS))
+    with metrics.timed('search.index_file'):
+        chunks = index_document(conn, filename, path, settings.SEARCH_CHUNK_BYTES)
+    metrics.incr('search.indexed_files')
+    return chunks
+
+
+def discard_document(filename):
+    """
+    Drop a file from the index, e.g. when its local copy is removed
+    """
+    try:
+        return remove_document(get_shard(shard_for(filename, settings.SEARCH_INDEX_SHARDS)), filename)
+    except (sqlite3.Error, SearchIndexError) as e:
+        print(f"Failed to drop {filename} from the search index: {e}")  # Debug log
+        return False
+
+
+_refresh_executor = None
+_refresh_lock = threading.Lock()
+_refreshing = set()
+
+
+def refresh_file_soon(filename):
+    """
+    Re-index a file that changed since it was indexed, in the background
+    """
+    global _refresh_executor
+    with _refresh_lock:
+        if filename in _refreshing:
+            return
+        _refreshing.add(filename)
+        if _refresh_executor is None:
+            _refresh_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='search-index')
+
+    def refresh():
+        try:
+            if os.path.exists(os.path.join(settings.FILES_DIR, filename)):
+                index_file(filename)
+            else:
+                discard_document(filename)
+        except Exception as e:
+            print(f"Failed to re-index {filename}: {e}")  # Debug log
+        finally:
+            with _refresh_lock:
+                _refreshing.discard(filename)
+
+    _refresh_executor.submit(refresh)
+
+
+# ----------------------------------------------------------------
+# Queries
+# ----------------------------------------------------------------
+
+def parse_query(text):
+    """
+    Turn user input into an FTS5 MATCH expression, quoting every term so
+    FTS5 operators and column filters cannot be injected. "Quoted phrases"
+    and trailing-* prefixes are kept. Returns (expression, words, prefixes),
+    where words and prefixes are used to find the matching line.
+    """
+    parts = []
+    words = set()
+    prefixes = set()
+    for phrase, term in QUERY_TERM_RE.findall(text or ''):
+        if phrase:
+            tokens = WORD_RE.findall(fold(phrase))
+            if tokens:
+                parts.append('"' + ' '.join(tokens) + '"')
+                words.update(tokens)
+            continue
+        is_prefix = term.endswith('*')
+        tokens = WORD_RE.findall(fold(term))
+        if not tokens:
+            continue
+        if is_prefix and len(tokens) == 1:
+            parts.append(f'"{tokens[0]}"*')
+            prefixes.add(tokens[0])
+        else:
+            parts.append('"' + ' '.join(tokens) + '"')
+            words.update(tokens)
+    return ' '.join(parts), words, prefixes
+
+
+def fold(text):
+    """
+    Lowercase and strip diacritics, like the unicode61 tokenizer does
+    """
+    if text.isascii():
+        return text.lower()
+    decomposed = unicodedata.normalize('NFKD', text.lower())
+    return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def _line_matches(line, words, prefixes):
+    for token in WORD_RE.findall(fold(line)):
+        if token in words or any(token.startswith(prefix) for prefix in prefixes):
+            return True
+    return False
+
+
+def locate_match(path, line, offset, length, words, prefixes):
+    """
+    (line number, byte offset, snippet) of the first line in a chunk that
+    contains a query term
+    """
+    with open_local(path) as f:
+        f.seek(offset)
+        data = f.read(length)
+    lines = data.split(b'\n')
+    pos = 0
+    for number, raw in enumerate(lines):
+        text = raw.decode('utf-8', errors='replace').rstrip('\r')
+        if _line_matches(text, words, prefixes):
+            return line + number, offset + pos, snippet_for(text, words, prefixes)
+        pos += len(raw) + 1
+    # Only a tokenizer-level match (e.g. diacritics); point at the chunk
+    first = lines[0].decode('utf-8', errors='replace').rstrip('\r')
+    return line, offset, snippet_for(first, words, prefixes)
+
+
+def snippet_for(text, words, prefixes):
+    """
+    About SNIPPET_CHARS of `text` around the first query term
+    """
+    if len(text) <= SNIPPET_CHARS:
+        return text
+    start = 0
+    for match in WORD_RE.finditer(text):
+        token = fold(match.group())
+        if token in words or any(token.startswith(prefix) for prefix in prefixes):
+            start = max(match.start() - SNIPPET_CHARS // 4, 0)
+            break
+    snippet = text[start:start + SNIPPET_CHARS]
+    return ('…' if start else '') + snippet + ('…' if start + SNIPPET_CHARS < len(text) else '')
+
+
+_query_pool = None
+_query_pool_lock = threading.Lock()
+
+
+def _query_executor():
+    """
+    Threads that query shards side by side; sqlite releases the GIL while
+    it evaluates a query
+    """
+    global _query_pool
+    with _query_pool_lock:
+        if _query_pool is None:
+            _query_pool = ThreadPoolExecutor(max_workers=settings.SEARCH_QUERY_THREADS,
+                                             thread_name_prefix='search-query')
+        return _query_pool
+
+
+def _search_shard(shard, expression, visible, wanted):
+    conn = get_shard(shard)
+    conn.create_function(
+        'visible', 1,
+        (lambda filename: True) if visible is None else (lambda filename: filename in visible),
+        deterministic=True
+    )
+    try:
+        return conn.execute(SEARCH_SQL, (expression, wanted)).fetchall()
+    except sqlite3.OperationalError as e:
+        raise SearchIndexError(f"Invalid search query: {e}")
+
+
+def search(query, visible=None, limit=20, offset=0):
+    """
+    Best-matching files for `query`, best first. `visible` is the set of
+    filenames the caller may see (None for no restriction). Each result has
+    the filename, the zero-based line and byte offset of the best match, a
+    snippet of that line, and the number of matching chunks.
+    """
+    expression, words, prefixes = parse_query(query)
+    if not expression:
+        return []
+
+    wanted = offset + limit
+    shards = [shard for shard in range(settings.SEARCH_INDEX_SHARDS) if os.path.exists(shard_path(shard))]
+    with metrics.timed('search.query'):
+        if len(shards) > 1 and settings.SEARCH_QUERY_THREADS > 1:
+            futures = [_query_executor().submit(_search_shard, shard, expression, visible, wanted)
+                       for shard in shards]
+            rows = [row for future in futures for row in future.result()]
+        else:
+            rows = [row for shard in shards for row in _search_shard(shard, expression, visible, wanted)]
+    # bm25 is lower-is-better; shards hold similar mixes of files, so their
+    # scores are comparable enough to merge
+    rows.sort(key=lambda row: row[6])
+
+    results = []
+    for filename, size, mtime_ns, line, chunk_offset, length, score, chunk_hits in rows[offset:wanted]:
+        path = os.path.join(settings.FILES_DIR, filename)
+        try:
+            stat_result = os.stat(path)
+        except FileNotFoundError:
+            refresh_file_soon(filename)
+            continue
+        if (stat_result.st_size, stat_result.st_mtime_ns) != (size, mtime_ns):
+            # Changed since it was indexed: the offsets are no longer valid
+            metrics.incr('search.stale_hits')
+            refresh_file_soon(filename)
+            continue
+        match_line, match_offset, snippet = locate_match(path, line, chunk_offset, length, words, prefixes)
+        results.append({
+            'filename': filename,
+            'line': match_line,
+            'offset': match_offset,
+            'snippet': snippet,
+            'score': round(-score, 4),
+            'matching_chunks': chunk_hits,
+        })
+    return results
+
+
+def index_stats():
+    """
+    Size of the index, per shard and in total
+    """
+    shards = []
+    for shard in range(settings.SEARCH_INDEX_SHARDS):
+        path = shard_path(shard)
+        if not os.path.exists(path):
+            continue
+        conn = get_shard(shard)
+        documents, chunks, indexed_bytes = conn.execute(
+            'SELECT COUNT(*), COALESCE(SUM(chunks), 0), COALESCE(SUM(size), 0) FROM documents'
+        ).fetchone()
+        dead = conn.execute("SELECT value FROM index_state WHERE key = 'dead_chunks'").fetchone()
+        shards.append({
+            'shard': shard,
+            'documents': documents,
+            'chunks': chunks,
+            'dead_chunks': dead[0] if dead else 0,
+            'indexed_bytes': indexed_bytes,
+            'index_bytes': os.path.getsize(path),
+        })
+    totals = {
+        key: sum(shard[key] for shard in shards)
+        for key in ('documents', 'chunks', 'dead_chunks', 'indexed_bytes', 'index_bytes')
+    }
+    return dict(totals, shards=shards)
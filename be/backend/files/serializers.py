@@ -1,15 +1,32 @@
 from rest_framework import serializers
-from .models import FileAccess, FileMetadata
+from .models import DownloadJob, FileAccess, FileMetadata
 
 class FileMetadataSerializer(serializers.ModelSerializer):
+    """
+    Accepts an optional `fields` argument to serialize a sparse fieldset
+    """
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+    
     class Meta:
         model = FileMetadata
         fields = ['id', 'filename', 'size', 'last_modified', 'is_local', 'allowed_roles']
 
 class FileAccessSerializer(serializers.ModelSerializer):
     user_name = serializers.CharField(source='user.username', read_only=True)
-    user_role = serializers.CharField(source='user.role', read_only=True)
     
     class Meta:
         model = FileAccess
-        fields = ['id', 'user_name', 'user_role', 'filename', 'action', 'timestamp', 'success']
\ No newline at end of file
+        fields = ['id', 'user_name', 'user_role', 'filename', 'action', 'timestamp', 'success']
+
+class DownloadJobSerializer(serializers.ModelSerializer):
+    filename = serializers.CharField(source='file.filename', read_only=True)
+    
+    class Meta:
+        model = DownloadJob
+        fields = ['id', 'filename', 'status', 'source', 'attempts', 'max_attempts', 'bytes_done',
+                  'total_bytes', 'error', 'next_attempt_at', 'created_at', 'started_at', 'finished_at']
@@ -0,0 +1,18 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .blobs import drop_reference
+from .catalog import bump_catalog_version
+from .models import FileMetadata
+
+
+@receiver(post_save, sender=FileMetadata)
+@receiver(post_delete, sender=FileMetadata)
+def file_metadata_changed(sender, **kwargs):
+    bump_catalog_version()
+
+
+@receiver(post_delete, sender=FileMetadata)
+def file_metadata_deleted(sender, instance, **kwargs):
+    # The local copy may outlive the row; blob_gc deletes the blob once unreferenced
+    if instance.content_digest:
+        drop_reference(instance.content_digest)
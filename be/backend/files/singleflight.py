@@ -0,0 +1,91 @@
+import os
+import re
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process deduplication only
+    fcntl = None
+
+LOCK_POLL_INTERVAL = 0.1
+
+
+class FlightInProgress(Exception):
+    """
+    Raised when another caller is still running the same flight after the wait timeout
+    """
+    pass
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Run at most one call per key at a time.
+
+    Threads in this process that ask for a key already in flight wait for the
+    leader's result. Across worker processes the leader also holds an
+    exclusive flock on `<lock_dir>/<key>.lock`, so a second process blocks
+    until the first one is done instead of repeating the work.
+    """
+
+    def __init__(self, lock_dir):
+        self.lock_dir = lock_dir
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn, timeout):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            if not call.done.wait(timeout):
+                raise FlightInProgress(key)
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._run_locked(key, fn, timeout)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def _lock_path(self, key):
+        safe_key = re.sub(r'[^A-Za-z0-9_.-]', '_', str(key))
+        return os.path.join(self.lock_dir, f"{safe_key}.lock")
+
+    def _run_locked(self, key, fn, timeout):
+        if fcntl is None:
+            return fn()
+
+        os.makedirs(self.lock_dir, exist_ok=True)
+        deadline = time.monotonic() + timeout
+        with open(self._lock_path(key), 'a') as lock_file:
+            while True:
+                try:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    if time.monotonic() >= deadline:
+                        raise FlightInProgress(key)
+                    time.sleep(LOCK_POLL_INTERVAL)
+            try:
+                return fn()
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
@@ -0,0 +1,375 @@
+import ctypes
+import ctypes.util
+import itertools
+import json
+import os
+import select
+import struct
+import threading
+import time
+from collections import namedtuple
+from django.conf import settings
+from . import metrics
+from .compression import open_local, wrap_local
+
+# inotify(7) constants from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_IGNORED = 0x00008000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+INOTIFY_EVENT = struct.Struct('iIII')  # wd, mask, cookie, len
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_DELETE_SELF | IN_MOVE_SELF
+# On the parent directory: a new file appearing under the followed name
+DIR_WATCH_MASK = IN_CREATE | IN_MOVED_TO
+
+
+def _load_inotify():
+    if not hasattr(select, 'select') or os.name != 'posix':
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        return libc
+    except (OSError, AttributeError, TypeError):
+        # Not Linux, or a libc without inotify
+        return None
+
+
+_libc = _load_inotify()
+
+
+class TailCursor(namedtuple('TailCursor', 'inode offset seen')):
+    """
+    Where a follower is in a file: the inode it was reading, the byte
+    offset just past the last complete line it received and the file size
+    it has seen, so an unterminated last line is not sent again until the
+    file changes. Sent to clients as "<inode>:<offset>:<seen>" (the SSE
+    event id, or ?cursor= when polling).
+    """
+
+    def encode(self):
+        return f"{self.inode}:{self.offset}:{self.seen}"
+
+    @classmethod
+    def parse(cls, value):
+        try:
+            cursor = cls(*map(int, value.split(':')))
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid cursor: {value}")
+        if not 0 <= cursor.offset <= cursor.seen:
+            raise ValueError(f"Invalid cursor: {value}")
+        return cursor
+
+
+def _decode(line):
+    if line.endswith(b'\r'):
+        line = line[:-1]
+    return line.decode('utf-8', errors='replace')
+
+
+def read_last_lines(path, count, block_size=None, max_bytes=None):
+    """
+    Return (lines, offset, partial, cursor) for the last `count` lines of a file.
+
+    The file is read backwards from EOF in `block_size` blocks until enough
+    newlines have been seen, so the cost depends on the lines returned and
+    not on the file size. At most `max_bytes` are read; past that the
+    oldest, cut-off line is dropped. `offset` is where the first returned
+    line starts. An unterminated last line is included with partial=True,
+    and `cursor` points at its start so a follower receives it again once
+    it is complete.
+    """
+    block_size = block_size or settings.TAIL_BLOCK_SIZE
+    max_bytes = max_bytes or settings.TAIL_MAX_EVENT_BYTES
+    with open(path, 'rb') as raw:
+        stat_result = os.fstat(raw.fileno())
+        f = wrap_local(raw)
+        size = f.seek(0, os.SEEK_END)
+        blocks = []
+        pos = size
+        newlines = 0
+        # A trailing newline ends the last line; it does not start another
+        if size:
+            f.seek(size - 1)
+            trailing = f.read(1) == b'\n'
+        else:
+            trailing = False
+        # Without one, the newline before the unterminated last line is still needed
+        needed = count + 1 if trailing else max(count, 1)
+        while pos > 0 and newlines < needed and size - pos < max_bytes:
+            step = min(block_size, pos, max_bytes - (size - pos))
+            pos -= step
+            f.seek(pos)
+            block = f.read(step)
+            newlines += block.count(b'\n')
+            blocks.append(block)
+
+    data = b''.join(reversed(blocks))
+    body = data[:-1] if trailing else data
+    pieces = body.split(b'\n') if data else []
+    # An unterminated last line is resent once complete; a terminated one is done
+    cursor_offset = size if trailing or not pieces else size - len(pieces[-1])
+    if pos > 0 and pieces:
+        # The first piece starts before what was read
+        pos += len(pieces.pop(0)) + 1
+    if len(pieces) > count:
+        pos += sum(len(piece) + 1 for piece in pieces[:len(pieces) - count])
+        pieces = pieces[len(pieces) - count:]
+    lines = [_decode(piece) for piece in pieces]
+    return lines, min(pos, size), bool(lines) and cursor_offset < size, TailCursor(stat_result.st_ino, cursor_offset, size)
+
+
+def read_appended(path, offset, max_bytes=None):
+    """
+    Read the lines added after byte `offset`: returns (lines, next_offset,
+    partial). An unterminated last line is returned with partial=True and
+    is not consumed, so it comes again, complete, in a later read. A single
+    line longer than `max_bytes` is cut into pieces instead.
+    """
+    max_bytes = max_bytes or settings.TAIL_MAX_EVENT_BYTES
+    with open_local(path) as f:
+        f.seek(offset)
+        data = f.read(max_bytes)
+    if not data:
+        return [], offset, False
+    end = data.rfind(b'\n') + 1
+    if len(data) == max_bytes:
+        if end == 0:
+            # No newline in a full read: hand it over as a fragment
+            return [_decode(data)], offset + len(data), False
+        # The read stopped mid-line, not at EOF; the rest comes next time
+        data = data[:end]
+    lines = [_decode(line) for line in data[:end].split(b'\n')[:-1]] if end else []
+    partial = end < len(data)
+    if partial:
+        lines.append(_decode(data[end:]))
+    return lines, offset + end, partial
+
+
+def stat_local(path):
+    """
+    (stat_result, size of the original content) of one open of `path`, so
+    the two always describe the same inode
+    """
+    with open(path, 'rb') as raw:
+        stat_result = os.fstat(raw.fileno())
+        return stat_result, wrap_local(raw).seek(0, os.SEEK_END)
+
+
+class PollingWatcher:
+    """
+    Wake up every TAIL_POLL_INTERVAL seconds; the caller stats the file
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def watch(self, path):
+        self.path = path
+
+    def wait(self, timeout):
+        time.sleep(max(min(timeout, settings.TAIL_POLL_INTERVAL), 0))
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher(PollingWatcher):
+    """
+    Block on an inotify watch of the file itself until it is written,
+    truncated, moved or removed, and on its directory until a file is
+    created or moved in under the same name (rotation). Waits are still
+    capped at TAIL_POLL_INTERVAL while the file is missing.
+    """
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.fd = _libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.wd = None
+        self.watch(path)
+        dir_wd = _libc.inotify_add_watch(self.fd, os.fsencode(os.path.dirname(path) or '.'), DIR_WATCH_MASK)
+        self.dir_wd = dir_wd if dir_wd >= 0 else None
+
+    def watch(self, path):
+        self.path = path
+        if self.wd is not None:
+            _libc.inotify_rm_watch(self.fd, self.wd)
+        wd = _libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        self.wd = wd if wd >= 0 else None
+
+    def wait(self, timeout):
+        if self.wd is None:
+            if self.dir_wd is None:
+                return super().wait(timeout)
+            timeout = min(timeout, settings.TAIL_POLL_INTERVAL)
+        ready, _, _ = select.select([self.fd], [], [], max(timeout, 0))
+        if ready:
+            self._drain()
+
+    def _drain(self):
+        try:
+            buffer = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        pos = 0
+        while pos + INOTIFY_EVENT.size <= len(buffer):
+            wd, mask, _, name_len = INOTIFY_EVENT.unpack_from(buffer, pos)
+            pos += INOTIFY_EVENT.size + name_len
+            if wd == self.wd and mask & (IN_IGNORED | IN_DELETE_SELF | IN_MOVE_SELF):
+                # The watched inode is gone from this path; poll until it is back
+                self.wd = None
+
+    def close(self):
+        os.close(self.fd)
+
+
+def make_watcher(path):
+    if _libc is not None and settings.TAIL_USE_INOTIFY:
+        try:
+            return InotifyWatcher(path)
+        except OSError as e:
+            # e.g. fs.inotify.max_user_instances reached
+            print(f"inotify unavailable, polling {path}: {e}")  # Debug log
+    return PollingWatcher(path)
+
+
+def follow(path, cursor, max_seconds=None, heartbeat=None):
+    """
+    Yield (kind, cursor, payload) events for a growing file, starting at
+    `cursor`, for up to `max_seconds`:
+
+    - ('lines', cursor, {'lines', 'offset', 'partial'}) for appended lines
+    - ('reset', cursor, {'reason'}) when the file was truncated ('truncated')
+      or replaced by another inode ('rotated'); reading restarts at 0
+    - ('heartbeat', cursor, None) after `heartbeat` seconds without changes
+
+    Changes are noticed through inotify where available and by stat
+    polling otherwise. The cursor in each event is the one to resume from.
+    """
+    max_seconds = settings.TAIL_FOLLOW_MAX_SECONDS if max_seconds is None else max_seconds
+    heartbeat = heartbeat or settings.TAIL_HEARTBEAT
+    deadline = time.monotonic() + max_seconds
+    watcher = make_watcher(path)
+    seen_size = cursor.seen
+    quiet_since = time.monotonic()
+    try:
+        while True:
+            try:
+                # Offsets are in the original content, also for a file compressed at rest
+                stat_result, size = stat_local(path)
+            except (OSError, ValueError):
+                # Missing, or replaced mid-read (ValueError: a frame table cut short);
+                # the next pass sees the new file as a rotation
+                stat_result = None
+
+            if stat_result is not None:
+                reason = None
+                if stat_result.st_ino != cursor.inode:
+                    reason = 'rotated'
+                    watcher.watch(path)
+                elif size < cursor.offset:
+                    reason = 'truncated'
+                if reason:
+                    cursor = TailCursor(stat_result.st_ino, 0, 0)
+                    seen_size = None
+                    metrics.incr('tail.resets')
+                    yield 'reset', cursor, {'reason': reason}
+
+                if size != seen_size:
+                    lines, offset, partial = read_appended(path, cursor.offset)
+                    # If the read stopped short of EOF, come straight back for the rest
+                    caught_up = offset >= size or partial
+                    seen_size = size if caught_up else None
+                    if lines:
+                        start = cursor.offset
+                        cursor = TailCursor(cursor.inode, offset, seen_size or offset)
+                        quiet_since = time.monotonic()
+                        yield 'lines', cursor, {'lines': lines, 'offset': start, 'partial': partial}
+                    if not caught_up:
+                        continue
+
+            now = time.monotonic()
+            if now >= deadline:
+                return
+            if now - quiet_since >= heartbeat:
+                quiet_since = now
+                yield 'heartbeat', cursor, None
+            watcher.wait(min(deadline - now, heartbeat - (now - quiet_since)))
+    finally:
+        watcher.close()
+
+
+class FollowerSlots:
+    """
+    Cap on the follow streams this worker process serves at once; each one
+    holds a worker thread for its whole duration
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.active = 0
+
+    def acquire(self):
+        with self._lock:
+            if self.active >= settings.TAIL_MAX_FOLLOWERS:
+                metrics.incr('tail.rejected')
+                return False
+            self.active += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.active -= 1
+
+
+followers = FollowerSlots()
+metrics.register_gauge('tail.followers', lambda: followers.active)
+
+
+class FollowStream:
+    """
+    Response iterator that gives back its follower slot when the server
+    closes the response, whether or not it was ever iterated
+    """
+
+    def __init__(self, events):
+        self._events = events
+        self._released = False
+
+    def __iter__(self):
+        return self._events
+
+    def close(self):
+        if not self._released:
+            self._released = True
+            self._events.close()
+            followers.release()
+
+
+def iter_sse(events, first=None):
+    """
+    Render follow() events (after an optional first event) as a
+    Server-Sent Events stream. Each event id is the cursor to resume from,
+    which browsers send back as Last-Event-ID when they reconnect.
+    """
+    try:
+        yield f"retry: {settings.TAIL_RETRY_MS}\n\n".encode()
+        stream = events if first is None else itertools.chain([first], events)
+        for kind, cursor, payload in stream:
+            if kind == 'heartbeat':
+                yield b': keepalive\n\n'
+                continue
+            data = json.dumps(payload, ensure_ascii=False, separators=(',', ':'))
+            yield f"id: {cursor.encode()}\nevent: {kind}\ndata: {data}\n\n".encode('utf-8')
+    finally:
+        events.close()
@@ -5,6 +5,16 @@ urlpatterns = [
     path('files/', views.list_files, name='list_files'),
     path('files/check/<str:filename>/', views.check_file_exists, name='check_file_exists'),
     path('files/download/<str:filename>/', views.download_file, name='download_file'),
+    path('files/cache/', views.disk_cache_stats, name='disk_cache_stats'),
+    path('files/search/', views.search_files, name='search_files'),
+    path('files/jobs/<int:job_id>/', views.download_job_status, name='download_job_status'),
     path('files/open/<str:filename>/', views.open_file_notepad, name='open_file_notepad'),
+    path('files/content/<str:filename>/', views.file_content, name='file_content'),
+    path('files/lines/<str:filename>/', views.file_lines, name='file_lines'),
+    path('files/grep/<str:filename>/', views.grep_file, name='grep_file'),
+    path('files/tail/<str:filename>/', views.tail_file, name='tail_file'),
     path('activity-logs/', views.activity_logs, name='activity_logs'),
+    path('activity-logs/daily/', views.activity_rollups, name='activity_rollups'),
+    path('activity-logs/export/', views.export_activity_logs, name='export_activity_logs'),
+    path('metrics/', views.metrics_view, name='metrics'),
 ]
\ No newline at end of file
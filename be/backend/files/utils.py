@@ -1,50 +1,116 @@
 import os
-import io
+import tempfile
+import threading
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaIoBaseDownload
 from google.auth.transport.requests import Request
 from google.oauth2 import service_account
 from django.conf import settings
+from . import metrics
+from .blobs import HashingWriter, store_download
+from .compression import FrameWriter
+from .paths import is_within_files_dir
+from .singleflight import SingleFlight
+
+# One in-flight Drive download per google_drive_id, across threads and processes
+drive_downloads = SingleFlight(settings.DRIVE_DOWNLOAD_LOCK_DIR)
+
+# Drive services are cached per thread: httplib2 transports are not thread-safe
+_drive_clients = threading.local()
 
 def get_google_drive_service():
     """
-    Get Google Drive API service instance
+    Get the Google Drive API service instance for the current thread.
+
+    The service is built once per thread from the discovery document bundled
+    with google-api-python-client, so no network round-trip happens at build
+    time, and its HTTP transport keeps connections alive between calls.
     """
+    service = getattr(_drive_clients, 'service', None)
+    if service is not None:
+        metrics.incr('drive.client.reused')
+        return service
+    
     try:
         # For public files, we can use API key
-        service = build('drive', 'v3', developerKey=settings.GOOGLE_DRIVE_API_KEY)
+        with metrics.timed('drive.client.build'):
+            if settings.GOOGLE_DRIVE_BACKEND == 'fake':
+                from .fake_drive import FakeDriveService
+                service = FakeDriveService(settings.FAKE_DRIVE_PATH)
+            else:
+                service = build(
+                    'drive', 'v3',
+                    developerKey=settings.GOOGLE_DRIVE_API_KEY,
+                    static_discovery=True,
+                    cache_discovery=False
+                )
+        _drive_clients.service = service
         return service
     except Exception as e:
         print(f"Error creating Google Drive service: {e}")
         return None
 
-def download_file_from_drive(file_id, local_path):
+def reset_google_drive_service():
+    """
+    Drop the current thread's cached service, e.g. after a transport error
+    """
+    _drive_clients.service = None
+
+def download_file_from_drive(file_id, local_path, chunk_size=None, progress=None):
     """
-    Download file from Google Drive to local storage
+    Download file from Google Drive to local storage.
+
+    Chunks are streamed into a temporary file in the target directory, which
+    is fsynced and atomically renamed into place, so memory use stays at one
+    chunk and readers never see a partial file. `progress`, if given, is
+    called with (bytes_done, total_bytes) after every chunk. With the blob
+    store enabled the content is hashed on the way in and kept as a blob,
+    and `local_path` becomes a link to it. With COMPRESS_AT_REST the file
+    is written compressed (hashes are of the original content).
     """
+    chunk_size = chunk_size or settings.DRIVE_DOWNLOAD_CHUNK_SIZE
+    if not is_within_files_dir(local_path):
+        print(f"Refusing to download {file_id} outside FILES_DIR: {local_path}")  # Debug log
+        return False
+    target_dir = os.path.dirname(local_path)
+    tmp_path = None
+    
     try:
         service = get_google_drive_service()
         if not service:
             return False
         
-        # Get file metadata
-        file_metadata = service.files().get(fileId=file_id).execute()
-        
-        # Download file content
+        os.makedirs(target_dir, exist_ok=True)
         request = service.files().get_media(fileId=file_id)
-        file_content = io.BytesIO()
         
-        # Download in chunks
-        downloader = MediaIoBaseDownload(file_content, request)
-        done = False
-        while done is False:
-            status, done = downloader.next_chunk()
-        
-        # Save to local file
-        os.makedirs(os.path.dirname(local_path), exist_ok=True)
-        with open(local_path, 'wb') as f:
-            f.write(file_content.getvalue())
+        fd, tmp_path = tempfile.mkstemp(
+            dir=target_dir,
+            prefix=f".{os.path.basename(local_path)}.",
+            suffix='.part'
+        )
+        with os.fdopen(fd, 'wb') as f:
+            frames = None
+            if settings.COMPRESS_AT_REST:
+                frames = FrameWriter(f, settings.COMPRESS_AT_REST_FRAME_SIZE, settings.COMPRESS_AT_REST_LEVEL)
+            writer = HashingWriter(frames or f)
+            downloader = MediaIoBaseDownload(writer, request, chunksize=chunk_size)
+            done = False
+            while done is False:
+                status, done = downloader.next_chunk()
+                if progress and status:
+                    progress(status.resumable_progress, status.total_size)
+            
+            if frames:
+                frames.close()
+            f.flush()
+            os.fsync(f.fileno())
         
+        if settings.BLOB_STORE_ENABLED:
+            store_download(tmp_path, local_path, writer)
+        else:
+            os.replace(tmp_path, local_path)
+        tmp_path = None
         return True
         
     except HttpError as error:
@@ -52,30 +118,103 @@ def download_file_from_drive(file_id, local_path):
         return False
     except Exception as e:
         print(f"Error downloading file: {e}")
+        reset_google_drive_service()
         return False
+    finally:
+        # Never leave a partial download behind
+        if tmp_path and os.path.exists(tmp_path):
+            try:
+                os.remove(tmp_path)
+            except OSError as cleanup_error:
+                print(f"Failed to remove partial download {tmp_path}: {cleanup_error}")
 
-def list_drive_files(folder_id):
+def fetch_drive_file(file_id, local_path, timeout=None, progress=None):
     """
-    List files in Google Drive folder
+    Download a Drive file unless it is already local, deduplicating concurrent
+    requests for the same file. Raises FlightInProgress if another download of
+    it is still running after `timeout` seconds.
     """
-    try:
-        service = get_google_drive_service()
-        if not service:
-            return []
-        
-        # Query for .txt files in the specified folder
-        query = f"'{folder_id}' in parents and mimeType='text/plain' and trashed=false"
-        
+    def fetch():
+        # Another worker may have finished the download while we waited
+        if os.path.exists(local_path):
+            return True
+        return download_file_from_drive(file_id, local_path, progress=progress)
+    
+    if timeout is None:
+        timeout = settings.DRIVE_DOWNLOAD_WAIT_TIMEOUT
+    return drive_downloads.do(file_id, fetch, timeout)
+
+DRIVE_FILE_FIELDS = "id, name, size, modifiedTime, md5Checksum, mimeType, parents, trashed"
+
+def iter_drive_file_pages(folder_id, page_size=1000):
+    """
+    Yield pages (lists) of .txt files in a Google Drive folder, following
+    nextPageToken until the listing is exhausted. Errors are raised.
+    """
+    service = get_google_drive_service()
+    if not service:
+        raise RuntimeError('Google Drive service is not available')
+    
+    # Query for .txt files in the specified folder
+    query = f"'{folder_id}' in parents and mimeType='text/plain' and trashed=false"
+    page_token = None
+    
+    while True:
         results = service.files().list(
             q=query,
-            fields="files(id, name, size, modifiedTime)"
+            pageSize=page_size,
+            pageToken=page_token,
+            fields=f"nextPageToken, files({DRIVE_FILE_FIELDS})"
         ).execute()
         
-        return results.get('files', [])
+        yield results.get('files', [])
+        
+        page_token = results.get('nextPageToken')
+        if not page_token:
+            break
+
+def list_drive_files(folder_id):
+    """
+    List files in Google Drive folder
+    """
+    try:
+        files = []
+        for page in iter_drive_file_pages(folder_id):
+            files.extend(page)
+        return files
         
     except HttpError as error:
         print(f"An error occurred: {error}")
         return []
     except Exception as e:
         print(f"Error listing drive files: {e}")
-        return []
\ No newline at end of file
+        reset_google_drive_service()
+        return []
+
+def get_drive_start_page_token():
+    """
+    Get the token marking "now" in the Drive changes feed
+    """
+    service = get_google_drive_service()
+    if not service:
+        raise RuntimeError('Google Drive service is not available')
+    return service.changes().getStartPageToken().execute()['startPageToken']
+
+def iter_drive_change_pages(page_token, page_size=1000):
+    """
+    Yield (changes, new_start_page_token) pages from the Drive changes feed.
+    new_start_page_token is only set on the last page.
+    """
+    service = get_google_drive_service()
+    if not service:
+        raise RuntimeError('Google Drive service is not available')
+    
+    while page_token:
+        results = service.changes().list(
+            pageToken=page_token,
+            pageSize=page_size,
+            fields=f"nextPageToken, newStartPageToken, changes(fileId, removed, file({DRIVE_FILE_FIELDS}))"
+        ).execute()
+        
+        yield results.get('changes', []), results.get('newStartPageToken')
+        page_token = results.get('nextPageToken')
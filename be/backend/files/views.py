@@ -1,161 +1,178 @@
 import os
+import re
 import subprocess
-import json
+import hashlib
 from rest_framework import status
-from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.decorators import api_view, permission_classes, renderer_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
-from rest_framework.authtoken.models import Token
 from django.conf import settings
-from django.http import HttpResponse, Http404
-from django.contrib.auth import authenticate, get_user_model
-from django.views.decorators.csrf import csrf_exempt
+from django.core.cache import cache
+from django.db.models import Q, Sum
+from django.http import HttpResponse, Http404, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+from django.contrib.auth import get_user_model
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
-from .models import FileAccess, FileMetadata
-from .serializers import FileMetadataSerializer, FileAccessSerializer
-from .utils import get_google_drive_service, download_file_from_drive
+from .models import DownloadJob, FileAccess, FileAccessDailyRollup, FileMetadata
+from .serializers import FileMetadataSerializer, FileAccessSerializer, DownloadJobSerializer
+from .utils import get_google_drive_service
+from .jobs import enqueue_download
+from .audit import log_access
+from .catalog import listing_cache_key
+from .content import build_content_response
+from .disk_cache import cache_stats
+from .export import EXPORT_FORMATS, export_rows, iter_export, latest_event_id
+from .grep import compile_pattern, iter_ndjson_records, scan_file
+from .line_index import get_line_index
+from .permissions import get_permission_snapshot
+from .prefetch import record_open
+from .renderers import CSVRenderer, EventStreamRenderer, GzipRenderer, NDJSONRenderer, PlainTextRenderer
+from .search import SearchIndexError, search
+from .tail import FollowStream, TailCursor, follow, followers, iter_sse, read_last_lines
+from .pagination import (
+    decode_cursor, encode_cursor, parse_bool, parse_date_param, parse_datetime_param, parse_limit
+)
+from . import metrics
 
 # ✅ Get the custom user model
 User = get_user_model()
 
 # ============================================
-# Authentication Views
+# File Management Views (Your existing views with debug logs)
 # ============================================
 
-@api_view(['POST'])
-@permission_classes([AllowAny])
-@csrf_exempt
-def login_view(request):
+def build_file_listing(user, params):
     """
-    Login endpoint that returns authentication token
+    Build the list_files payload; returns (payload, error_response)
     """
     try:
-        data = json.loads(request.body)
-        username = data.get('username')
-        password = data.get('password')
-        
-        print(f"Login attempt for username: {username}")  # Debug log
-        
-        if not username or not password:
-            return Response({
-                'error': 'Username and password are required'
+        limit = parse_limit(params.get('limit'), settings.FILE_LIST_DEFAULT_LIMIT,
+                            settings.FILE_LIST_MAX_LIMIT)
+        is_local = parse_bool(params.get('is_local'))
+        min_size = int(params['min_size']) if params.get('min_size') else None
+        max_size = int(params['max_size']) if params.get('max_size') else None
+        modified_since = parse_datetime_param(params.get('modified_since'))
+        cursor = decode_cursor(params['cursor'], 2) if params.get('cursor') else None
+    except ValueError as e:
+        return None, Response({
+            'success': False,
+            'message': str(e)
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    fields = None
+    if params.get('fields'):
+        fields = [name.strip() for name in params['fields'].split(',') if name.strip()]
+        unknown = set(fields) - set(FileMetadataSerializer.Meta.fields)
+        if unknown:
+            return None, Response({
+                'success': False,
+                'message': f"Unknown fields: {', '.join(sorted(unknown))}"
             }, status=status.HTTP_400_BAD_REQUEST)
-        
-        user = authenticate(username=username, password=password)
-        
-        if user and user.is_active:
-            # Create or get token
-            token, created = Token.objects.get_or_create(user=user)
-            
-            print(f"Login successful for user: {user.username}, role: {getattr(user, 'role', 'N/A')}")  # Debug log
-            
-            return Response({
-                'token': token.key,
-                'user_id': user.id,
-                'username': user.username,
-                'role': getattr(user, 'role', None),
-                'message': 'Login successful'
-            }, status=status.HTTP_200_OK)
-        else:
-            print(f"Authentication failed for username: {username}")  # Debug log
-            return Response({
-                'error': 'Invalid credentials'
-            }, status=status.HTTP_401_UNAUTHORIZED)
-            
-    except json.JSONDecodeError:
-        return Response({
-            'error': 'Invalid JSON'
+    
+    count_mode = params.get('count')
+    if count_mode not in (None, 'estimate', 'exact'):
+        return None, Response({
+            'success': False,
+            'message': 'count must be "estimate" or "exact"'
         }, status=status.HTTP_400_BAD_REQUEST)
-    except Exception as e:
-        print(f"Login error: {str(e)}")  # Debug log
-        return Response({
-            'error': str(e)
-        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
-@api_view(['POST'])
-@permission_classes([IsAuthenticated])
-def logout_view(request):
-    """
-    Logout endpoint that deletes the authentication token
-    """
-    try:
-        print(f"Logout request from user: {request.user.username}")  # Debug log
-        
-        # Delete the token to logout
-        request.user.auth_token.delete()
-        return Response({
-            'message': 'Logout successful'
-        }, status=status.HTTP_200_OK)
-    except Exception as e:
-        print(f"Logout error: {str(e)}")  # Debug log
-        return Response({
-            'error': str(e)
-        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
-@api_view(['GET'])
-@permission_classes([IsAuthenticated])
-def check_auth_view(request):
-    """
-    Check if user is authenticated and return user info
-    """
-    print(f"Auth check for user: {request.user.username}, role: {getattr(request.user, 'role', 'N/A')}")  # Debug log
     
-    return Response({
-        'authenticated': True,
-        'user_id': request.user.id,
-        'username': request.user.username,
-        'role': getattr(request.user, 'role', None)
-    }, status=status.HTTP_200_OK)
-
-@api_view(['GET'])
-@permission_classes([IsAuthenticated])
-def user_view(request):
-    """
-    Get current user information
-    """
-    print(f"User info request from: {request.user.username}")  # Debug log
+    # Get files based on user role
+    if hasattr(user, 'role') and user.role == 'Admin':
+        files = FileMetadata.objects.all()
+    elif hasattr(user, 'role'):
+        files = FileMetadata.objects.visible_to_role(user.role)
+    else:
+        # If no role attribute, return empty or all files based on your logic
+        files = FileMetadata.objects.all()  # or FileMetadata.objects.none()
     
-    return Response({
-        'user_id': request.user.id,
-        'username': request.user.username,
-        'role': getattr(request.user, 'role', None),
-        'email': getattr(request.user, 'email', ''),
-        'first_name': getattr(request.user, 'first_name', ''),
-        'last_name': getattr(request.user, 'last_name', ''),
-    }, status=status.HTTP_200_OK)
-
-# ============================================
-# File Management Views (Your existing views with debug logs)
-# ============================================
+    # Indexed filters
+    if is_local is not None:
+        files = files.filter(is_local=is_local)
+    if min_size is not None:
+        files = files.filter(size__gte=min_size)
+    if max_size is not None:
+        files = files.filter(size__lte=max_size)
+    if modified_since is not None:
+        files = files.filter(last_modified__gte=modified_since)
+    filtered = files
+    
+    if cursor is not None:
+        after_filename, after_id = cursor
+        files = files.filter(
+            Q(filename__gt=after_filename) | Q(filename=after_filename, id__gt=after_id)
+        )
+    if fields is not None:
+        files = files.only(*set(fields) | {'id', 'filename'})
+    
+    page = list(files.order_by('filename', 'id')[:limit + 1])
+    has_more = len(page) > limit
+    page = page[:limit]
+    
+    serializer = FileMetadataSerializer(page, many=True, fields=fields)
+    
+    payload = {
+        'success': True,
+        'files': serializer.data,
+        'next_cursor': encode_cursor([page[-1].filename, page[-1].id]) if has_more else None
+    }
+    
+    if count_mode == 'exact':
+        payload['count'] = filtered.count()
+    elif count_mode == 'estimate':
+        # A recent count is good enough for progress bars and page hints
+        count_key = 'files:count:' + hashlib.sha1(
+            f"{getattr(user, 'role', '')}|{is_local}|{min_size}|{max_size}|{modified_since}".encode('utf-8')
+        ).hexdigest()
+        payload['count'] = cache.get_or_set(count_key, filtered.count,
+                                            settings.FILE_LIST_COUNT_CACHE_SECONDS)
+        payload['count_is_estimate'] = True
+    
+    return payload, None
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def list_files(request):
     """
-    Get list of available .txt files based on user role
+    Get list of available .txt files based on user role.
+
+    Keyset-paginated on (filename, id). Query params: limit, cursor,
+    fields (comma-separated), is_local, min_size, max_size, modified_since
+    (ISO 8601) and count=estimate|exact.
+
+    Listings depend only on the role and the query, so the rendered body is
+    cached per role under the current catalog version and served with an
+    ETag; any FileMetadata change bumps the version.
     """
     user = request.user
     print(f"Files list request from user: {user.username}, role: {getattr(user, 'role', 'N/A')}")  # Debug log
     
     try:
-        # Get files based on user role
-        if hasattr(user, 'role') and user.role == 'Admin':
-            files = FileMetadata.objects.all()
-        elif hasattr(user, 'role'):
-            files = FileMetadata.objects.filter(allowed_roles__contains=[user.role])
-        else:
-            # If no role attribute, return empty or all files based on your logic
-            files = FileMetadata.objects.all()  # or FileMetadata.objects.none()
-        
-        serializer = FileMetadataSerializer(files, many=True)
+        cache_key = listing_cache_key(getattr(user, 'role', ''), request.query_params)
+        cached = cache.get(cache_key)
         
-        print(f"Returning {len(serializer.data)} files for user {user.username}")  # Debug log
+        if cached is None:
+            metrics.incr('files.list_cache.miss')
+            payload, error_response = build_file_listing(user, request.query_params)
+            if error_response is not None:
+                return error_response
+            
+            body = JSONRenderer().render(payload)
+            cached = (quote_etag(hashlib.md5(body).hexdigest()), body)
+            cache.set(cache_key, cached, settings.FILE_LIST_CACHE_SECONDS)
+            print(f"Returning {len(payload['files'])} files for user {user.username}")  # Debug log
+        else:
+            metrics.incr('files.list_cache.hit')
         
-        return Response({
-            'success': True,
-            'files': serializer.data
-        }, status=status.HTTP_200_OK)
+        etag, body = cached
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(body, content_type='application/json')
+        response['ETag'] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
         
     except Exception as e:
         print(f"Error in list_files: {str(e)}")  # Debug log
@@ -164,6 +181,26 @@ def list_files(request):
             'error': str(e)
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+def authorize_file(user, filename):
+    """
+    Check a file-level permission against the in-memory snapshot;
+    returns (snapshot, error_response)
+    """
+    snapshot = get_permission_snapshot()
+    allowed = snapshot.can_access(user, filename)
+    if allowed is None:
+        print(f"File metadata not found for: {filename}")  # Debug log
+        return snapshot, Response({
+            'success': False,
+            'message': 'File not found'
+        }, status=status.HTTP_404_NOT_FOUND)
+    if not allowed:
+        return snapshot, Response({
+            'success': False,
+            'message': 'Access denied'
+        }, status=status.HTTP_403_FORBIDDEN)
+    return snapshot, None
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def check_file_exists(request, filename):
@@ -174,34 +211,20 @@ def check_file_exists(request, filename):
     print(f"File check request for: {filename} from user: {user.username}")  # Debug log
     
     try:
-        file_metadata = FileMetadata.objects.get(filename=filename)
-        
-        # Check if user has permission to access this file
-        if (hasattr(user, 'role') and user.role != 'Admin' and 
-            hasattr(file_metadata, 'allowed_roles') and 
-            user.role not in file_metadata.allowed_roles):
-            return Response({
-                'success': False,
-                'message': 'Access denied'
-            }, status=status.HTTP_403_FORBIDDEN)
+        snapshot, error_response = authorize_file(user, filename)
+        if error_response is not None:
+            return error_response
         
         # Check if file exists locally
         file_path = os.path.join(settings.FILES_DIR, filename)
         exists_locally = os.path.exists(file_path)
         
         print(f"File {filename} exists locally: {exists_locally}")  # Debug log
+        record_open(snapshot, filename, exists_locally)
         
         # Log the access attempt
-        try:
-            FileAccess.objects.create(
-                user=user,
-                filename=filename,
-                action='view',
-                ip_address=request.META.get('REMOTE_ADDR'),
-                success=exists_locally
-            )
-        except Exception as log_error:
-            print(f"Failed to log access: {log_error}")  # Debug log
+        log_access(user, filename, 'view',
+                   ip_address=request.META.get('REMOTE_ADDR'), success=exists_locally)
         
         if exists_locally:
             return Response({
@@ -215,15 +238,9 @@ def check_file_exists(request, filename):
                 'success': True,
                 'exists': False,
                 'message': 'Not available locally',
-                'download_available': bool(getattr(file_metadata, 'google_drive_id', None))
+                'download_available': snapshot.has_drive_copy(filename)
             }, status=status.HTTP_200_OK)
             
-    except FileMetadata.DoesNotExist:
-        print(f"File metadata not found for: {filename}")  # Debug log
-        return Response({
-            'success': False,
-            'message': 'File not found'
-        }, status=status.HTTP_404_NOT_FOUND)
     except Exception as e:
         print(f"Error in check_file_exists: {str(e)}")  # Debug log
         return Response({
@@ -235,22 +252,15 @@ def check_file_exists(request, filename):
 @permission_classes([IsAuthenticated])
 def download_file(request, filename):
     """
-    Download file from Google Drive if not available locally
+    Queue a download from Google Drive if the file is not available locally
     """
     user = request.user
     print(f"File download request for: {filename} from user: {user.username}")  # Debug log
     
     try:
-        file_metadata = FileMetadata.objects.get(filename=filename)
-        
-        # Check permissions
-        if (hasattr(user, 'role') and user.role != 'Admin' and 
-            hasattr(file_metadata, 'allowed_roles') and 
-            user.role not in file_metadata.allowed_roles):
-            return Response({
-                'success': False,
-                'message': 'Access denied'
-            }, status=status.HTTP_403_FORBIDDEN)
+        snapshot, error_response = authorize_file(user, filename)
+        if error_response is not None:
+            return error_response
         
         # Check if file already exists locally
         local_path = os.path.join(settings.FILES_DIR, filename)
@@ -261,60 +271,27 @@ def download_file(request, filename):
                 'local_path': local_path
             }, status=status.HTTP_200_OK)
         
-        # Download from Google Drive
-        if hasattr(file_metadata, 'google_drive_id') and file_metadata.google_drive_id:
-            try:
-                success = download_file_from_drive(
-                    file_metadata.google_drive_id, 
-                    local_path
-                )
-                
-                # Log the download attempt
-                try:
-                    FileAccess.objects.create(
-                        user=user,
-                        filename=filename,
-                        action='download',
-                        ip_address=request.META.get('REMOTE_ADDR'),
-                        success=success
-                    )
-                except Exception as log_error:
-                    print(f"Failed to log download: {log_error}")  # Debug log
-                
-                if success:
-                    if hasattr(file_metadata, 'is_local'):
-                        file_metadata.is_local = True
-                        file_metadata.save()
-                    
-                    return Response({
-                        'success': True,
-                        'message': 'File downloaded successfully from Google Drive',
-                        'local_path': local_path
-                    }, status=status.HTTP_200_OK)
-                else:
-                    return Response({
-                        'success': False,
-                        'message': 'Failed to download file from Google Drive'
-                    }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-                    
-            except Exception as e:
-                print(f"Error downloading from Drive: {str(e)}")  # Debug log
-                return Response({
-                    'success': False,
-                    'message': f'Error downloading file: {str(e)}'
-                }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        # Queue a background download from Google Drive
+        if snapshot.has_drive_copy(filename):
+            job, created = enqueue_download(
+                snapshot.file_id(filename),
+                user=user,
+                ip_address=request.META.get('REMOTE_ADDR')
+            )
+            print(f"Download job {job.id} for {filename} ({'queued' if created else 'already active'})")  # Debug log
+            
+            return Response({
+                'success': True,
+                'message': 'Download queued' if created else 'Download already in progress',
+                'job_id': job.id,
+                'status': job.status
+            }, status=status.HTTP_202_ACCEPTED)
         else:
             return Response({
                 'success': False,
                 'message': 'File not available on Google Drive'
             }, status=status.HTTP_404_NOT_FOUND)
             
-    except FileMetadata.DoesNotExist:
-        print(f"File metadata not found for download: {filename}")  # Debug log
-        return Response({
-            'success': False,
-            'message': 'File not found'
-        }, status=status.HTTP_404_NOT_FOUND)
     except Exception as e:
         print(f"Error in download_file: {str(e)}")  # Debug log
         return Response({
@@ -324,25 +301,53 @@ def download_file(request, filename):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
-def open_file_notepad(request, filename):
+def download_job_status(request, job_id):
     """
-    Open file in Notepad (Windows) or default text editor
+    Get the status of a background download job
     """
     user = request.user
-    print(f"File open request for: {filename} from user: {user.username}")  # Debug log
     
     try:
-        file_metadata = FileMetadata.objects.get(filename=filename)
+        job = DownloadJob.objects.select_related('file').get(pk=job_id)
         
-        # Check permissions
-        if (hasattr(user, 'role') and user.role != 'Admin' and 
-            hasattr(file_metadata, 'allowed_roles') and 
-            user.role not in file_metadata.allowed_roles):
+        # Users can follow jobs for files they are allowed to see
+        if not get_permission_snapshot().can_access(user, job.file.filename):
             return Response({
                 'success': False,
                 'message': 'Access denied'
             }, status=status.HTTP_403_FORBIDDEN)
         
+        return Response({
+            'success': True,
+            'job': DownloadJobSerializer(job).data
+        }, status=status.HTTP_200_OK)
+        
+    except DownloadJob.DoesNotExist:
+        return Response({
+            'success': False,
+            'message': 'Job not found'
+        }, status=status.HTTP_404_NOT_FOUND)
+    except Exception as e:
+        print(f"Error in download_job_status: {str(e)}")  # Debug log
+        return Response({
+            'success': False,
+            'error': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def open_file_notepad(request, filename):
+    """
+    Open file in Notepad (Windows) or default text editor
+    """
+    user = request.user
+    print(f"File open request for: {filename} from user: {user.username}")  # Debug log
+    
+    try:
+        snapshot, error_response = authorize_file(user, filename)
+        if error_response is not None:
+            return error_response
+        
         file_path = os.path.join(settings.FILES_DIR, filename)
         
         if os.path.exists(file_path):
@@ -354,16 +359,8 @@ def open_file_notepad(request, filename):
                     subprocess.Popen(['xdg-open', file_path])
                 
                 # Log the access
-                try:
-                    FileAccess.objects.create(
-                        user=user,
-                        filename=filename,
-                        action='view',
-                        ip_address=request.META.get('REMOTE_ADDR'),
-                        success=True
-                    )
-                except Exception as log_error:
-                    print(f"Failed to log file open: {log_error}")  # Debug log
+                log_access(user, filename, 'view',
+                           ip_address=request.META.get('REMOTE_ADDR'), success=True)
                 
                 return Response({
                     'success': True,
@@ -382,14 +379,335 @@ def open_file_notepad(request, filename):
                 'message': 'File not found locally'
             }, status=status.HTTP_404_NOT_FOUND)
             
-    except FileMetadata.DoesNotExist:
-        print(f"File metadata not found for open: {filename}")  # Debug log
+    except Exception as e:
+        print(f"Error in open_file_notepad: {str(e)}")  # Debug log
         return Response({
             'success': False,
-            'message': 'File not found'
-        }, status=status.HTTP_404_NOT_FOUND)
+            'error': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@renderer_classes([JSONRenderer, PlainTextRenderer])
+def file_content(request, filename):
+    """
+    Stream local file content with Range and conditional GET support
+    """
+    user = request.user
+    print(f"File content request for: {filename} from user: {user.username}")  # Debug log
+    
+    try:
+        snapshot, error_response = authorize_file(user, filename)
+        if error_response is not None:
+            return error_response
+        
+        file_path = os.path.join(settings.FILES_DIR, filename)
+        
+        if not os.path.exists(file_path):
+            return Response({
+                'success': False,
+                'message': 'File not found locally'
+            }, status=status.HTTP_404_NOT_FOUND)
+        
+        response = build_content_response(request, file_path)
+        
+        # Only log reads that actually transfer content, not 304 revalidations
+        if response.status_code in (200, 206):
+            log_access(user, filename, 'view',
+                       ip_address=request.META.get('REMOTE_ADDR'), success=True)
+        
+        return response
+        
     except Exception as e:
-        print(f"Error in open_file_notepad: {str(e)}")  # Debug log
+        print(f"Error in file_content: {str(e)}")  # Debug log
+        return Response({
+            'success': False,
+            'error': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def file_lines(request, filename):
+    """
+    Get a page of lines from a local text file (?start=N&count=K)
+    """
+    user = request.user
+    print(f"File lines request for: {filename} from user: {user.username}")  # Debug log
+    
+    try:
+        try:
+            start = int(request.query_params.get('start', 0))
+            count = int(request.query_params.get('count', settings.FILE_LINES_DEFAULT_PAGE))
+        except ValueError:
+            return Response({
+                'success': False,
+                'message': 'start and count must be integers'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        if start < 0 or count < 1:
+            return Response({
+                'success': False,
+                'message': 'start must be >= 0 and count must be >= 1'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        count = min(count, settings.FILE_LINES_MAX_PAGE)
+        
+        snapshot, error_response = authorize_file(user, filename)
+        if error_response is not None:
+            return error_response
+        
+        file_path = os.path.join(settings.FILES_DIR, filename)
+        
+        if not os.path.exists(file_path):
+            return Response({
+                'success': False,
+                'message': 'File not found locally'
+            }, status=status.HTTP_404_NOT_FOUND)
+        
+        index = get_line_index(filename)
+        lines = index.read_lines(start, count)
+        
+        return Response({
+            'success': True,
+            'filename': filename,
+            'start': start,
+            'count': len(lines),
+            'total_lines': index.line_count,
+            'has_more': start + len(lines) < index.line_count,
+            'lines': lines
+        }, status=status.HTTP_200_OK)
+        
+    except Exception as e:
+        print(f"Error in file_lines: {str(e)}")  # Debug log
+        return Response({
+            'success': False,
+            'error': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@renderer_classes([JSONRenderer, NDJSONRenderer])
+def grep_file(request, filename):
+    """
+    Stream the lines of a local file that match a regular expression as NDJSON
+
+    Query params: pattern (required), fixed=1 (literal string), ignore_case=1,
+    context=N (lines before and after each match), max_matches=N. Records are
+    match, progress and a final summary; see files.grep.scan_file.
+    """
+    user = request.user
+    params = request.query_params
+    pattern = params.get('pattern', '')
+    print(f"Grep request for: {filename} pattern: {pattern!r} from user: {user.username}")  # Debug log
+    
+    try:
+        if not pattern:
+            raise ValueError('pattern is required')
+        if len(pattern) > settings.GREP_MAX_PATTERN_LENGTH:
+            raise ValueError(f'pattern must be at most {settings.GREP_MAX_PATTERN_LENGTH} characters')
+        context = int(params.get('context', 0))
+        if not 0 <= context <= settings.GREP_MAX_CONTEXT:
+            raise ValueError(f'context must be between 0 and {settings.GREP_MAX_CONTEXT}')
+        max_matches = parse_limit(params.get('max_matches'), settings.GREP_MAX_MATCHES, settings.GREP_MAX_MATCHES)
+        ignore_case = parse_bool(params.get('ignore_case')) or False
+        fixed = parse_bool(params.get('fixed')) or False
+        # Compiled here only to reject invalid patterns with a 400
+        compile_pattern(pattern, ignore_case=ignore_case, fixed=fixed)
+    except re.error as e:
+        return Response({
+            'success': False,
+            'message': f'Invalid pattern: {e}'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    except ValueError as e:
+        return Response({
+            'success': False,
+            'message': str(e)
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        snapshot, error_response = authorize_file(user, filename)
+        if error_response is not None:
+            return error_response
+        
+        file_path = os.path.join(settings.FILES_DIR, filename)
+        
+        if not os.path.exists(file_path):
+            return Response({
+                'success': False,
+                'message': 'File not found locally'
+            }, status=status.HTTP_404_NOT_FOUND)
+        
+        log_access(user, filename, 'view',
+                   ip_address=request.META.get('REMOTE_ADDR'), success=True)
+        metrics.incr('grep.requests')
+        
+        records = scan_file(file_path, pattern, ignore_case=ignore_case, fixed=fixed,
+                            context=context, max_matches=max_matches)
+        response = StreamingHttpResponse(iter_ndjson_records(records),
+                                         content_type='application/x-ndjson; charset=utf-8')
+        response['Cache-Control'] = 'no-store'
+        # Ask reverse proxies not to buffer, so matches arrive as they are found
+        response['X-Accel-Buffering'] = 'no'
+        return response
+        
+    except Exception as e:
+        print(f"Error in grep_file: {str(e)}")  # Debug log
+        return Response({
+            'success': False,
+            'error': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@renderer_classes([JSONRenderer, EventStreamRenderer])
+def tail_file(request, filename):
+    """
+    Get the last lines of a local text file, optionally following it as it grows
+
+    Query params: lines=N (default TAIL_DEFAULT_LINES), follow=sse|poll,
+    cursor (resume point from a previous response). Without follow the last
+    N lines are returned as JSON. follow=sse streams Server-Sent Events
+    ('lines', 'reset') and resumes from Last-Event-ID; follow=poll waits up
+    to wait=S seconds for the next event. A 'lines' event starting at a
+    given offset replaces anything the client holds from that offset on,
+    which is how an unterminated last line gets completed. 'reset' means
+    the file was truncated or rotated and reading starts over at 0.
+    """
+    user = request.user
+    params = request.query_params
+    mode = params.get('follow')
+    print(f"Tail request for: {filename} follow: {mode} from user: {user.username}")  # Debug log
+    
+    try:
+        count = parse_limit(params.get('lines'), settings.TAIL_DEFAULT_LINES, settings.TAIL_MAX_LINES)
+        if mode not in (None, 'sse', 'poll'):
+            raise ValueError('follow must be "sse" or "poll"')
+        resume = request.META.get('HTTP_LAST_EVENT_ID') if mode == 'sse' else None
+        resume = resume or params.get('cursor')
+        cursor = TailCursor.parse(resume) if resume else None
+        wait = float(params.get('wait', settings.TAIL_LONG_POLL_MAX_WAIT))
+        wait = min(max(wait, 0), settings.TAIL_LONG_POLL_MAX_WAIT)
+    except ValueError as e:
+        return Response({
+            'success': False,
+            'message': str(e)
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        snapshot, error_response = authorize_file(user, filename)
+        if error_response is not None:
+            return error_response
+        
+        file_path = os.path.join(settings.FILES_DIR, filename)
+        
+        if not os.path.exists(file_path):
+            return Response({
+                'success': False,
+                'message': 'File not found locally'
+            }, status=status.HTTP_404_NOT_FOUND)
+        
+        first = None
+        if cursor is None or mode is None:
+            lines, offset, partial, cursor = read_last_lines(file_path, count)
+            first = ('lines', cursor, {'lines': lines, 'offset': offset, 'partial': partial})
+        
+        log_access(user, filename, 'view',
+                   ip_address=request.META.get('REMOTE_ADDR'), success=True)
+        metrics.incr('tail.requests')
+        
+        if mode is None or (mode == 'poll' and first is not None):
+            return Response({
+                'success': True,
+                'filename': filename,
+                'event': 'lines',
+                'cursor': cursor.encode(),
+                **first[2]
+            }, status=status.HTTP_200_OK)
+        
+        if not followers.acquire():
+            response = Response({
+                'success': False,
+                'message': 'Too many followers on this worker, retry later'
+            }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            response['Retry-After'] = str(settings.TAIL_RETRY_MS // 1000 or 1)
+            return response
+        
+        if mode == 'poll':
+            events = follow(file_path, cursor, max_seconds=wait, heartbeat=wait + 1)
+            try:
+                kind, cursor, payload = next(events, ('timeout', cursor, {}))
+            finally:
+                events.close()
+                followers.release()
+            return Response({
+                'success': True,
+                'filename': filename,
+                'event': kind,
+                'cursor': cursor.encode(),
+                **payload
+            }, status=status.HTTP_200_OK)
+        
+        stream = FollowStream(iter_sse(follow(file_path, cursor), first=first))
+        response = StreamingHttpResponse(stream, content_type='text/event-stream; charset=utf-8')
+        response['Cache-Control'] = 'no-store'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+        
+    except Exception as e:
+        print(f"Error in tail_file: {str(e)}")  # Debug log
+        return Response({
+            'success': False,
+            'error': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def search_files(request):
+    """
+    Full-text search over local file contents, limited to the files the
+    user's role may see (?q=...&limit=N&offset=M)
+    """
+    user = request.user
+    params = request.query_params
+    query = params.get('q', '').strip()
+    print(f"Search request for: {query!r} from user: {user.username}")  # Debug log
+    
+    try:
+        limit = parse_limit(params.get('limit'), settings.SEARCH_DEFAULT_LIMIT, settings.SEARCH_MAX_LIMIT)
+        offset = int(params.get('offset', 0))
+        if offset < 0:
+            raise ValueError('offset must be >= 0')
+    except ValueError as e:
+        return Response({
+            'success': False,
+            'message': str(e)
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    if not query:
+        return Response({
+            'success': False,
+            'message': 'q is required'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        role = getattr(user, 'role', None)
+        visible = None if role in (None, 'Admin') else get_permission_snapshot().visible_files(role)
+        results = search(query, visible=visible, limit=limit, offset=offset)
+        
+        return Response({
+            'success': True,
+            'query': query,
+            'offset': offset,
+            'count': len(results),
+            'results': results
+        }, status=status.HTTP_200_OK)
+        
+    except SearchIndexError as e:
+        return Response({
+            'success': False,
+            'message': str(e)
+        }, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        print(f"Error in search_files: {str(e)}")  # Debug log
         return Response({
             'success': False,
             'error': str(e)
@@ -400,6 +718,10 @@ def open_file_notepad(request, filename):
 def activity_logs(request):
     """
     Get activity logs (Admin and Manager only)
+
+    Newest first, keyset-paginated on (timestamp, id). Query params: limit,
+    cursor, user (username), filename, action, success, since and until
+    (ISO 8601).
     """
     user = request.user
     print(f"Activity logs request from user: {user.username}, role: {getattr(user, 'role', 'N/A')}")  # Debug log
@@ -411,21 +733,66 @@ def activity_logs(request):
                 'message': 'Access denied'
             }, status=status.HTTP_403_FORBIDDEN)
         
-        # Admin can see all logs, Manager can see their team's logs
+        params = request.query_params
+        try:
+            limit = parse_limit(params.get('limit'), settings.ACTIVITY_LOG_DEFAULT_LIMIT,
+                                settings.ACTIVITY_LOG_MAX_LIMIT)
+            success = parse_bool(params.get('success'))
+            since = parse_datetime_param(params.get('since'))
+            until = parse_datetime_param(params.get('until'))
+            cursor = decode_cursor(params['cursor'], 2) if params.get('cursor') else None
+            if cursor is not None:
+                if not isinstance(cursor[0], str) or not isinstance(cursor[1], int):
+                    raise ValueError('Invalid cursor')
+                cursor[0] = parse_datetime_param(cursor[0])
+        except ValueError as e:
+            return Response({
+                'success': False,
+                'message': str(e)
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Admin can see all logs, Manager can see their team's logs; the
+        # role recorded on each event keeps this on an index, without a join
         if user.role == 'Admin':
-            logs = FileAccess.objects.all().order_by('-id')[:50]  # Last 50 activities
+            logs = FileAccess.objects.all()
         else:  # Manager
-            logs = FileAccess.objects.filter(
-                user__role__in=['Manager', 'Employee']
-            ).order_by('-id')[:50]
+            logs = FileAccess.objects.filter(user_role__in=['Manager', 'Employee'])
+        
+        if params.get('user'):
+            # Resolved up front so the filter uses the (user, timestamp) index
+            logs = logs.filter(user_id__in=list(
+                User.objects.filter(username=params['user']).values_list('id', flat=True)
+            ))
+        if params.get('filename'):
+            logs = logs.filter(filename=params['filename'])
+        if params.get('action'):
+            logs = logs.filter(action=params['action'])
+        if success is not None:
+            logs = logs.filter(success=success)
+        if since is not None:
+            logs = logs.filter(timestamp__gte=since)
+        if until is not None:
+            logs = logs.filter(timestamp__lt=until)
+        if cursor is not None:
+            before_timestamp, before_id = cursor
+            # A range plus an exclusion instead of an OR, so the planner
+            # keeps walking the timestamp index from the cursor position
+            logs = logs.filter(timestamp__lte=before_timestamp).exclude(
+                timestamp=before_timestamp, id__gte=before_id
+            )
+        
+        page = list(logs.select_related('user').order_by('-timestamp', '-id')[:limit + 1])
+        has_more = len(page) > limit
+        page = page[:limit]
         
-        serializer = FileAccessSerializer(logs, many=True)
+        serializer = FileAccessSerializer(page, many=True)
         
         print(f"Returning {len(serializer.data)} activity logs")  # Debug log
         
         return Response({
             'success': True,
-            'activities': serializer.data
+            'activities': serializer.data,
+            'next_cursor': encode_cursor([page[-1].timestamp.isoformat(), page[-1].id]) if has_more else None
         }, status=status.HTTP_200_OK)
         
     except Exception as e:
@@ -433,4 +800,181 @@ def activity_logs(request):
         return Response({
             'success': False,
             'error': str(e)
-        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@renderer_classes([JSONRenderer, NDJSONRenderer, CSVRenderer, GzipRenderer])
+def export_activity_logs(request):
+    """
+    Stream the audit trail as NDJSON or CSV (Admin and Manager only)
+
+    Rows are sent in id order. Query params: type=ndjson|csv, gzip=1,
+    after_id (resume after the last id received), since, until, user,
+    filename, action. The export stops at the newest id that existed
+    when it started, reported in the X-Export-Through-Id header.
+    """
+    user = request.user
+    print(f"Activity export request from user: {user.username}, role: {getattr(user, 'role', 'N/A')}")  # Debug log
+    
+    if not hasattr(user, 'role') or user.role not in ['Admin', 'Manager']:
+        return Response({
+            'success': False,
+            'message': 'Access denied'
+        }, status=status.HTTP_403_FORBIDDEN)
+    
+    params = request.query_params
+    export_format = params.get('type', 'ndjson')
+    try:
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError('type must be "ndjson" or "csv"')
+        compress = parse_bool(params.get('gzip')) or False
+        after_id = int(params['after_id']) if params.get('after_id') else None
+        since = parse_datetime_param(params.get('since'))
+        until = parse_datetime_param(params.get('until'))
+    except ValueError as e:
+        return Response({
+            'success': False,
+            'message': str(e)
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    if user.role == 'Admin':
+        events = FileAccess.objects.all()
+    else:  # Manager
+        events = FileAccess.objects.filter(user_role__in=['Manager', 'Employee'])
+    if params.get('user'):
+        events = events.filter(user__username=params['user'])
+    if params.get('filename'):
+        events = events.filter(filename=params['filename'])
+    if params.get('action'):
+        events = events.filter(action=params['action'])
+    if since is not None:
+        events = events.filter(timestamp__gte=since)
+    if until is not None:
+        events = events.filter(timestamp__lt=until)
+    
+    through_id = latest_event_id()
+    rows = export_rows(events, after_id=after_id, through_id=through_id)
+    response = StreamingHttpResponse(
+        iter_export(rows, export_format, compress=compress),
+        content_type=EXPORT_FORMATS[export_format] + '; charset=utf-8'
+    )
+    filename = f"file-access-{after_id or 0}-{through_id}.{export_format}"
+    if compress:
+        # The file itself is gzipped, not a transfer encoding
+        response['Content-Type'] = 'application/gzip'
+        filename += '.gz'
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response['X-Export-Through-Id'] = str(through_id)
+    response['Cache-Control'] = 'no-store'
+    return response
+
+ROLLUP_GROUP_FIELDS = {
+    'day': 'day',
+    'user': 'user__username',
+    'filename': 'filename',
+    'action': 'action',
+}
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def activity_rollups(request):
+    """
+    Get daily activity counts from the rollup table (Admin and Manager only)
+
+    Query parameters: from, to (YYYY-MM-DD), user, filename, action,
+    group_by (comma-separated: day, user, filename, action; default day), limit.
+    """
+    user = request.user
+    
+    if not hasattr(user, 'role') or user.role not in ['Admin', 'Manager']:
+        return Response({
+            'success': False,
+            'message': 'Access denied'
+        }, status=status.HTTP_403_FORBIDDEN)
+    
+    params = request.query_params
+    try:
+        group_by = [name.strip() for name in params.get('group_by', 'day').split(',') if name.strip()]
+        unknown = set(group_by) - set(ROLLUP_GROUP_FIELDS)
+        if unknown or not group_by:
+            raise ValueError(f"Invalid group_by: {', '.join(sorted(unknown)) or 'empty'}")
+        limit = parse_limit(params.get('limit'), 100, 1000)
+        first_day = parse_date_param(params.get('from'))
+        last_day = parse_date_param(params.get('to'))
+    except ValueError as e:
+        return Response({
+            'success': False,
+            'error': str(e)
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    rollups = FileAccessDailyRollup.objects.all()
+    if user.role == 'Manager':
+        rollups = rollups.filter(user__role__in=['Manager', 'Employee'])
+    if first_day:
+        rollups = rollups.filter(day__gte=first_day)
+    if last_day:
+        rollups = rollups.filter(day__lte=last_day)
+    if params.get('user'):
+        rollups = rollups.filter(user__username=params['user'])
+    if params.get('filename'):
+        rollups = rollups.filter(filename=params['filename'])
+    if params.get('action'):
+        rollups = rollups.filter(action=params['action'])
+    
+    columns = [ROLLUP_GROUP_FIELDS[name] for name in group_by]
+    ordering = ['-day' if column == 'day' else column for column in columns]
+    rows = (
+        rollups.order_by()
+        .values(*columns)
+        .annotate(count=Sum('count'), failure_count=Sum('failure_count'))
+        .order_by(*ordering)[:limit]
+    )
+    results = [
+        dict({name: row[ROLLUP_GROUP_FIELDS[name]] for name in group_by},
+             count=row['count'], failure_count=row['failure_count'])
+        for row in rows
+    ]
+    
+    return Response({
+        'success': True,
+        'rollups': results
+    }, status=status.HTTP_200_OK)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def metrics_view(request):
+    """
+    Get process-local performance counters and timings (Admin only)
+    """
+    user = request.user
+    
+    if not hasattr(user, 'role') or user.role != 'Admin':
+        return Response({
+            'success': False,
+            'message': 'Access denied'
+        }, status=status.HTTP_403_FORBIDDEN)
+    
+    return Response({
+        'success': True,
+        'metrics': metrics.snapshot()
+    }, status=status.HTTP_200_OK)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def disk_cache_stats(request):
+    """
+    Get the disk usage of FILES_DIR against its quota (Admin only)
+    """
+    user = request.user
+    
+    if not hasattr(user, 'role') or user.role != 'Admin':
+        return Response({
+            'success': False,
+            'message': 'Access denied'
+        }, status=status.HTTP_403_FORBIDDEN)
+    
+    return Response({
+        'success': True,
+        'cache': cache_stats()
+    }, status=status.HTTP_200_OK)
@@ -88,6 +88,30 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Password hashing: PASSWORD_HASHER=pbkdf2 (default) or argon2, which needs
+# the argon2-cffi package. Existing hashes of either kind keep verifying and
+# are rehashed with the current settings on the next successful login
+PASSWORD_HASHER = config('PASSWORD_HASHER', default='pbkdf2')
+PASSWORD_PBKDF2_ITERATIONS = config('PASSWORD_PBKDF2_ITERATIONS', default=600000, cast=int)  # Django 4.2's default
+PASSWORD_HASHERS = [
+    'authentication.hashers.ConfigurablePBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+if PASSWORD_HASHER == 'argon2':
+    PASSWORD_HASHERS.insert(0, PASSWORD_HASHERS.pop(1))
+
+# Login rate limits (token buckets, per process): a burst of N attempts,
+# refilled at N per minute, per client IP and per username
+LOGIN_RATE_LIMIT_ENABLED = config('LOGIN_RATE_LIMIT_ENABLED', default=True, cast=bool)
+LOGIN_RATE_LIMIT_PER_IP = config('LOGIN_RATE_LIMIT_PER_IP', default=20, cast=int)
+LOGIN_RATE_LIMIT_PER_USER = config('LOGIN_RATE_LIMIT_PER_USER', default=5, cast=int)
+
+# last_login and UserProfile.last_login_ip are written in bulk this often
+LOGIN_TRACKING_FLUSH_SECONDS = config('LOGIN_TRACKING_FLUSH_SECONDS', default=5, cast=float)
+
 # Internationalization
 LANGUAGE_CODE = 'en-us'
 TIME_ZONE = 'UTC'
@@ -102,6 +126,17 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Cache backend: locmem by default. The catalog version that invalidates
+# cached listings is kept in the database (files.CatalogVersion), so a
+# process-local cache is never stale; a shared backend (FileBasedCache, or
+# RedisCache with a local Redis) only lets workers share the cached bodies
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='fileviewer'),
+    }
+}
+
 # Use custom user model
 AUTH_USER_MODEL = 'authentication.User'
 
@@ -111,7 +146,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # ✅ Updated REST Framework configuration
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',  # ✅ Change to TokenAuthentication
+        'authentication.authentication.CachedTokenAuthentication',  # TokenAuthentication plus a token->user cache
         'rest_framework.authentication.SessionAuthentication',  # Keep for admin interface
     ],
     'DEFAULT_PERMISSION_CLASSES': [
@@ -122,6 +157,11 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Token -> user cache used by CachedTokenAuthentication. Changes made in
+# another process are seen once the entry expires
+AUTH_TOKEN_CACHE_TTL = config('AUTH_TOKEN_CACHE_TTL', default=30, cast=int)  # seconds
+AUTH_TOKEN_CACHE_SIZE = config('AUTH_TOKEN_CACHE_SIZE', default=10000, cast=int)
+
 # ✅ Updated CORS settings for Next.js frontend
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
@@ -165,10 +205,173 @@ CSRF_COOKIE_SAMESITE = 'Lax'
 GOOGLE_DRIVE_FOLDER_ID = config('GOOGLE_DRIVE_FOLDER_ID', default='your-public-folder-id')
 GOOGLE_DRIVE_API_KEY = config('GOOGLE_DRIVE_API_KEY', default='your-api-key')
 
+# 'google' for the real API, 'fake' for the offline SQLite-backed stand-in
+GOOGLE_DRIVE_BACKEND = config('GOOGLE_DRIVE_BACKEND', default='google')
+FAKE_DRIVE_PATH = config('FAKE_DRIVE_PATH', default=str(BASE_DIR / 'media' / 'fake_drive.sqlite3'))
+
+# Roles granted to files that sync_drive discovers on Drive
+DRIVE_SYNC_DEFAULT_ROLES = ['Admin']
+
+# Bytes requested per Drive media chunk; memory use per download stays at one chunk
+DRIVE_DOWNLOAD_CHUNK_SIZE = config('DRIVE_DOWNLOAD_CHUNK_SIZE', default=1024 * 1024, cast=int)
+
+# Concurrent requests for the same Drive file wait this long for the first
+# download before getting a 202 "in progress" response
+DRIVE_DOWNLOAD_WAIT_TIMEOUT = config('DRIVE_DOWNLOAD_WAIT_TIMEOUT', default=30, cast=float)
+
+# Background download jobs. With DOWNLOAD_JOBS_IN_PROCESS the web process runs
+# jobs on its own thread pool; otherwise run `manage.py run_download_workers`
+DOWNLOAD_JOBS_IN_PROCESS = config('DOWNLOAD_JOBS_IN_PROCESS', default=True, cast=bool)
+DOWNLOAD_JOB_WORKERS = config('DOWNLOAD_JOB_WORKERS', default=4, cast=int)
+DOWNLOAD_JOB_MAX_ATTEMPTS = config('DOWNLOAD_JOB_MAX_ATTEMPTS', default=3, cast=int)
+DOWNLOAD_JOB_RETRY_BACKOFF = 2  # seconds, doubled on every retry
+DOWNLOAD_JOB_RETRY_MAX_DELAY = 300
+DOWNLOAD_JOB_STALE_AFTER = 600  # requeue running jobs with no progress for this long
+
+# Audit log: FileAccess rows are queued and written in batches by a background
+# thread; every event is also appended to a per-process spool file first so a
+# crash does not lose it
+AUDIT_LOG_ASYNC = config('AUDIT_LOG_ASYNC', default=True, cast=bool)
+AUDIT_QUEUE_SIZE = config('AUDIT_QUEUE_SIZE', default=10000, cast=int)
+AUDIT_BATCH_SIZE = config('AUDIT_BATCH_SIZE', default=500, cast=int)
+AUDIT_FLUSH_INTERVAL_MS = config('AUDIT_FLUSH_INTERVAL_MS', default=200, cast=int)
+AUDIT_SPOOL_DIR = BASE_DIR / 'media' / 'audit_spool'
+AUDIT_SPOOL_FSYNC = config('AUDIT_SPOOL_FSYNC', default=False, cast=bool)
+
+# Raw FileAccess events older than this are rolled up into daily counts and
+# removed by `manage.py prune_file_access`
+FILE_ACCESS_RETENTION_DAYS = config('FILE_ACCESS_RETENTION_DAYS', default=90, cast=int)
+
+# Activity log pagination
+ACTIVITY_LOG_DEFAULT_LIMIT = 50
+ACTIVITY_LOG_MAX_LIMIT = 500
+ACTIVITY_LOG_EXPORT_CHUNK_SIZE = 2000  # rows fetched per query while exporting
+
 # File storage settings
 FILES_DIR = BASE_DIR / 'media' / 'files'
 FILES_DIR.mkdir(parents=True, exist_ok=True)
 
+# Lock files that serialize Drive downloads across worker processes
+DRIVE_DOWNLOAD_LOCK_DIR = FILES_DIR / '.locks'
+
+# Chunk size used when streaming file content to clients
+FILE_STREAM_CHUNK_SIZE = config('FILE_STREAM_CHUNK_SIZE', default=64 * 1024, cast=int)
+
+# In-memory LRU of small, frequently read files, bounded by total bytes.
+# Larger files always stream from disk; compressed variants (gzip, and br
+# when the brotli package is installed) are stored alongside each entry
+FILE_CONTENT_CACHE_BYTES = config('FILE_CONTENT_CACHE_BYTES', default=64 * 1024 * 1024, cast=int)
+FILE_CONTENT_CACHE_MAX_FILE_SIZE = config('FILE_CONTENT_CACHE_MAX_FILE_SIZE', default=1024 * 1024, cast=int)
+FILE_CONTENT_CACHE_COMPRESS = config('FILE_CONTENT_CACHE_COMPRESS', default=True, cast=bool)
+FILE_CONTENT_CACHE_MIN_COMPRESS_SIZE = 1024
+
+# FILES_DIR is a bounded cache of the Drive folder. Past DISK_CACHE_MAX_BYTES
+# (0 disables eviction) Drive-backed files are evicted, least recently ('lru')
+# or least often ('lfu') used first according to FileAccess history, until
+# usage drops below MAX_BYTES * LOW_WATERMARK. Files used in the last
+# DISK_CACHE_MIN_AGE seconds are kept; downloads trigger a check at most
+# every DISK_CACHE_GC_INTERVAL seconds, `manage.py cache_gc` runs a full pass
+DISK_CACHE_MAX_BYTES = config('DISK_CACHE_MAX_BYTES', default=10 * 1024 ** 3, cast=int)
+DISK_CACHE_POLICY = config('DISK_CACHE_POLICY', default='lru')
+DISK_CACHE_LOW_WATERMARK = config('DISK_CACHE_LOW_WATERMARK', default=0.9, cast=float)
+DISK_CACHE_MIN_AGE = config('DISK_CACHE_MIN_AGE', default=300, cast=int)  # seconds
+DISK_CACHE_HISTORY_DAYS = 30
+DISK_CACHE_GC_INTERVAL = config('DISK_CACHE_GC_INTERVAL', default=60, cast=int)  # seconds
+
+# Prefetching: every PREFETCH_INTERVAL seconds (0 disables it in the download
+# workers) each role's PREFETCH_TOP_K most accessed non-local files over the
+# last PREFETCH_HISTORY_DAYS are queued for download, within PREFETCH_MAX_BYTES
+# per run and the disk cache headroom
+PREFETCH_INTERVAL = config('PREFETCH_INTERVAL', default=900, cast=int)
+PREFETCH_TOP_K = config('PREFETCH_TOP_K', default=20, cast=int)
+PREFETCH_MAX_BYTES = config('PREFETCH_MAX_BYTES', default=512 * 1024 * 1024, cast=int)
+PREFETCH_HISTORY_DAYS = 7
+
+# Full-text search over FILES_DIR: SQLite FTS5 shards in SEARCH_INDEX_DIR.
+# Changing SEARCH_INDEX_SHARDS requires `manage.py reindex --full`
+SEARCH_INDEX_DIR = BASE_DIR / 'media' / 'search'
+SEARCH_INDEX_SHARDS = config('SEARCH_INDEX_SHARDS', default=8, cast=int)
+SEARCH_CHUNK_BYTES = 8 * 1024
+SEARCH_QUERY_THREADS = config('SEARCH_QUERY_THREADS', default=min(os.cpu_count() or 1, 8), cast=int)
+SEARCH_INDEX_ON_DOWNLOAD = config('SEARCH_INDEX_ON_DOWNLOAD', default=True, cast=bool)
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 100
+
+# Regex search inside a single local file, streamed as NDJSON. A scan stops
+# after GREP_MAX_MATCHES matching lines or GREP_TIME_BUDGET seconds; the file
+# is mmapped and scanned GREP_WINDOW_SIZE bytes at a time. With
+# GREP_USE_WORKER each scan runs in a worker process that is killed when it
+# overruns the budget (a backtracking pattern can stall inside one search)
+GREP_MAX_MATCHES = config('GREP_MAX_MATCHES', default=1000, cast=int)
+GREP_TIME_BUDGET = config('GREP_TIME_BUDGET', default=30, cast=float)  # seconds
+GREP_WINDOW_SIZE = 1024 * 1024
+GREP_MAX_CONTEXT = 10
+GREP_MAX_LINE_BYTES = 4096
+GREP_MAX_PATTERN_LENGTH = 1000
+GREP_USE_WORKER = config('GREP_USE_WORKER', default=True, cast=bool)
+
+# Tail and follow. Follow streams (SSE or long-poll) hold a worker thread each,
+# so at most TAIL_MAX_FOLLOWERS run per worker process; an SSE stream ends
+# after TAIL_FOLLOW_MAX_SECONDS and the browser reconnects with Last-Event-ID.
+# Changes are picked up through inotify on Linux, otherwise by polling stat
+TAIL_DEFAULT_LINES = 100
+TAIL_MAX_LINES = 5000
+TAIL_BLOCK_SIZE = 64 * 1024
+TAIL_MAX_EVENT_BYTES = 1024 * 1024
+TAIL_MAX_FOLLOWERS = config('TAIL_MAX_FOLLOWERS', default=32, cast=int)
+TAIL_FOLLOW_MAX_SECONDS = config('TAIL_FOLLOW_MAX_SECONDS', default=600, cast=int)
+TAIL_LONG_POLL_MAX_WAIT = 30  # seconds
+TAIL_HEARTBEAT = 15  # seconds
+TAIL_RETRY_MS = 2000
+TAIL_POLL_INTERVAL = config('TAIL_POLL_INTERVAL', default=1.0, cast=float)  # seconds
+TAIL_USE_INOTIFY = config('TAIL_USE_INOTIFY', default=True, cast=bool)
+
+# Content-addressed storage for Drive downloads: each distinct content is kept
+# once under BLOB_STORE_DIR/<sha256[:2]>/<sha256[2:4]>/<sha256> and FILES_DIR
+# names are hard links to it, so BLOB_STORE_DIR must be on the same filesystem.
+# Downloads whose Drive md5Checksum and size match a held blob are skipped.
+# Unreferenced blobs older than BLOB_GC_GRACE seconds go in `manage.py blob_gc`
+BLOB_STORE_ENABLED = config('BLOB_STORE_ENABLED', default=True, cast=bool)
+BLOB_STORE_DIR = FILES_DIR / '.blobs'
+BLOB_GC_GRACE = config('BLOB_GC_GRACE', default=3600, cast=int)  # seconds
+
+# Compressed-at-rest storage: Drive downloads are written as seekable gzip
+# (independent members of COMPRESS_AT_REST_FRAME_SIZE original bytes), so
+# range and line reads inflate only the frames they touch and gzip clients
+# get the stored bytes as is. Existing files are converted (or restored)
+# by `manage.py compress_store`
+COMPRESS_AT_REST = config('COMPRESS_AT_REST', default=False, cast=bool)
+COMPRESS_AT_REST_FRAME_SIZE = config('COMPRESS_AT_REST_FRAME_SIZE', default=256 * 1024, cast=int)  # bytes
+COMPRESS_AT_REST_LEVEL = config('COMPRESS_AT_REST_LEVEL', default=6, cast=int)
+COMPRESS_STORE_MIN_AGE = config('COMPRESS_STORE_MIN_AGE', default=300, cast=int)  # seconds
+
+# Sidecar indexes (line offsets etc.) for files in FILES_DIR
+FILE_INDEX_DIR = BASE_DIR / 'media' / 'index'
+FILE_INDEX_DIR.mkdir(parents=True, exist_ok=True)
+
+# Line viewer: record a byte offset every N lines, and cap page sizes
+FILE_LINE_INDEX_STRIDE = config('FILE_LINE_INDEX_STRIDE', default=1000, cast=int)
+FILE_LINES_DEFAULT_PAGE = 100
+FILE_LINES_MAX_PAGE = 1000
+
+# File listing pagination; `?count=estimate` counts are cached this long
+FILE_LIST_DEFAULT_LIMIT = 100
+FILE_LIST_MAX_LIMIT = 1000
+FILE_LIST_COUNT_CACHE_SECONDS = 60
+
+# Each process re-reads the catalog version at most this often, so changes
+# made by other processes are picked up within this interval
+CATALOG_VERSION_CACHE_SECONDS = config('CATALOG_VERSION_CACHE_SECONDS', default=1, cast=float)
+
+# Rendered listings are cached per role and catalog version; the version bump
+# on FileMetadata changes is what invalidates them, the timeout only bounds
+# memory use
+FILE_LIST_CACHE_SECONDS = 3600
+
+# In-memory permission snapshots are rebuilt when the catalog version
+# changes, and at least this often, for writes that bypass the version bump
+PERMISSION_SNAPSHOT_MAX_AGE = config('PERMISSION_SNAPSHOT_MAX_AGE', default=60, cast=int)  # seconds
+
 # ✅ Logging configuration for debugging
 LOGGING = {
     'version': 1,